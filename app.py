@@ -3,11 +3,11 @@
 # =================================================================
 
 # 1.1. Librerías Estándar de Python
-import io
 import os
 import re
 import unicodedata
-import calendar
+import json
+import threading
 from io import BytesIO
 from collections import defaultdict
 from datetime import datetime, date, timedelta, timezone
@@ -16,17 +16,32 @@ from urllib.parse import quote,urlencode, urlparse, parse_qs
 # 1.2. Librerías de Terceros (Flask, Mongo, Utilidades) 
 from flask import (
     Flask, render_template, request, redirect, 
-    url_for, jsonify, abort, send_file, flash
+    url_for, jsonify, abort, flash, Response, stream_with_context
 )
 from flask_pymongo import PyMongo
 from bson import ObjectId
+from pymongo import UpdateOne, ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
 from dateutil.relativedelta import relativedelta
+import click
+
+from indices import INDICES, sincronizar_indices, formatear_reporte
+from cursos import curso_key
+from topes import ContadoresAnuales
+from causas import BUCKETS, clasificar_causa, campos_causa
+from calendario import CalendarioEscolar, mascara_de_weekdays, TODA_LA_SEMANA
+from estadisticas_ausencias import resumen_anual as resumen_anual_ausencias
+from matricula import SnapshotsMatricula, CAMPOS as CAMPOS_MATRICULA, PROYECCION as PROYECCION_MATRICULA
+import promocion
+from promocion import PlanesPromocion, PlanDesactualizado
+from demografia import ResumenAlumnos
+from proyecciones import proyeccion, documentos
+from metadatos import Metadatos
+import exportar
+from asistencia_mes import DIAS_VACIOS, normalizar_dias, decodificar, con_cambios, campos_mes, resumen_de_dias
 
 # 1.3. Manejo de Importaciones Opcionales o Condicionales
-try:
-    from openpyxl import Workbook
-except Exception:
-    Workbook = None
+# (openpyxl es opcional: lo importa exportar.py)
 
 # Blueprint de Salidas
 try:
@@ -84,8 +99,156 @@ COL_CURSOS          = mongo.db.cursos  # Agregado para evitar error de definici
 COL_CONFIG          = mongo.db.config   # Colección para configuraciones generales (ej. _id: "config_general")COL_CERTIFICADOS    = mongo.db["certificados_pendientes"]
 COL_CERTIFICADOS    = mongo.db.certificados_pendientes
 COL_CALENDARIO_ESCOLAR = mongo.db.calendario_escolar
+CALENDARIO = CalendarioEscolar(COL_CALENDARIO_ESCOLAR)  # días hábiles por año, cacheados
 COL_MERCADERIA      = mongo.db.entrega_mercaderia
 COL_INASISTENCIAS_AUX = mongo.db.inasistencias_auxiliares
+COL_CONTADORES_INAS = mongo.db.contadores_inasistencias  # 1 doc por (tipo, persona_id, anio), ver topes.py
+MATRICULA = SnapshotsMatricula(mongo.db.matricula_mensual, COL_ALUMNOS)  # parte diario por (anio, mes), ver matricula.py
+DEMOGRAFIA = ResumenAlumnos(COL_ALUMNOS, lambda: filtro_activos())  # edades/sexo/nacionalidades, ver demografia.py
+METADATOS = Metadatos(mongo.db)  # cursos / años para los selectores, ver metadatos.py
+PLANES_PROMOCION = PlanesPromocion(mongo.db.planes_promocion)  # pase de año de la matrícula inicial, ver promocion.py
+ANIO_MATRICULA = int(os.getenv("ANIO_MATRICULA", "2026"))  # año lectivo que arma la matrícula inicial (PROM/REC)
+
+def cursos_alumnos(filtro=None):
+    """Cursos distintos de alumnos que cumplen 'filtro' (cacheado; sin ordenar)."""
+    return METADATOS.distinct("alumnos", "curso", filtro)
+
+def anios_lectivos_alumnos():
+    """Años lectivos cargados en alumnos (cacheado; fallback: 2025-2027)."""
+    anios = {int(y) for y in METADATOS.distinct("alumnos", "anio_lectivo") if str(y).isdigit()}
+    return sorted(anios) or [2025, 2026, 2027]
+
+def _alumno_cambio(antes, despues):
+    """
+    Tras un alta/edición/baja de alumno: ajusta los snapshots de matrícula y
+    descarta los conteos demográficos y selectores cacheados (no frena la operación).
+    """
+    DEMOGRAFIA.invalidar()
+    METADATOS.invalidar("alumnos")
+    try:
+        MATRICULA.aplicar_cambio(antes, despues)
+    except Exception as e:
+        print("[MATRICULA] No se pudo ajustar el snapshot:", e)
+
+    # notas de alumnos dados de baja / reincorporados (resumen de calificaciones)
+    if antes and despues and bool(antes.get("fecha_salida")) != bool(despues.get("fecha_salida")):
+        try:
+            COL_CALIFICACIONES.update_many(
+                {"alumno_id": str(antes["_id"])},
+                {"$set": {"alumno_baja": bool(despues.get("fecha_salida"))}},
+            )
+        except Exception as e:
+            print("[CALIFICACIONES] No se pudo marcar alumno_baja:", e)
+
+# ----------------- Índices -----------------
+# Se crean al iniciar (en segundo plano, para no demorar el arranque si Atlas tarda)
+# salvo que CREAR_INDICES=0. También: `flask indices` / `flask indices --dry-run`.
+
+def _sincronizar_indices_inicio():
+    try:
+        reporte = sincronizar_indices(mongo.db)
+        creados = sum(len(r.get("creados", [])) for r in reporte.values())
+        errores = [e for r in reporte.values() for e in r.get("errores", [])]
+        if creados:
+            print(f"[INDICES] Creados {creados} índices.")
+        for e in errores:
+            print(f"[INDICES] ERROR {e['indice']}: {e['error']}")
+    except Exception as e:
+        print("[INDICES] No se pudieron sincronizar los índices:", e)
+
+if os.environ.get("CREAR_INDICES", "1") != "0":
+    threading.Thread(target=_sincronizar_indices_inicio, daemon=True).start()
+
+
+@app.cli.command("indices")
+@click.option("--dry-run", is_flag=True, help="Sólo informa diferencias, no crea nada.")
+def cli_indices(dry_run):
+    """Crea los índices declarados en indices.py e informa diferencias con el cluster."""
+    reporte = sincronizar_indices(mongo.db, dry_run=dry_run)
+    click.echo(formatear_reporte(reporte, dry_run=dry_run))
+
+
+@app.cli.command("unificar-calificaciones")
+@click.option("--dry-run", is_flag=True, help="Sólo cuenta duplicadas, no borra nada.")
+def cli_unificar_calificaciones(dry_run):
+    """Deja 1 calificación por clave (la más reciente) y crea clave_calificacion como único."""
+    pipeline = [
+        {"$sort": {"updated_at": -1, "_id": -1}},
+        {"$group": {
+            "_id": {"alumno_id": "$alumno_id", "docente_id": "$docente_id", "asignatura": "$asignatura",
+                    "trimestre": "$trimestre", "anio": "$anio"},
+            "ids": {"$push": "$_id"},
+        }},
+        {"$match": {"ids.1": {"$exists": True}}},
+    ]
+    sobran = [oid for g in mongo.db.calificaciones.aggregate(pipeline, allowDiskUse=True) for oid in g["ids"][1:]]
+    click.echo(f"Calificaciones duplicadas: {len(sobran)}")
+    if dry_run:
+        return
+
+    if sobran:
+        mongo.db.calificaciones.delete_many({"_id": {"$in": sobran}})
+    # el índice viejo (no único) tiene el mismo nombre: se reemplaza
+    viejo = mongo.db.calificaciones.index_information().get("clave_calificacion")
+    if viejo and not viejo.get("unique"):
+        mongo.db.calificaciones.drop_index("clave_calificacion")
+    reporte = sincronizar_indices(mongo.db, registro=[ix for ix in INDICES if ix["coleccion"] == "calificaciones"])
+    click.echo(formatear_reporte(reporte))
+
+
+@app.cli.command("migrar-curso-calificaciones")
+def cli_migrar_curso_calificaciones():
+    """Completa curso_key en las calificaciones (desde el curso guardado o, si falta, el del alumno)."""
+    cursos_alumno = {
+        str(a["_id"]): (a.get("curso") or "").strip()
+        for a in mongo.db.alumnos.find({}, {"curso": 1})
+    }
+    ops = []
+    n = 0
+    for c in mongo.db.calificaciones.find({}, {"curso": 1, "curso_key": 1, "alumno_id": 1}):
+        curso = (c.get("curso") or "").strip() or cursos_alumno.get(str(c.get("alumno_id")), "")
+        k = curso_key(curso) if curso else ""
+        if c.get("curso_key") != k or (curso and not c.get("curso")):
+            ops.append(UpdateOne({"_id": c["_id"]}, {"$set": {"curso": curso, "curso_key": k}}))
+        if len(ops) >= 1000:
+            n += mongo.db.calificaciones.bulk_write(ops, ordered=False).modified_count
+            ops = []
+    if ops:
+        n += mongo.db.calificaciones.bulk_write(ops, ordered=False).modified_count
+    click.echo(f"Calificaciones actualizadas: {n}")
+
+
+@app.cli.command("marcar-desaprobados")
+def cli_marcar_desaprobados():
+    """Completa 'desaprobado' y 'alumno_baja' en las calificaciones ya cargadas (resumen de calificaciones)."""
+    ops = []
+    for c in mongo.db.calificaciones.find({}, {"escala": 1, "valor": 1, "desaprobado": 1}):
+        d = es_desaprobado(c.get("escala"), c.get("valor"))
+        if c.get("desaprobado") != d:
+            ops.append(UpdateOne({"_id": c["_id"]}, {"$set": {"desaprobado": d}}))
+        if len(ops) >= 1000:
+            mongo.db.calificaciones.bulk_write(ops, ordered=False)
+            ops = []
+    if ops:
+        mongo.db.calificaciones.bulk_write(ops, ordered=False)
+
+    activos = [str(a["_id"]) for a in mongo.db.alumnos.find(filtro_activos(), {"_id": 1})]
+    n_baja = mongo.db.calificaciones.update_many({"alumno_id": {"$nin": activos}}, {"$set": {"alumno_baja": True}}).modified_count
+    mongo.db.calificaciones.update_many({"alumno_id": {"$in": activos}}, {"$set": {"alumno_baja": False}})
+    click.echo(f"Calificaciones de alumnos no activos: {n_baja}")
+
+
+@app.cli.command("migrar-curso-key")
+def cli_migrar_curso_key():
+    """Completa/corrige el campo curso_key en todos los alumnos."""
+    ops = []
+    for a in mongo.db.alumnos.find({}, {"curso": 1, "curso_key": 1}):
+        k = curso_key(a.get("curso"))
+        if a.get("curso_key") != k:
+            ops.append(UpdateOne({"_id": a["_id"]}, {"$set": {"curso_key": k}}))
+    if ops:
+        mongo.db.alumnos.bulk_write(ops, ordered=False)
+    click.echo(f"Alumnos actualizados: {len(ops)}")
 
 
 # ----------------- Authentication Placeholder ----------------- 
@@ -200,6 +363,7 @@ def _insert_movimiento_si_no_duplicado(doc, segundos=5):
             return False
 
         COL_MOVIMIENTOS.insert_one(doc)
+        METADATOS.invalidar("movimientos_alumnos")
         return True
 
     except Exception as e:
@@ -207,10 +371,29 @@ def _insert_movimiento_si_no_duplicado(doc, segundos=5):
         # ante duda, insertamos igual para no “perder” el movimiento
         try:
             COL_MOVIMIENTOS.insert_one(doc)
+            METADATOS.invalidar("movimientos_alumnos")
         except Exception:
             pass
         return True
   
+class SinTransacciones(Exception):
+    """El servidor no soporta transacciones (Mongo local standalone, sin replica set)."""
+
+def _en_transaccion(fn):
+    """
+    Ejecuta fn(session) en una transacción (Atlas / replica set).
+    Con un Mongo standalone la primera escritura falla y no se escribe nada:
+    se levanta SinTransacciones para que quien llama no siga sin atomicidad.
+    """
+    client = getattr(mongo, "cx", None) or getattr(mongo, "mongo_client", None) or getattr(mongo, "client", None)
+    try:
+        with client.start_session() as session:
+            return session.with_transaction(fn)
+    except OperationFailure as e:
+        if e.code != 20:  # IllegalOperation: "Transaction numbers are only allowed on a replica set..."
+            raise
+        raise SinTransacciones(str(e))
+
 # ----------------- Helpers genéricos -----------------
 
 def to_json(doc):
@@ -384,34 +567,6 @@ def _maybe_oid(x):
     except Exception:
         return str(x)
 
-def _is_preexamen(causa_norm: str) -> bool:
-    c = causa_norm
-    return ("pre" in c) and ("examen" in c)
-
-def _es_citacion_otro_est(c_norm: str) -> bool:
-    """
-    Más robusto:
-    - acepta citacion/citación/convocatoria/comision/omision/servicio
-    - y acepta 'otro establecimiento' o abreviados
-    """
-    c = c_norm
-    es_llamado = any(k in c for k in ("citacion", "convocatoria", "comision", "omision", "servicio"))
-    es_otro_est = any(k in c for k in ("otro establecimiento", "otros establecimientos", "otro est", "establec"))
-    return es_llamado and es_otro_est
-
-def _es_art(c_norm: str) -> bool:
-    """
-    IMPORTANTÍSIMO:
-    'particular' contiene 'art', por eso NO usamos 'art in c'.
-    Detectamos ART como palabra o formas típicas: 'licencia art', 'por art', 'art.'
-    """
-    c = c_norm
-    if re.search(r"\bart\b", c):   # palabra ART
-        return True
-    if "licencia art" in c or "por art" in c or "art." in c:
-        return True
-    return False
-
 def normalizar_curso(curso: str) -> str:
     """
     Normaliza curso a formato consistente: '1°A', '2°B', etc.
@@ -443,91 +598,308 @@ def normalizar_curso(curso: str) -> str:
 
     return str(curso).strip()
 
-def obtener_alerta_ausentismo(alumno_id, mes, anio):
-    asistencia = COL_ASISTENCIAS.find_one({
-        "alumno_id": ObjectId(alumno_id),
-        "month": int(mes),
-        "year": int(anio)
-    })
-
-    if not asistencia:
-        return None, 0, ""
-
-    dias = asistencia.get("dias", {})
-    valores = list(dias.values())
-
-    total_inasistencias = valores.count('A')
-
-    max_seguidas = 0
-    contador = 0
-    for v in valores:
-        if v == 'A':
-            contador += 1
-            max_seguidas = max(max_seguidas, contador)
-        else:
-            contador = 0
+def _alerta_desde_resumen(resumen):
+    """Reglas EOE sobre el resumen mensual: 3+ seguidas o 5+ alternadas."""
+    if not resumen:
+        return None
+    if resumen.get("racha_max", 0) >= 3:
+        return "3 o más seguidas"
+    if resumen.get("ausentes", 0) >= 5:
+        return "5 o más alternadas"
+    return None
 
-    if max_seguidas >= 3:
-        alerta = "3 o más seguidas"
-    elif total_inasistencias >= 5:
-        alerta = "5 o más alternadas"
-    else:
-        alerta = None  
+def alertas_ausentismo_lote(alumno_ids, anio, meses):
+    """
+    Alertas EOE de muchos alumnos y meses con 1 consulta a los documentos
+    mensuales de asistencia (contadores + acción), en lugar de una por alumno.
 
-    accion = asistencia.get("accion_realizada", "")
-    return alerta, total_inasistencias, accion
+    alumno_ids: ObjectId o str; meses: lista de meses (1..12) del año 'anio'.
+    Devuelve {alumno_id_str: {mes: {"alerta", "ausentes", "accion"}}}; los meses
+    sin datos no aparecen.
+    """
+    oids = [a if isinstance(a, ObjectId) else ObjectId(a) for a in alumno_ids]
+    meses = sorted({int(m) for m in meses})
+    out = {}
+    if not oids or not meses:
+        return out
+
+    filtro = {"alumno_id": {"$in": oids}, "year": int(anio), "month": {"$in": meses}}
+    proyeccion = {"_id": 0, "alumno_id": 1, "month": 1, "ausentes": 1, "racha_max": 1,
+                  "dias": 1, "accion_realizada": 1}
+
+    for r in COL_ASISTENCIAS.find(filtro, proyeccion):
+        if "racha_max" not in r:
+            r.update(resumen_de_dias(r.get("dias")))  # documento viejo sin migrar
+        out.setdefault(str(r["alumno_id"]), {})[r["month"]] = {
+            "alerta": _alerta_desde_resumen(r),
+            "ausentes": r.get("ausentes", 0),
+            "accion": r.get("accion_realizada") or "",
+        }
 
+    return out
 
 def _causa_bucket(causa_norm: str) -> str:
-    c2 = causa_norm
-
-    # ✅ específicos primero (evita falsos positivos)
-    # ART: palabra completa (art) para no confundir con "pARTiculares"
-    if re.search(r"\bart\b", c2):
-        return "art"
-
-    if "paro" in c2:
-        return "paro"
-    if "duelo" in c2:
-        return "duelo"
-    if _is_preexamen(c2):
-        return "preexamen"
-    if "examen" in c2:
-        return "examen"
-
-    if "enfermedad personal" in c2:
-        return "enfermedad_personal"
-    if "enfermedad familiar" in c2:
-        return "enfermedad_familiar"
+    """Bucket detallado de la causa (ver causas.py)."""
+    return clasificar_causa(causa_norm)[0]
 
-    # ✅ particulares antes que cualquier substring raro
-    if "particular" in c2:
-        return "particulares"
+def _bucket_de(ins) -> str:
+    """Bucket guardado en la inasistencia; si es un documento viejo, se clasifica la causa."""
+    return ins.get("causa_bucket") or clasificar_causa(ins.get("causa") or "")[0]
 
-    if _es_citacion_otro_est(c2):
-        return "convocatoria_otros_establecimientos"
+def _filtro_causa(causa: str) -> dict:
+    """
+    Filtro por causa del historial: se traduce el texto elegido a su bucket (causas.py)
+    y se filtra por el campo indexado. Los documentos todavía sin bucket guardado
+    (antes de `flask clasificar-causas`) se siguen buscando por texto.
+    """
+    return {"$or": [
+        {"causa_bucket": clasificar_causa(causa)[0]},
+        {"causa_bucket": {"$exists": False}, "causa": {"$regex": re.escape(causa), "$options": "i"}},
+    ]}
 
-    if "injustificada" in c2:
-        return "injustificadas"
+def _resumen_historial_agg(col, q, campo_persona, col_personas, group_by):
+    """
+    Resumen del historial en UNA agregación ($match + $facet/$group):
+      - siempre: total y por_causa (bucket -> cantidad)
+      - group_by 'mes':     por_mes     {'YYYY-MM': {"total", "por_causa"}}
+      - group_by 'persona': por_persona [{"id", "nombre", "total", "por_causa"}] (desc por total)
+    Los documentos sin causa_bucket guardado se agrupan por texto y se clasifican acá
+    (hay pocas causas distintas).
+    """
+    # bucket guardado o, si falta, el texto de la causa para clasificarlo después
+    clave_causa = {
+        "b": "$causa_bucket",
+        "c": {"$cond": [{"$ifNull": ["$causa_bucket", False]}, None, "$causa"]},
+    }
+    facetas = {"por_causa": [{"$group": {"_id": clave_causa, "n": {"$sum": 1}}}]}
+    if "mes" in group_by:
+        mes = {"$substrCP": [{"$toString": "$fecha"}, 0, 7]}
+        facetas["por_mes"] = [{"$group": {"_id": {**clave_causa, "m": mes}, "n": {"$sum": 1}}}]
+    if "persona" in group_by:
+        facetas["por_persona"] = [{"$group": {"_id": {**clave_causa, "p": f"${campo_persona}"}, "n": {"$sum": 1}}}]
+
+    pipeline = [
+        {"$match": q},
+        {"$project": {"_id": 0, "causa_bucket": 1, "causa": 1, "fecha": 1, campo_persona: 1}},
+        {"$facet": facetas},
+    ]
+    res = next(col.aggregate(pipeline), None) or {}
+
+    def _bucket(g):
+        return g["_id"].get("b") or clasificar_causa(g["_id"].get("c") or "")[0]
+
+    def _vacio():
+        return {"total": 0, "por_causa": {b: 0 for b in BUCKETS}}
+
+    out = {"total": 0, "por_causa": {b: 0 for b in BUCKETS}}
+    for g in res.get("por_causa", []):
+        out["por_causa"][_bucket(g)] += g["n"]
+        out["total"] += g["n"]
+
+    if "mes" in group_by:
+        por_mes = {}
+        for g in res.get("por_mes", []):
+            info = por_mes.setdefault(g["_id"].get("m") or "", _vacio())
+            info["por_causa"][_bucket(g)] += g["n"]
+            info["total"] += g["n"]
+        out["por_mes"] = dict(sorted(por_mes.items()))
+
+    if "persona" in group_by:
+        por_persona = {}
+        for g in res.get("por_persona", []):
+            info = por_persona.setdefault(str(g["_id"].get("p") or ""), _vacio())
+            info["por_causa"][_bucket(g)] += g["n"]
+            info["total"] += g["n"]
+
+        nombres = {}
+        oids = [_maybe_oid(pid) for pid in por_persona if pid]
+        for p in col_personas.find({"_id": {"$in": oids}}, {"apellido": 1, "nombre": 1}):
+            nombres[str(p["_id"])] = f"{p.get('apellido', '')}, {p.get('nombre', '')}".strip(", ")
+
+        out["por_persona"] = sorted(
+            ({"id": pid, "nombre": nombres.get(pid, ""), **info} for pid, info in por_persona.items()),
+            key=lambda x: x["total"], reverse=True,
+        )
 
-    if "licencia extraordinaria" in c2:
-        return "licencia_extraordinaria"
+    return out
 
-    return "otras"
+def _group_by_param():
+    """?group_by=mes,persona -> {"mes", "persona"} (valores desconocidos se ignoran)."""
+    valores = (request.args.get("group_by") or "").lower().replace(" ", "").split(",")
+    return {v for v in valores if v in ("mes", "persona")}
 
 def _color_for_causa(causa: str) -> str:
-    c = _normalizar_texto(causa)
-    if _es_citacion_otro_est(c):
+    if clasificar_causa(causa or "")[0] == "citacion_otro_establecimiento":
         return "#28a745"  # verde
     return "#dc3545"      # rojo
 
 LIMITES_ANUALES = {
-    "preexamen": 12,
+    "pre_examen": 12,
     "enfermedad_personal": 25,
     "enfermedad_familiar": 20,
     "particulares": 6,
 }
 
+# Contadores anuales para topes (se ajustan con $inc en altas/ediciones/bajas)
+CONTADORES_DOCENTES = ContadoresAnuales(
+    COL_CONTADORES_INAS, COL_INASISTENCIAS, "docente_id", "docente",
+    clasificar=lambda causa: clasificar_causa(causa)[0], parse_fecha=_parse_date,
+)
+CONTADORES_AUX = ContadoresAnuales(
+    COL_CONTADORES_INAS, COL_INASISTENCIAS_AUX, "auxiliar_id", "auxiliar",
+    clasificar=lambda causa: clasificar_causa(causa)[0], parse_fecha=_parse_date,
+)
+
+def _reservar_topes(contadores, persona_id, dias_iso, bucket):
+    """
+    Reserva en los contadores los días a insertar (agrupados por año).
+    Particulares: tope anual + 1 por mes, condicional. Resto: sólo suma.
+    Devuelve (error_msg | None, usados_antes_del_primer_año, reservas) — 'reservas' sirve para liberar.
+    """
+    por_anio = defaultdict(list)
+    for f in dias_iso:
+        d = date.fromisoformat(f)
+        por_anio[d.year].append(d)
+
+    reservas = []
+    antes = None
+    for anio in sorted(por_anio):
+        primero, n = por_anio[anio][0], len(por_anio[anio])
+        estricto = bucket == "particulares"
+        r = contadores.reservar(
+            persona_id, primero, bucket, n=n,
+            tope=LIMITES_ANUALES["particulares"] if estricto else None,
+            uno_por_mes=estricto,
+        )
+        if not r["ok"]:
+            _liberar_topes(contadores, persona_id, bucket, reservas)
+            if r["error"] == "mes_ocupado":
+                return "Ya hay una inasistencia por 'causas particulares' en este mes.", r["antes"], []
+            return "Se alcanzó el tope anual de 'causas particulares' (6).", r["antes"], []
+        reservas.append((primero, n))
+        if antes is None:
+            antes = r["antes"]
+    return None, antes or 0, reservas
+
+def _liberar_topes(contadores, persona_id, bucket, reservas):
+    for primero, n in reservas:
+        contadores.ajustar(persona_id, primero, bucket, -n)
+
+def _insertar_inasistencias_rango(col, campo, persona_id, desde, hasta, datos, contadores, bucket, quien):
+    """
+    Inserta una inasistencia por día de [desde, hasta] para la persona.
+
+    - Lo ya cargado en el rango se lee con UNA consulta (no un find_one por día).
+    - Día ya cargado con los mismos datos => reintento idéntico (no es error).
+    - Día ya cargado con otros datos => conflicto: no se inserta nada.
+    - insert_many(ordered=False) + índice único (persona, fecha): si otra carga
+      gana la carrera, ese día se informa y el resto se inserta igual.
+
+    Devuelve (respuesta, status, usados_previos_del_bucket).
+    """
+    def _mismo(doc):
+        return (
+            (doc.get("causa") or "").strip() == datos["causa"] and
+            (doc.get("observaciones") or "").strip() == datos["observaciones"] and
+            (doc.get("suplente_info") or {}) == datos["suplente_info"]
+        )
+
+    def _leer(fechas_q):
+        return {
+            d.get("fecha"): d
+            for d in col.find(
+                {campo: {"$in": list({persona_id, str(persona_id)})}, "fecha": fechas_q},
+                {"fecha": 1, "causa": 1, "observaciones": 1, "suplente_info": 1},
+            )
+        }
+
+    existentes = _leer({"$gte": desde.isoformat(), "$lte": hasta.isoformat()})
+
+    dias = []
+    a_insertar = []
+    dcur = desde
+    while dcur <= hasta:
+        f = dcur.isoformat()
+        doc = existentes.get(f)
+        if doc is None:
+            a_insertar.append(f)
+            dias.append({"fecha": f, "resultado": "insertado"})
+        else:
+            dias.append({"fecha": f, "resultado": "reintento_identico" if _mismo(doc) else "conflicto"})
+        dcur += timedelta(days=1)
+
+    conflictos = [d["fecha"] for d in dias if d["resultado"] == "conflicto"]
+    if conflictos:
+        for d in dias:
+            if d["resultado"] == "insertado":
+                d["resultado"] = "no_insertado"
+        f0 = date.fromisoformat(conflictos[0])
+        msg = f"Ya hay una inasistencia cargada para este {quien} el {f0.strftime('%d/%m/%Y')}."
+        return {"ok": False, "error": msg, "dias": dias}, 400, 0
+
+    # ---- Reservar en contadores (condicional para particulares) ----
+    error, usados, reservas = _reservar_topes(contadores, persona_id, a_insertar, bucket)
+    if error:
+        return {"ok": False, "error": error}, 400, usados
+
+    docs = [{campo: persona_id, "fecha": f, **datos} for f in a_insertar]
+    perdidos = []
+    if docs:
+        try:
+            col.insert_many(docs, ordered=False)
+        except BulkWriteError as bwe:
+            errs = bwe.details.get("writeErrors", [])
+            if any(e.get("code") != 11000 for e in errs):
+                _liberar_topes(contadores, persona_id, bucket, reservas)
+                raise
+            perdidos = [a_insertar[e["index"]] for e in errs]
+        except Exception:
+            _liberar_topes(contadores, persona_id, bucket, reservas)
+            raise
+
+    if perdidos:
+        # Otra carga insertó esos días entre la lectura y la escritura
+        ahora = _leer({"$in": perdidos})
+        for f in perdidos:
+            contadores.ajustar(persona_id, date.fromisoformat(f), bucket, -1)
+        for d in dias:
+            if d["fecha"] in ahora:
+                d["resultado"] = "reintento_identico" if _mismo(ahora[d["fecha"]]) else "conflicto"
+
+    inserted = len(docs) - len(perdidos)
+    hubo_conflicto = any(d["resultado"] == "conflicto" for d in dias)
+    resp = {"ok": not hubo_conflicto, "inserted": inserted, "dias": dias}
+    if hubo_conflicto:
+        resp["error"] = f"Algunos días ya fueron cargados para este {quien} con otros datos."
+    return resp, (409 if hubo_conflicto else 200), usados
+
+@app.cli.command("clasificar-causas")
+def cli_clasificar_causas():
+    """Guarda causa_bucket / causa_grupo en las inasistencias (docentes y auxiliares)."""
+    for nombre, col in (("inasistencias", COL_INASISTENCIAS), ("inasistencias_auxiliares", COL_INASISTENCIAS_AUX)):
+        total = 0
+        # Las causas se repiten mucho: 1 update_many por texto distinto
+        for causa in col.distinct("causa"):
+            total += col.update_many({"causa": causa}, {"$set": campos_causa(causa)}).modified_count
+        total += col.update_many({"causa": {"$exists": False}}, {"$set": campos_causa("")}).modified_count
+        click.echo(f"{nombre}: {total} documentos actualizados")
+
+@app.cli.command("reiniciar-topes")
+@click.option("--anio", type=int, default=None, help="Sólo ese año (por defecto, todos).")
+def cli_reiniciar_topes(anio):
+    """Borra los contadores de topes; se vuelven a sembrar desde las inasistencias al usarse."""
+    q = {"anio": anio} if anio else {}
+    n = COL_CONTADORES_INAS.delete_many(q).deleted_count
+    click.echo(f"Contadores borrados: {n}")
+
+@app.cli.command("recalcular-matricula")
+@click.option("--anio", type=int, default=None, help="Sólo ese año (por defecto, todos).")
+@click.option("--mes", type=int, default=None, help="Sólo ese mes (con --anio).")
+def cli_recalcular_matricula(anio, mes):
+    """Borra los snapshots de matrícula del parte diario; se rearman al pedir cada mes."""
+    MATRICULA.invalidar(anio, mes if anio else None)
+    click.echo("Snapshots de matrícula borrados.")
+
 def _contar_por_bucket_docente_anio(docente_id_raw, referencia_fecha=None):
     """
     Cuenta consumos por bucket en el año (para topes/alertas y SET4).
@@ -537,26 +909,12 @@ def _contar_por_bucket_docente_anio(docente_id_raw, referencia_fecha=None):
 
     q = {"docente_id": docente_id, "fecha": {"$gte": y1.isoformat(), "$lte": y2.isoformat()}}
 
-    cont = {
-        "preexamen": 0,
-        "enfermedad_personal": 0,
-        "enfermedad_familiar": 0,
-        "particulares": 0,
-        "citacion": 0,
-        "paro": 0,
-        "art": 0,
-        "duelo": 0,
-        "examen": 0,
-        "licencia_extraordinaria": 0,
-        "injustificadas": 0,
-        "otras": 0,
-    }
+    cont = {b: 0 for b in BUCKETS}
 
     meses_particulares = {}  # yyyy-mm -> cantidad
 
-    for ins in COL_INASISTENCIAS.find(q):
-        causa_norm = _norm(ins.get("causa") or "")
-        bucket = _causa_bucket(causa_norm)
+    for ins in COL_INASISTENCIAS.find(q, {"fecha": 1, "causa": 1, "causa_bucket": 1}):
+        bucket = _bucket_de(ins)
 
         if bucket in cont:
             cont[bucket] += 1
@@ -601,73 +959,24 @@ def _limites_restantes(docente_id_raw, referencia_fecha=None):
     }
    
 
-def _no_laborables_set(anio: int):
-    """
-    Set de fechas ISO 'YYYY-MM-DD' NO laborables (feriados + suspensiones).
-    """
-    desde = date(anio, 1, 1).isoformat()
-    hasta = date(anio, 12, 31).isoformat()
-
-    s = set()
-    for x in COL_CALENDARIO_ESCOLAR.find({"fecha": {"$gte": desde, "$lte": hasta}}):
-        f = (x.get("fecha") or "").strip()
-        if f:
-            s.add(f)
-    return s
-
 def get_dias_habiles(anio, mes, no_laborables=None):
     """
     Lista de fechas (date) hábiles L-V del mes, excluyendo no_laborables.
     """
-    no_laborables = no_laborables or set()
-
-    dias = []
-    cal = calendar.Calendar(firstweekday=0)  # 0=Lunes
-    for d in cal.itermonthdates(anio, mes):
-        if d.month != mes:
-            continue
-        if d.weekday() < 5 and d.isoformat() not in no_laborables:
-            dias.append(d)
-    return dias
-
-def dias_base_mes_para_docente(docente, anio, mes, no_laborables=None):
-    """
-    Denominador correcto del mes:
-    - Grupo A (todos menos PROFESOR solo): todos los días hábiles reales del mes
-    - PROFESOR solo: sólo los días hábiles que caen en weekdays donde tiene horas
-    """
-    no_laborables = no_laborables or set()
-    dias_habiles = get_dias_habiles(anio, mes, no_laborables=no_laborables)
-
-    if docente_concurre_todos_los_dias(docente):
-        return len(dias_habiles)
-
-    dias_con_horas = dias_semana_con_horas_docente(docente)
-    if not dias_con_horas:
-        return 0
+    if no_laborables is None:
+        return list(CALENDARIO.dias_habiles(anio, mes, excluir_no_laborables=False))
+    return [d for d in CALENDARIO.dias_habiles(anio, mes, excluir_no_laborables=False)
+            if d.isoformat() not in no_laborables]
 
-    return sum(1 for d in dias_habiles if d.weekday() in dias_con_horas)
-
-def docente_esperado_en_fecha(docente, fdate, no_laborables=None):
+def mascara_docente(docente):
     """
-    True si el docente debería concurrir ese día (para cálculo diario).
-    - Si el día es no laborable => False para todos
-    - Grupo A => True en L-V
-    - PROFESOR solo => True si weekday está en sus días con horas
+    Weekdays en que el docente concurre, como máscara de bits (ver calendario.py):
+    - Grupo A (todos menos PROFESOR solo): L-V
+    - PROFESOR solo: los weekdays donde tiene horas
     """
-    no_laborables = no_laborables or set()
-
-    # Día no laborable => nadie "esperado"
-    if fdate.isoformat() in no_laborables:
-        return False
-
-    # Grupo A => concurre todos los días  hábles 
     if docente_concurre_todos_los_dias(docente):
-        return fdate.weekday() < 5  # L-V
-
-    # PROFESOR solo => depende de su carga horaria (weekdays con horas)
-    return fdate.weekday() in dias_semana_con_horas_docente(docente)
-
+        return TODA_LA_SEMANA
+    return mascara_de_weekdays(dias_semana_con_horas_docente(docente))
 
 def norm_curso(curso: str) -> str:
     """
@@ -862,110 +1171,10 @@ MESES_ES = [
 
 CURSOS = ["1º", "2º", "3º", "4º", "5º", "6º"]
 
-def calcular_matricula_mensual(mes, anio):
-    """
-    Matrícula activa en el mes/anio dado.
+def _datos_parte(estructura_parte, mes, anio):
+    """Totales por turno, lista de cursos y encabezado del parte de un mes (para la plantilla)."""
 
-    Activo = ingresó antes o durante el mes y
-             NO tiene EGRESO ni PASE A OTRA ESCUELA efectivo
-             antes o dentro de ese mes.
-
-    Separa por curso (1º..6º) y sección A/B (A = mañana, B = tarde).
-    """
-
-    # 1. Rango del mes (fechas NAIVE, sin tz)
-    try:
-        primer_dia = datetime(anio, mes, 1)
-        ultimo_dia = primer_dia + relativedelta(months=1) - timedelta(seconds=1)
-    except ValueError:
-        # Si vino algo raro en mes/año, usamos la fecha actual
-        hoy = today()
-        mes = hoy.month
-        anio = hoy.year
-        primer_dia = datetime(anio, mes, 1)
-        ultimo_dia = primer_dia + relativedelta(months=1) - timedelta(seconds=1)
-
-    # 2. Estructura base del parte
-    estructura_parte = {}
-    for curso in CURSOS:
-        estructura_parte[f"{curso} A"] = {"VARONES": 0, "MUJERES": 0, "TOTAL": 0}
-        estructura_parte[f"{curso} B"] = {"VARONES": 0, "MUJERES": 0, "TOTAL": 0}
-
-    # 3. Alumnos desde Mongo
-    alumnos = mongo.db.alumnos.find({})
-
-    # Helper local para parsear fechas que puedan venir como str o datetime
-    def parse_fecha(valor, default=None):
-        if isinstance(valor, datetime):
-            return valor
-        if isinstance(valor, str) and valor.strip():
-            try:
-                # 'YYYY-MM-DD' o 'YYYY-MM-DDTHH:MM:SS'
-                return datetime.fromisoformat(valor.strip())
-            except ValueError:
-                pass
-        return default
-
-    inicio_clases = datetime(1900, 1, 1) 
-
-    for alumno in alumnos:
-        # === 3.1 Fechas de ingreso / salida ===
-        fecha_ingreso = parse_fecha(alumno.get("fecha_ingreso"), default=inicio_clases)
-        fecha_salida  = parse_fecha(alumno.get("fecha_salida"),  default=None)
-
-        if fecha_ingreso is None:
-            fecha_ingreso = inicio_clases
-
-        motivo = (alumno.get("motivo_salida") or "").strip().upper()
-
-        # Es baja definitiva si tiene EGRESO o PASE y fecha_salida efectiva
-        es_baja_definitiva = (
-    fecha_salida is not None
-    and fecha_salida <= ultimo_dia
-)
-
-    # Activo en el mes si ingresó antes/durante y no tiene baja definitiva
-        esta_activo = (fecha_ingreso <= ultimo_dia) and not es_baja_definitiva
-        if not esta_activo:
-            continue
-
-        # === 3.2 Curso y sección desde "curso" (1°A, 2°B, etc.) ===
-        curso_raw = (alumno.get("curso") or "").upper().replace("º", "°").replace(" ", "")
-        if not curso_raw:
-            continue
-
-        grado_str = None
-        for g in ("1", "2", "3", "4", "5", "6"):
-            if curso_raw.startswith(g):
-                grado_str = f"{g}º"
-                break
-        if grado_str is None:
-            continue
-
-        if "A" in curso_raw:
-            seccion = "A"
-        elif "B" in curso_raw:
-            seccion = "B"
-        else:
-            continue
-
-        clave_curso = f"{grado_str} {seccion}"
-        if clave_curso not in estructura_parte:
-            continue
-
-        # === 3.3 Sexo ===
-        sexo = (alumno.get("sexo") or "").strip().upper()
-        if sexo not in ("M", "F"):
-            continue
-
-        if sexo == "M":
-            estructura_parte[clave_curso]["VARONES"] += 1
-        else:
-            estructura_parte[clave_curso]["MUJERES"] += 1
-
-        estructura_parte[clave_curso]["TOTAL"] += 1
-
-    # 4. Totales por turno y general
+    # Totales por turno y general
     totales = defaultdict(lambda: {"VARONES": 0, "MUJERES": 0, "TOTAL": 0})
     for curso_seccion, datos in estructura_parte.items():
         if curso_seccion.endswith(" A"):
@@ -983,7 +1192,7 @@ def calcular_matricula_mensual(mes, anio):
     totales["GENERAL"]["MUJERES"] = totales["MAÑANA"]["MUJERES"] + totales["TARDE"]["MUJERES"]
     totales["GENERAL"]["TOTAL"]   = totales["MAÑANA"]["TOTAL"]   + totales["TARDE"]["TOTAL"]
 
-    # 5. Lista de cursos para la plantilla
+    # Lista de cursos para la plantilla
     lista_cursos = []
     for curso in CURSOS:
         lista_cursos.append({
@@ -1004,6 +1213,40 @@ def calcular_matricula_mensual(mes, anio):
         "totales": totales,
     }
 
+def calcular_matricula_mensual(mes, anio):
+    """
+    Matrícula activa en el mes/anio dado.
+
+    Activo = ingresó antes o durante el mes y
+             NO tiene EGRESO ni PASE A OTRA ESCUELA efectivo
+             antes o dentro de ese mes.
+
+    Separa por curso (1º..6º) y sección A/B (A = mañana, B = tarde).
+    El conteo sale de matricula_mensual (ver matricula.py).
+    """
+
+    # 1. Validar mes/año
+    try:
+        datetime(anio, mes, 1)
+    except ValueError:
+        # Si vino algo raro en mes/año, usamos la fecha actual
+        hoy = today()
+        mes = hoy.month
+        anio = hoy.year
+
+    # 2. Parte del mes: snapshot guardado (se arma 1 vez y se mantiene por $inc)
+    estructura_parte = MATRICULA.parte(anio, mes)
+
+    return _datos_parte(estructura_parte, mes, anio)
+
+def calcular_matricula_anual(anio):
+    """
+    Los 12 partes del año (para imprimir a fin de año).
+    Los meses que falten se arman juntos con UN recorrido de alumnos (ver matricula.py).
+    """
+    partes = MATRICULA.partes_anio(anio)
+    return [_datos_parte(partes[mes], mes, anio) for mes in range(1, 13)]
+
 def _anio_range(anio: int):
     desde = datetime(anio, 1, 1, 0, 0, 0)
     hasta = datetime(anio + 1, 1, 1, 0, 0, 0)
@@ -1064,6 +1307,10 @@ def resumen_movimientos():
         elif tipo == "CAMBIO_TURNO":
             cambios_turno.append(m)
 
+        elif tipo == "PROMOCION":
+            # pase de año de la matrícula inicial: no es alta ni baja
+            continue
+
         elif tipo in ("BAJA", "SALIDA"):
             # clasificamos por motivo
             if "PASE" in motivo:
@@ -1076,12 +1323,7 @@ def resumen_movimientos():
             otras_bajas.append(m)
 
     # años disponibles (para el selector)
-    anios_disponibles = sorted(
-        { (m.get("fecha").year if isinstance(m.get("fecha"), datetime) else None)
-          for m in COL_MOVIMIENTOS.find({}, {"fecha": 1}) },
-        reverse=True
-    )
-    anios_disponibles = [a for a in anios_disponibles if a]
+    anios_disponibles = METADATOS.anios("movimientos_alumnos", "fecha")
 
     return render_template(
         "resumen_movimientos.html",
@@ -1100,52 +1342,15 @@ def _fetch_set4_context(docente_id, desde, hasta):
     d = COL_DOCENTES.find_one({"_id": ObjectId(docente_id)})
     if not d: return None, None, None
 
-    # Inicializamos todos los contadores que tu calendario espera ver
-    totales = {
-        "enfermedad_personal": 0,
-        "enfermedad_familiar": 0,
-        "particulares": 0,
-        "citacion": 0,
-        "injustificadas": 0,
-        "duelo": 0,
-        "examen": 0,
-        "paro": 0,
-        "pre_examen": 0,
-        "ART": 0,
-        "otras": 0,
-        "suma": 0
-    }
+    # Inicializamos todos los contadores que tu calendario espera ver (buckets de causas.py)
+    totales = {b: 0 for b in BUCKETS}
+    totales["suma"] = 0
 
     q = {"docente_id": ObjectId(docente_id), "fecha": {"$gte": desde, "$lte": hasta}}
     inasistencias_lista = []
-    
+
     for ins in COL_INASISTENCIAS.find(q).sort("fecha", 1):
-        causa = (ins.get("causa") or "").lower()
-        
-        # Lógica de discriminación detallada
-        if "personal" in causa and "enfermedad" in causa:
-            totales["enfermedad_personal"] += 1
-        elif "familiar" in causa and "enfermedad" in causa:
-            totales["enfermedad_familiar"] += 1
-        elif "particular" in causa:
-            totales["particulares"] += 1
-        elif "citacion" in causa or "citación" in causa:
-            totales["citacion"] += 1
-        elif "injustificada" in causa:
-            totales["injustificadas"] += 1
-        elif "duelo" in causa:
-            totales["duelo"] += 1
-        elif "examen" in causa and "pre" not in causa:
-            totales["examen"] += 1
-        elif "pre" in causa and "examen" in causa:
-            totales["pre_examen"] += 1
-        elif "paro" in causa:
-            totales["paro"] += 1
-        elif "art" in causa:
-            totales["ART"] += 1
-        else:
-            totales["otras"] += 1
-        
+        totales[_bucket_de(ins)] += 1
         inasistencias_lista.append(ins)
 
     totales["suma"] = sum(v for k, v in totales.items() if k != "suma")
@@ -1175,18 +1380,9 @@ def _fetch_set4_context_oficial(docente_id, anio):
 
     inasistencias_lista = []
     for ins in COL_INASISTENCIAS.find(q).sort("fecha", 1):
-        causa = (ins.get("causa") or "").lower()
-        
-        if "enfermedad" in causa:
-            totales["enfermedad"] += 1
-        elif "particular" in causa:
-            totales["privadas"] += 1
-        elif "injustificada" in causa:
-            totales["injustificadas"] += 1
-        else:
-            # Todo lo demás (Paro, Citación, Duelo, etc.) va a "Otras"
-            totales["otras"] += 1
-            
+        # Grupo oficial (causas.py): todo lo demás (Paro, Citación, Duelo, etc.) va a "Otras"
+        grupo = ins.get("causa_grupo") or clasificar_causa(ins.get("causa") or "")[1]
+        totales[grupo] += 1
         inasistencias_lista.append(ins)
 
     totales["suma"] = totales["enfermedad"] + totales["privadas"] + totales["otras"] + totales["injustificadas"]
@@ -1213,7 +1409,7 @@ def _aux_historial_query_from_args(args):
         q["fecha"] = {"$lte": hasta}
 
     if causa and causa.upper() != "TODAS":
-        q["causa"] = {"$regex": causa, "$options": "i"}
+        q.update(_filtro_causa(causa))
 
     return q
 
@@ -1231,12 +1427,11 @@ def _contar_por_bucket_aux_anio(auxiliar_id, referencia_fecha):
     meses_particulares = {}
 
     q = {"auxiliar_id": auxiliar_id, "fecha": {"$gte": desde_iso, "$lte": hasta_iso}}
-    for ins in COL_INASISTENCIAS_AUX.find(q, {"fecha": 1, "causa": 1}):
+    for ins in COL_INASISTENCIAS_AUX.find(q, {"fecha": 1, "causa": 1, "causa_bucket": 1}):
         f = _parse_date(ins.get("fecha"))
         if not f:
             continue
-        causa_norm = _norm((ins.get("causa") or "").strip())
-        bucket = _causa_bucket(causa_norm)
+        bucket = _bucket_de(ins)
 
         cont[bucket] = cont.get(bucket, 0) + 1
 
@@ -1334,6 +1529,7 @@ def calendario_escolar():
                 {"$set": {"fecha": fecha, "tipo": tipo, "motivo": motivo}},
                 upsert=True
             )
+            CALENDARIO.invalidar(fecha[:4] if fecha[:4].isdigit() else None)
 
         return redirect(url_for("calendario_escolar", anio=anio))
 
@@ -1362,7 +1558,9 @@ def calendario_escolar():
 @app.route("/calendario_escolar/<id>/eliminar", methods=["POST"])
 def eliminar_calendario_escolar(id):
     try:
-        COL_CALENDARIO_ESCOLAR.delete_one({"_id": ObjectId(id)})
+        item = COL_CALENDARIO_ESCOLAR.find_one_and_delete({"_id": ObjectId(id)}, {"fecha": 1})
+        fecha = (item or {}).get("fecha") or ""
+        CALENDARIO.invalidar(fecha[:4] if fecha[:4].isdigit() else None)
     except Exception:
         pass
     # volver al año actual (o podés mandar anio hidden en form si querés)
@@ -1420,7 +1618,8 @@ def editar_docente(id):
 @app.route("/docentes/<id>/eliminar", methods=["POST"])
 def eliminar_docente(id):
     COL_DOCENTES.delete_one({"_id": ObjectId(id)})
-    COL_INASISTENCIAS.delete_many({"docente_id": id})
+    COL_INASISTENCIAS.delete_many({"docente_id": {"$in": [id, _maybe_oid(id)]}})
+    CONTADORES_DOCENTES.borrar_persona(_maybe_oid(id))
     COL_CALIFICACIONES.delete_many({"docente_id": id})
     COL_ESTADOS_ADMIN.delete_many({"docente_id": id})
     return redirect(url_for("listar_docentes"))
@@ -1508,19 +1707,8 @@ def docente_inasistencias_anuales(id):
     # Resumen numérico (SET4)
     d_set4, periodo, pack = _fetch_set4_context(id, desde_iso, hasta_iso)
     if not d_set4:
-        totales = {
-            "enfermedad_personal": 0,
-            "enfermedad_familiar": 0,
-            "particulares": 0,
-            "citacion": 0,
-            "injustificadas": 0,
-            "duelo": 0,
-            "examen": 0,
-            "paro": 0,
-            "pre_examen": 0,
-            "otras": 0,
-            "suma": 0,
-        }
+        totales = {b: 0 for b in BUCKETS}
+        totales["suma"] = 0
         lista_inasistencias = []
         periodo = {"desde": desde_iso, "hasta": hasta_iso}
     else:
@@ -1639,8 +1827,16 @@ def api_inasistencia_update(id):
 
     if not updates:
         return jsonify(ok=False, error="Sin cambios"), 400
+    if "causa" in updates:
+        updates.update(campos_causa(updates["causa"]))
 
-    COL_INASISTENCIAS.update_one({"_id": oid}, {"$set": updates})
+    try:
+        antes = COL_INASISTENCIAS.find_one_and_update({"_id": oid}, {"$set": updates})
+    except DuplicateKeyError:
+        return jsonify(ok=False, error="Ya hay una inasistencia cargada para este docente en esa fecha."), 409
+    if not antes:
+        return jsonify(ok=False, error="Inasistencia no encontrada"), 404
+    CONTADORES_DOCENTES.mover(antes, {**antes, **updates})
     return jsonify(ok=True)
 
 
@@ -1651,8 +1847,10 @@ def api_inasistencia_delete(id):
     except Exception:
         return jsonify(ok=False, error="ID inválido"), 400
 
-    res = COL_INASISTENCIAS.delete_one({"_id": oid})
-    return jsonify(ok=bool(res.deleted_count), deleted=int(res.deleted_count))
+    borrada = COL_INASISTENCIAS.find_one_and_delete({"_id": oid})
+    if borrada:
+        CONTADORES_DOCENTES.descontar(borrada)
+    return jsonify(ok=bool(borrada), deleted=int(bool(borrada)))
 
 
 # SOLO POST: crear inasistencias (desde/hasta)
@@ -1694,71 +1892,33 @@ def api_inasistencias():
     bucket = _causa_bucket(causa_norm)
 
     # ---- Topes y reglas ----
-    cont_anual, meses_particulares = _contar_por_bucket_docente_anio(docente_id, referencia_fecha=desde)
-
     warning = None
 
     # ✅ REGLA ESTRICTA: CAUSAS PARTICULARES = 1 DÍA POR MES y máx 6 al año
+    # (1 por mes y 6 al año se controlan al reservar en los contadores, más abajo)
     if bucket == "particulares":
         # 1) no permito rango multi-día
         if desde != hasta:
             return jsonify(ok=False, error="Causas particulares: debe ser UN (1) solo día (1 por mes)."), 400
 
-        # 2) no más de 1 por mes
-        key_mes = f"{desde.year}-{desde.month:02d}"
-        if meses_particulares.get(key_mes, 0) >= 1:
-            return jsonify(ok=False, error="Ya hay una inasistencia por 'causas particulares' en este mes."), 400
-
-        # 3) no más de 6 al año
-        if cont_anual.get("particulares", 0) >= LIMITES_ANUALES["particulares"]:
-            return jsonify(ok=False, error="Se alcanzó el tope anual de 'causas particulares' (6)."), 400
-
-    # ✅ ADVERTENCIA (NO BLOQUEA) para enfermedad/preexamen si excede el tope
-    if bucket in ("enfermedad_personal", "enfermedad_familiar", "preexamen"):
-        tope = LIMITES_ANUALES.get(bucket)
-        if tope is not None and cont_anual.get(bucket, 0) >= tope:
-            warning = f"Docente excedido en esta inasistencia: VER cuadro resumen y alertas ({cont_anual.get(bucket,0)+1}/{tope})."
-
-        # ✅ No permitir fechas futuras (te advierte y NO deja guardar)
+    # ✅ No permitir fechas futuras (te advierte y NO deja guardar)
     if desde > date.today():
         return jsonify(ok=False, error="Fecha inválida: no se pueden cargar inasistencias futuras."), 400
 
-    # ---- Evitar más de una inasistencia por día (IDEMPOTENTE) ----
-    dias_a_insertar = []
-    dcur = desde
-    while dcur <= hasta:
-        fecha_iso = dcur.isoformat()
-
-        existente = COL_INASISTENCIAS.find_one({"docente_id": docente_id, "fecha": fecha_iso})
-        if existente:
-            # si ya existe exactamente lo mismo, lo tomo como reintento (no error)
-            same = (
-                (existente.get("causa") or "").strip() == causa and
-                (existente.get("observaciones") or "").strip() == observ and
-                (existente.get("suplente_info") or {}) == suplente_info
-            )
-            if same:
-                dcur += timedelta(days=1)
-                continue
-
-            msg = f"Ya hay una inasistencia cargada para este docente el {dcur.strftime('%d/%m/%Y')}."
-            return jsonify(ok=False, error=msg), 400
-
-        dias_a_insertar.append(fecha_iso)
-        dcur += timedelta(days=1)
-    # ---- Insertar inasistencias ----
-        docs = [{
-        "docente_id": docente_id,
-        "fecha": f,
-        "causa": causa,
-        "observaciones": observ,
-        "suplente_info": suplente_info,
-    } for f in dias_a_insertar]
+    # ---- Evitar más de una inasistencia por día (IDEMPOTENTE) + topes + insertar ----
+    datos = {"causa": causa, "observaciones": observ, "suplente_info": suplente_info, **campos_causa(causa)}
+    resp, status, usados = _insertar_inasistencias_rango(
+        COL_INASISTENCIAS, "docente_id", docente_id, desde, hasta, datos,
+        CONTADORES_DOCENTES, bucket, "docente",
+    )
 
-    if docs:
-        COL_INASISTENCIAS.insert_many(docs)
+    # ✅ ADVERTENCIA (NO BLOQUEA) para enfermedad/pre-examen si excede el tope
+    if resp.get("inserted") and bucket in ("enfermedad_personal", "enfermedad_familiar", "pre_examen"):
+        tope = LIMITES_ANUALES.get(bucket)
+        if tope is not None and usados >= tope:
+            warning = f"Docente excedido en esta inasistencia: VER cuadro resumen y alertas ({usados+1}/{tope})."
 
-    return jsonify(ok=True, inserted=len(docs), warning=warning)
+    return jsonify(**resp, warning=warning), status
 
 
 @app.route("/inasistencias/<id>/editar", methods=["GET", "POST"])
@@ -1785,8 +1945,13 @@ def editar_inasistencia(id):
             "suplente_curso": data.get("suplente_curso", "").strip(),
             "observaciones": data.get("observaciones", "").strip(),
         }
+        update.update(campos_causa(update["causa"]))
 
-        COL_INASISTENCIAS.update_one({"_id": oid}, {"$set": update})
+        try:
+            antes = COL_INASISTENCIAS.find_one_and_update({"_id": oid}, {"$set": update})
+        except DuplicateKeyError:
+            abort(409, description="Ya hay una inasistencia cargada para este docente en esa fecha.")
+        CONTADORES_DOCENTES.mover(antes, {**(antes or {}), **update})
         # Después de editar, te vuelvo al historial, con los mismos filtros que tenías si querés
         return redirect(url_for("historial_inasistencias"))
 
@@ -1833,70 +1998,128 @@ def _historial_query_from_args(args):
 
     # Causa
     if causa and causa.upper() != "TODAS":
-        # match flexible, case-insensitive
-        q["causa"] = {"$regex": causa, "$options": "i"}
+        q.update(_filtro_causa(causa))
 
     return q
 
 
-@app.get("/api/historial_lista")
-def api_historial_lista():
-    if not mongo_ping_ok():
-        return jsonify({"ok": False, "error": "db_down"}), 503
+HISTORIAL_LIMITE_DEFAULT = 200
+HISTORIAL_LIMITE_MAX = 1000
 
-    q = _historial_query_from_args(request.args)
+def _historial_token(ins):
+    """Token de paginación: 'fecha,_id' del último item de la página."""
+    return f"{ins.get('fecha', '')},{ins['_id']}"
 
-    # 1) Traigo todas las inasistencias del query
-    ins_list = list(COL_INASISTENCIAS.find(q).sort("fecha", 1))
+def _historial_after(token):
+    """Condición keyset para seguir después de 'fecha,_id' (orden fecha, _id ascendente)."""
+    fecha, _, oid = (token or "").rpartition(",")
+    try:
+        oid = ObjectId(oid)
+    except Exception:
+        return None
+    return {"$or": [{"fecha": {"$gt": fecha}}, {"fecha": fecha, "_id": {"$gt": oid}}]}
+
+def _historial_nombres(docs, campo_persona, col_personas):
+    """{id_str: {"nombre", "apellido", "cargo"}} de las personas de 'docs' (1 consulta $in)."""
+    oids = list({_maybe_oid(d.get(campo_persona)) for d in docs if d.get(campo_persona)})
+    out = {}
+    if oids:
+        for p in col_personas.find({"_id": {"$in": oids}}, {"apellido": 1, "nombre": 1, "cargo": 1}):
+            out[str(p["_id"])] = {
+                "nombre": p.get("nombre", ""),
+                "apellido": p.get("apellido", ""),
+                "cargo": p.get("cargo", ""),
+            }
+    return out
 
-    # 2) Junto los docente_id (como ObjectId) para resolver nombres en 1 sola query
-    docente_oids = []
-    for ins in ins_list:
-        did = ins.get("docente_id")
-        if did:
-            try:
-                docente_oids.append(_maybe_oid(did))
-            except Exception:
-                pass
+def _historial_lista(col, q, campo_persona, col_personas, fila):
+    """
+    Lista del historial con paginación por cursor (keyset sobre el índice (fecha, _id)).
 
-    docente_oids = [d for d in docente_oids if d is not None]
+    ?limit=N        tamaño de página (default 200, máx 1000)
+    ?after=<token>  'fecha,_id' devuelto como 'next' por la página anterior
+    ?formato=ndjson exportación: una fila JSON por línea, en streaming
+                    (sin limit, todo lo filtrado; los nombres se resuelven por tandas)
+    """
+    after = request.args.get("after")
+    if after:
+        keyset = _historial_after(after)
+        if keyset is None:
+            return jsonify({"ok": False, "error": "after inválido"}), 400
+        q = {"$and": [q, keyset]}
+
+    orden = [("fecha", 1), ("_id", 1)]
+    ndjson = (request.args.get("formato") or "").lower() == "ndjson"
+    limit = request.args.get("limit", type=int)
+
+    if ndjson:
+        cursor = col.find(q).sort(orden)
+        if limit:
+            cursor = cursor.limit(min(limit, HISTORIAL_LIMITE_MAX))
+
+        def generar():
+            tanda = []
+            for ins in cursor:
+                tanda.append(ins)
+                if len(tanda) >= 500:
+                    nombres = _historial_nombres(tanda, campo_persona, col_personas)
+                    yield "".join(json.dumps(fila(x, nombres), ensure_ascii=False) + "\n" for x in tanda)
+                    tanda = []
+            if tanda:
+                nombres = _historial_nombres(tanda, campo_persona, col_personas)
+                yield "".join(json.dumps(fila(x, nombres), ensure_ascii=False) + "\n" for x in tanda)
+
+        return Response(stream_with_context(generar()), mimetype="application/x-ndjson")
+
+    limit = max(1, min(limit or HISTORIAL_LIMITE_DEFAULT, HISTORIAL_LIMITE_MAX))
+    # Pido 1 de más para saber si hay otra página
+    ins_list = list(col.find(q).sort(orden).limit(limit + 1))
+    hay_mas = len(ins_list) > limit
+    ins_list = ins_list[:limit]
+
+    nombres = _historial_nombres(ins_list, campo_persona, col_personas)
+    rows = [fila(ins, nombres) for ins in ins_list]
+    siguiente = _historial_token(ins_list[-1]) if hay_mas and ins_list else None
+
+    return jsonify({"ok": True, "items": rows, "next": siguiente})
+
+def _fila_historial_docente(ins, docentes_map):
+    did_str = str(ins.get("docente_id")) if ins.get("docente_id") is not None else ""
+    d = docentes_map.get(did_str, {})
+    docente_nombre = f"{d.get('apellido','')}, {d.get('nombre','')}".strip(", ") if d else ""
+    return {
+        "_id": str(ins.get("_id")),
+        "fecha": ins.get("fecha", ""),
+        "causa": ins.get("causa", ""),
+        "observaciones": ins.get("observaciones", ""),
+        "suplente_info": ins.get("suplente_info") or {},
+        "docente_id": did_str,
+        "docente_nombre": docente_nombre,
+        "edit_url": f"/inasistencias/{str(ins.get('_id'))}/editar",
+    }
 
-    docentes_map = {}
-    if docente_oids:
-        for d in COL_DOCENTES.find({"_id": {"$in": docente_oids}}, {"apellido": 1, "nombre": 1, "cargo": 1}):
-            docentes_map[str(d["_id"])] = {
-                "nombre": d.get("nombre", ""),
-                "apellido": d.get("apellido", ""),
-                "cargo": d.get("cargo", ""),
-            }
+def _fila_historial_aux(ins, aux_map):
+    aid_str = str(ins.get("auxiliar_id")) if ins.get("auxiliar_id") is not None else ""
+    a = aux_map.get(aid_str, {})
+    aux_nombre = f"{a.get('apellido','')}, {a.get('nombre','')}".strip(", ") if a else ""
+    return {
+        "_id": str(ins.get("_id")),
+        "fecha": ins.get("fecha", ""),
+        "causa": ins.get("causa", ""),
+        "observaciones": ins.get("observaciones", ""),
+        "suplente_info": ins.get("suplente_info") or {},
+        "auxiliar_id": aid_str,
+        "auxiliar_nombre": aux_nombre,
+    }
 
-    rows = []
-    for ins in ins_list:
-        did_raw = ins.get("docente_id")
-        did_str = ""
-        if did_raw is not None:
-            try:
-                did_str = str(did_raw)
-            except Exception:
-                did_str = ""
 
-        d = docentes_map.get(did_str, {}) 
-        docente_nombre = ""
-        if d:
-            docente_nombre = f"{d.get('apellido','')}, {d.get('nombre','')}".strip(", ")
-
-        rows.append({
-            "_id": str(ins.get("_id")),
-            "fecha": ins.get("fecha", ""),
-            "causa": ins.get("causa", ""),
-            "observaciones": ins.get("observaciones", ""),
-            "suplente_info": ins.get("suplente_info") or {},
-            "docente_id": did_str,
-            "docente_nombre": docente_nombre,
-            "edit_url": f"/inasistencias/{str(ins.get('_id'))}/editar",
-        })
+@app.get("/api/historial_lista")
+def api_historial_lista():
+    if not mongo_ping_ok():
+        return jsonify({"ok": False, "error": "db_down"}), 503
 
-    return jsonify({"ok": True, "items": rows})
+    q = _historial_query_from_args(request.args)
+    return _historial_lista(COL_INASISTENCIAS, q, "docente_id", COL_DOCENTES, _fila_historial_docente)
 
 @app.get("/api/historial_resumen")
 def api_historial_resumen():
@@ -1905,58 +2128,8 @@ def api_historial_resumen():
 
     q = _historial_query_from_args(request.args)
 
-    por = {
-        "enfermedad_personal": 0,
-        "enfermedad_familiar": 0,
-        "enfermedad_cronica": 0,
-        "particulares": 0,
-        "citacion_otro_establecimiento": 0,
-        "injustificadas": 0,
-        "pre_examen": 0,
-
-        "duelo": 0,
-        "examen": 0,
-        "paro": 0,
-        "art": 0,
-        "licencia_extraordinaria": 0,
-        "otras": 0,
-    }
-
-    def bucket_from_causa(causa: str) -> str:
-        c = _normalizar_texto(causa or "")
-        if "enfermedad personal" in c:
-            return "enfermedad_personal"
-        if "enfermedad familiar" in c:
-            return "enfermedad_familiar"
-        if "cronica" in c:
-            return "enfermedad_cronica"
-        if "causas particulares" in c or ("particular" in c):
-            return "particulares"
-        if "citacion" in c and "otro" in c and "establecimiento" in c:
-            return "citacion_otro_establecimiento"
-        if "injust" in c:
-            return "injustificadas"
-        if "pre" in c and "examen" in c:
-            return "pre_examen"
-        if "duelo" in c:
-            return "duelo"
-        if "examen" in c and "pre" not in c:
-            return "examen"
-        if "paro" in c:
-            return "paro"
-        if "art" == c or " art " in f" {c} ":
-            return "art"
-        if "licencia extraordinaria" in c:
-            return "licencia_extraordinaria"
-        return "otras"
-
-    total = 0
-    for ins in COL_INASISTENCIAS.find(q, {"causa": 1}):
-        total += 1
-        b = bucket_from_causa(ins.get("causa", ""))
-        por[b] = por.get(b, 0) + 1
-
-    return jsonify({"ok": True, "total": total, "por_causa": por})
+    res = _resumen_historial_agg(COL_INASISTENCIAS, q, "docente_id", COL_DOCENTES, _group_by_param())
+    return jsonify({"ok": True, **res})
 
 # ----------------- ALUMNOS -----------------
 @app.route("/alumnos")
@@ -1992,7 +2165,7 @@ def listar_alumnos():
 
     # Filtro por curso / turno
     if curso_sel:
-        filtro["curso"] = {"$regex": rf"^\s*{re.escape(curso_sel)}\s*$", "$options": "i"}
+        filtro["curso_key"] = curso_key(curso_sel)
     elif turno_sel:
         ts = turno_sel.strip().lower()
         if ts == "mañana":
@@ -2008,17 +2181,17 @@ def listar_alumnos():
                 {"$or": [
                     {"fecha_salida": {"$in": [None, "", False]}},
                     {"curso_origen": curso_sel},
-                    {"curso": curso_sel},
+                    {"curso_key": curso_key(curso_sel)},
                 ]}
             ]
         }
-        alumnos_cur = app.mongo.alumnos.find(cond_historico)
+        alumnos_cur = app.mongo.alumnos.find(cond_historico, proyeccion("alumnos.html"))
     else:
         # Combinamos el filtro de activos (si lo usas) con nuestro filtro de año/búsqueda
         query_final = {**filtro_activos(), **filtro}
-        alumnos_cur = app.mongo.alumnos.find(query_final)
+        alumnos_cur = app.mongo.alumnos.find(query_final, proyeccion("alumnos.html"))
 
-    alumnos = list(alumnos_cur)
+    alumnos = documentos("alumnos.html", alumnos_cur)
 
     # ----------------- FLAGS PARA EL TEMPLATE -----------------
     for a in alumnos:
@@ -2062,6 +2235,7 @@ def listar_alumnos():
                 edad = REF.year - nac.year - ((REF.month, REF.day) < (nac.month, nac.day))
                 a["edad_30jun"] = edad
                 a["fecha_nac_str"] = f"{d:02d}/{m:02d}/{y}"
+                a["fecha_nac_iso"] = nac.isoformat()
             except Exception:
                 a["edad_30jun"] = ""
         else:
@@ -2069,7 +2243,7 @@ def listar_alumnos():
 
     # Cursos para el combo
     cursos = sorted([
-    c for c in app.mongo.alumnos.distinct("curso", { 
+    c for c in cursos_alumnos({ 
         "anio_lectivo": anio_busqueda,
         "$or": [
             {"fecha_salida": {"$in": [None, "", False]}},
@@ -2100,6 +2274,7 @@ def nuevo_alumno():
     seccion_letra = data.pop("seccion", "").strip() # Sacamos el "A"
     data["curso"] = normalizar_curso(f"{curso_nro}°{seccion_letra}")
 # Guardamos "3°A"
+    data["curso_key"] = curso_key(data["curso"])
     
     # Capturamos el año del selector del modal y lo hacemos número
     data["anio_lectivo"] = int(data.get("anio_lectivo", 2025))
@@ -2146,6 +2321,7 @@ def nuevo_alumno():
     # -------- Insertamos alumno --------
     res = COL_ALUMNOS.insert_one(data)  
     alumno_id = res.inserted_id
+    _alumno_cambio(None, data)
 
    
     # -------- Registramos movimiento inicial (ALTA real o MATRÍCULA) --------
@@ -2293,6 +2469,9 @@ def editar_alumno(id):
         unset_fields["destino_salida"] = ""
         unset_fields["curso_destino"] = ""
 
+    # clave indexable del curso (siempre acompaña a "curso")
+    set_fields["curso_key"] = curso_key(set_fields.get("curso"))
+
     # ----------------- GUARDAR -----------------
     update_doc = {"$set": set_fields}
     if unset_fields:
@@ -2300,6 +2479,11 @@ def editar_alumno(id):
 
     COL_ALUMNOS.update_one({"_id": ObjectId(id)}, update_doc)
 
+    despues = {**alumno, **set_fields}
+    for k in unset_fields:
+        despues.pop(k, None)
+    _alumno_cambio(alumno, despues)
+
     # ----------------- REGISTRAR MOVIMIENTO (si corresponde) -----------------
     try:
         # CAMBIO_TURNO
@@ -2356,7 +2540,9 @@ def eliminar_alumno(id):
 
     if hard_delete:
         # BORRADO REAL
-        COL_ALUMNOS.delete_one({"_id": oid})
+        borrado = COL_ALUMNOS.find_one_and_delete({"_id": oid}, projection=PROYECCION_MATRICULA)
+        if borrado:
+            _alumno_cambio(borrado, None)
 
         # Limpieza relacionada
         try:
@@ -2372,15 +2558,18 @@ def eliminar_alumno(id):
         flash("✅ Alumno eliminado definitivamente.", "success")
     else:
         # BAJA LÓGICA (histórico)
-        COL_ALUMNOS.update_one(
+        antes = COL_ALUMNOS.find_one_and_update(
             {"_id": oid},
             {"$set": {
                 "activo": False,
                 "fecha_salida": date.today().isoformat(),
                 "sale_a": "ELIMINADO",
                 "updated_at": datetime.utcnow()
-            }}
+            }},
+            projection=PROYECCION_MATRICULA,
         )
+        if antes:
+            _alumno_cambio(antes, {**antes, "fecha_salida": date.today().isoformat()})
         flash("✅ Alumno pasado a histórico (baja lógica).", "success")
 
     # ✅ Volver a listar con filtros (sin depender del referrer)
@@ -2417,10 +2606,14 @@ def eliminar_demos_alumnos():
     # Solo histórico (para que no borre reales activos por accidente)
     q = {"$and": [{"activo": {"$ne": True}}, {"$or": q_or}]}
 
-    ids = [a["_id"] for a in COL_ALUMNOS.find(q, {"_id": 1})]
+    borrados = list(COL_ALUMNOS.find(q, PROYECCION_MATRICULA))
+    ids = [a["_id"] for a in borrados]
 
     if ids:
         COL_ALUMNOS.delete_many({"_id": {"$in": ids}})
+        # del histórico igual pueden contar en meses pasados del parte
+        for a in borrados:
+            _alumno_cambio(a, None)
         try:
             COL_ASISTENCIA.delete_many({"alumno_id": {"$in": ids}})
         except Exception:
@@ -2456,236 +2649,97 @@ def certificado_finalizacion(id):
     }
     return render_template("certificado_finalizacion.html", **ctx)
 
-@app.get("/estudiantes/matricula_2026", endpoint="matricula_2026_view")
+def _anio_matricula(data=None):
+    """Año de la matrícula inicial desde ?anio= / body (por defecto ANIO_MATRICULA)."""
+    valor = (data or {}).get("anio") or request.args.get("anio")
+    try:
+        return int(valor) if valor else ANIO_MATRICULA
+    except (TypeError, ValueError):
+        return ANIO_MATRICULA
 
+@app.get("/estudiantes/matricula_2026", endpoint="matricula_2026_view")
 def matricula_2026_view():
-
     if not mongo_ping_ok():
-
         return render_template("db_down.html"), 503
 
-    return render_template("matricula_2026.html")
-
-
-
+    return render_template("matricula_2026.html", anio=_anio_matricula())
 
 
 @app.get("/estudiantes/matricula_2026/preview", endpoint="matricula_2026_preview")
-
 def matricula_2026_preview():
-
+    """Calcula el pase de año, lo guarda como plan (con hash) y devuelve el diff."""
     if not mongo_ping_ok():
-
         return jsonify({"ok": False, "error": "db_down"}), 503
 
-
-
-    alumnos = list(COL_ALUMNOS.find({"activo": {"$ne": False}}))
-
-
-
-    cambios = []
-
-    sin_estado = []
-
-    no_parseados = []
-
-    sexto = []
-
-
-
-    for a in alumnos:
-
-        curso_actual = (a.get("curso") or "").strip()
-
-        grado, sec = parse_curso(curso_actual)
-
-
-
-        if grado is None:
-
-            no_parseados.append(a)
-
-            continue
-
-
-
-        estado = (a.get("prom_rec_2026_2027") or "").strip().upper()
-
-
-
-        if grado == 6:
-
-            sexto.append(a)
-
-            continue
-
-
-
-        if estado not in ("PROM", "REC"):
-
-            sin_estado.append(a)
-
-            continue
-
-
-
-        curso_nuevo = curso_actual if estado == "REC" else build_curso(grado + 1, sec)
-
-
-
-        # Si querés ver también los REC aunque no cambien, dejalo igual:
-
-        cambios.append({
-
-            "id": str(a["_id"]),
-
-            "apellido": a.get("apellido", ""),
-
-            "nombre": a.get("nombre", ""),
-
-            "dni": a.get("dni", ""),
-            "curso_actual": curso_actual,
-
-            "curso_nuevo": curso_nuevo,
-
-            "estado": estado,
-
-            "cambia": (curso_nuevo != curso_actual)
-
-        })
-
-
-
-    # Orden lindo: por curso actual, apellido, nombre
-
-    def sort_key(x):
-
-        g, s = parse_curso(x.get("curso_actual", ""))
-
-        return (g or 99, s or "Z", x.get("apellido",""), x.get("nombre",""))
-
-
-
-    cambios.sort(key=sort_key)
-
-
+    anio = _anio_matricula()
+    alumnos = COL_ALUMNOS.find({"activo": {"$ne": False}}, promocion.proyeccion(anio))
+    items, stats = promocion.planificar(alumnos, anio, parse_curso, build_curso)
+    plan = PLANES_PROMOCION.guardar(anio, items, stats)
 
     return jsonify({
-
         "ok": True,
-
-        "items": cambios,
-
-        "stats": {
-
-            "total": len(alumnos),
-
-            "candidatos": len(cambios),
-
-            "cambios_reales": sum(1 for x in cambios if x.get("cambia")),
-
-            "sin_estado": len(sin_estado),
-
-            "no_parseados": len(no_parseados),
-
-            "sexto": len(sexto)
-
-        }
-
+        "anio": anio,
+        "plan_id": str(plan["_id"]),
+        "hash": plan["hash"],
+        "items": items,
+        "stats": stats,
     })
 
 @app.post("/estudiantes/matricula_2026/aplicar", endpoint="matricula_2026_aplicar")
-
 def matricula_2026_aplicar():
-
+    """
+    Aplica un plan de la vista previa: alumnos y movimientos en 1 bulk_write cada uno,
+    dentro de una transacción. Si algún alumno cambió desde la vista previa no se escribe nada.
+    Sin replica set no se aplica (503): un pase a medias no se puede deshacer.
+    """
     if not mongo_ping_ok():
-
         return jsonify({"ok": False, "error": "db_down"}), 503
 
-
-
     data = request.get_json(silent=True) or {}
-
     if (data.get("confirm") or "").strip().upper() != "SI":
-
         return jsonify({"ok": False, "error": "confirm_required"}), 400
 
+    plan = PLANES_PROMOCION.obtener(data.get("plan_id"))
+    if not plan:
+        return jsonify({"ok": False, "error": "plan_not_found"}), 404
+    if plan.get("aplicado"):
+        return jsonify({"ok": False, "error": "plan_ya_aplicado"}), 409
+
+    ops_alumnos, ops_movimientos = promocion.operaciones(plan)
+
+    def aplicar(session):
+        actualizados = 0
+        if ops_alumnos:
+            res = COL_ALUMNOS.bulk_write(ops_alumnos, ordered=False, session=session)
+            if res.matched_count != len(ops_alumnos):
+                raise PlanDesactualizado("plan_desactualizado")
+            actualizados = res.modified_count
+        if ops_movimientos:
+            COL_MOVIMIENTOS.bulk_write(ops_movimientos, ordered=False, session=session)
+        # al final: si otro request lo aplicó en el medio, se aborta todo lo anterior
+        if not PLANES_PROMOCION.marcar_aplicado(plan["_id"], actualizados, session=session):
+            raise PlanDesactualizado("plan_ya_aplicado")
+        return actualizados
 
-
-    alumnos = list(COL_ALUMNOS.find({"activo": {"$ne": False}}))
-
-
-
-    updates = 0
-
-    saltados = {"sin_estado": 0, "no_parseados": 0, "sexto": 0}
-
-
-
-    for a in alumnos:
-
-        curso_actual = (a.get("curso") or "").strip()
-
-        grado, sec = parse_curso(curso_actual)
-
-
-
-        if grado is None:
-
-            saltados["no_parseados"] += 1
-
-            continue
-
-
-
-        if grado == 6:
-
-            saltados["sexto"] += 1
-
-            continue
-
-
-
-        estado = (a.get("prom_rec_2026_2027") or "").strip().upper()
-
-        if estado not in ("PROM", "REC"):
-
-            saltados["sin_estado"] += 1
-
-            continue
-
-
-
-        curso_nuevo = curso_actual if estado == "REC" else build_curso(grado + 1, sec)
-
-
-
-        if curso_nuevo != curso_actual:
-
-            COL_ALUMNOS.update_one(
-
-                {"_id": a["_id"]},
-
-                {"$set": {
-
-                    "curso": curso_nuevo,
-
-                    "matricula_actualizada_2026": True,
-
-                    "matricula_origen": curso_actual,
-
-                    "updated_at": datetime.utcnow()
-
-                }}
-
-            )
-
-            updates += 1
-
-
-
-    return jsonify({"ok": True, "actualizados": updates, "saltados": saltados})
+    try:
+        actualizados = _en_transaccion(aplicar)
+    except PlanDesactualizado as e:
+        return jsonify({"ok": False, "error": str(e)}), 409
+    except SinTransacciones as e:
+        print("[MATRICULA] Pase de año sin aplicar, Mongo sin replica set:", e)
+        return jsonify({"ok": False, "error": "sin_transacciones"}), 503
+
+    # snapshots del parte, resúmenes y selectores (1 lectura de los alumnos tocados)
+    if ops_movimientos:
+        METADATOS.invalidar("movimientos_alumnos")
+        origen = {x["id"]: x["curso_actual"] for x in plan["items"] if x["cambia"]}
+        ids = [ObjectId(i) for i in origen]
+        for a in COL_ALUMNOS.find({"_id": {"$in": ids}}, PROYECCION_MATRICULA):
+            _alumno_cambio({**a, "curso": origen[str(a["_id"])]}, a)
+
+    st = plan.get("stats") or {}
+    saltados = {k: st.get(k, 0) for k in ("ya_aplicados", "sin_estado", "no_parseados", "sexto")}
+    return jsonify({"ok": True, "actualizados": actualizados, "saltados": saltados})
 # ----------------- CALIFICACIONES APIs -----------------
 
 @app.route("/api/asignaturas_escala", methods=["GET","POST"])
@@ -2715,7 +2769,7 @@ def api_alumnos_por_curso():
         return jsonify([])
 
     alumnos = []
-    q = {**filtro_activos(), "curso": {"$regex": f"^{curso}$", "$options": "i"}}
+    q = {**filtro_activos(), "curso_key": curso_key(curso_norm)}
 
     for a in COL_ALUMNOS.find(q).sort([("apellido", 1), ("nombre", 1)]):
         aj = to_json(a)
@@ -2781,36 +2835,57 @@ def api_calificaciones_list():
         except ValueError:
             pass
 
-    # ✅ Curso: NO filtres por q["curso"], filtrá por alumno_id IN ids
+    # ✅ Curso: por la clave guardada en la nota (índice anio_curso_asignatura_trimestre),
+    # sin las notas de alumnos dados de baja
     if curso:
-        alumnos_ids = [
-            str(a["_id"])
-            for a in COL_ALUMNOS.find(
-                {**filtro_activos(), "curso": {"$regex": f"^{curso}$", "$options": "i"}},
-                {"_id": 1}
-            )
+        q["curso_key"] = curso_key(curso)
+        q["alumno_baja"] = {"$ne": True}
+
+    # ?con_alumno=1: trae apellido/nombre/dni del alumno en la misma consulta
+    if request.args.get("con_alumno") == "1":
+        pipeline = [
+            {"$match": q},
+            {"$lookup": {
+                "from": "alumnos",
+                "let": {"aid": {"$convert": {"input": "$alumno_id", "to": "objectId", "onError": None, "onNull": None}}},
+                "pipeline": [
+                    {"$match": {"$expr": {"$eq": ["$_id", "$$aid"]}}},
+                    {"$project": {"_id": 0, "apellido": 1, "nombre": 1, "dni": 1}},
+                ],
+                "as": "alumno",
+            }},
+            {"$set": {"alumno": {"$ifNull": [{"$first": "$alumno"}, {}]}}},
         ]
-
-        # si no hay alumnos en ese curso → no hay calificaciones para devolver
-        if not alumnos_ids:
-            return jsonify([])
-
-        q["alumno_id"] = {"$in": alumnos_ids}
-
-    registros = [to_json(c) for c in COL_CALIFICACIONES.find(q)]
+        registros = [to_json(c) for c in COL_CALIFICACIONES.aggregate(pipeline)]
+    else:
+        registros = [to_json(c) for c in COL_CALIFICACIONES.find(q)]
     return jsonify(registros)
 
 
-@app.route("/api/calificaciones", methods=["POST"])
-def api_calificaciones_upsert():
-    data = request.get_json(silent=True) or {}
+def es_desaprobado(escala, valor):
+    """Criterio de desaprobación: R / D en escala conceptual, nota < 6 en numérica."""
+    escala = (escala or "").strip().lower()
+    valor = str(valor or "").strip()
+    if escala == "conceptual":
+        return valor in ("R", "D")
+    if escala == "numerica":
+        try:
+            return float(valor.replace(",", ".")) < 6.0
+        except Exception:
+            return False
+    return False
 
-    alumno_id  = (data.get("alumno_id") or "").strip()
-    docente_id = (data.get("docente_id") or "").strip()
+def _validar_calificacion(data):
+    """
+    Valida una celda de calificación (reglas de escala incluidas).
+    Devuelve (key, campos, None) o (None, None, "mensaje de error").
+    """
+    alumno_id  = str(data.get("alumno_id") or "").strip()
+    docente_id = str(data.get("docente_id") or "").strip()
     asignatura = (data.get("asignatura") or "").strip()
     curso      = (data.get("curso") or "").strip()   # snapshot (opcional)
     escala     = (data.get("escala") or "").strip().lower()
-    valor      = (data.get("valor") or "").strip()
+    valor      = str(data.get("valor") or "").strip()
     observaciones = (data.get("observaciones") or "").strip()
 
     # año (si no viene, usamos actual)
@@ -2826,21 +2901,21 @@ def api_calificaciones_upsert():
         trimestre = 0
 
     if not all([alumno_id, docente_id, asignatura, trimestre, escala, valor]):
-        return jsonify({"error": "Campos obligatorios faltantes"}), 400
+        return None, None, "Campos obligatorios faltantes"
 
     if trimestre not in (1, 2, 3):
-        return jsonify({"error": "Trimestre inválido"}), 400
+        return None, None, "Trimestre inválido"
 
     if escala not in ("conceptual", "numerica"):
-        return jsonify({"error": "Escala inválida"}), 400
+        return None, None, "Escala inválida"
 
     if escala == "numerica":
         try:
             n = float(valor.replace(",", "."))
         except Exception:
-            return jsonify({"error": "Nota numérica inválida"}), 400
+            return None, None, "Nota numérica inválida"
         if n < 1 or n > 10:
-            return jsonify({"error": "Nota fuera de rango (1 a 10)"}), 400
+            return None, None, "Nota fuera de rango (1 a 10)"
         valor = str(n).rstrip("0").rstrip(".")
 
     # ✅ KEY: ahora incluye anio (para que el GET por año encuentre)
@@ -2851,23 +2926,155 @@ def api_calificaciones_upsert():
         "trimestre": trimestre,
         "anio": anio,
     }
+    campos = {
+        "escala": escala,
+        "valor": valor,
+        "desaprobado": es_desaprobado(escala, valor),  # para el resumen (sin re-parsear)
+        "observaciones": observaciones,
+        "curso": curso,
+        "curso_key": curso_key(curso) if curso else "",
+        "anio": anio,
+    }
+    return key, campos, None
 
-    COL_CALIFICACIONES.update_one(
-        key,
-        {"$set": {
-            "escala": escala,
-            "valor": valor,
-            "observaciones": observaciones,
-            "curso": curso,
-            "anio": anio,
-            "updated_at": datetime.utcnow()
-        }, "$setOnInsert": {"created_at": datetime.utcnow()}},
-        upsert=True
-    )
+def _completar_curso_calificaciones(items):
+    """
+    items: [(key, campos)] validados. Las notas que no traen curso toman el curso
+    actual del alumno (1 sola consulta $in), así toda nota queda con curso_key.
+    """
+    faltan = [(key, campos) for key, campos in items if not campos.get("curso")]
+    if not faltan:
+        return
+    oids = []
+    for key, _ in faltan:
+        try:
+            oids.append(ObjectId(key["alumno_id"]))
+        except Exception:
+            pass
+    cursos = {
+        str(a["_id"]): (a.get("curso") or "").strip()
+        for a in COL_ALUMNOS.find({"_id": {"$in": oids}}, {"curso": 1})
+    }
+    for key, campos in faltan:
+        curso = cursos.get(key["alumno_id"], "")
+        if curso:
+            campos["curso"] = curso
+            campos["curso_key"] = curso_key(curso)
+
+def _update_calificacion(campos):
+    ahora = datetime.utcnow()
+    return {"$set": {**campos, "updated_at": ahora}, "$setOnInsert": {"created_at": ahora}}
+
+@app.route("/api/calificaciones", methods=["POST"])
+def api_calificaciones_upsert():
+    data = request.get_json(silent=True) or {}
+
+    key, campos, error = _validar_calificacion(data)
+    if error:
+        return jsonify({"error": error}), 400
+    _completar_curso_calificaciones([(key, campos)])
 
-    cal = COL_CALIFICACIONES.find_one(key)
+    # upsert y eco en 1 sola ida (índice único clave_calificacion)
+    try:
+        cal = COL_CALIFICACIONES.find_one_and_update(
+            key, _update_calificacion(campos), upsert=True, return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        # otro request insertó la misma clave en el medio: ahora existe, se actualiza
+        cal = COL_CALIFICACIONES.find_one_and_update(
+            key, _update_calificacion(campos), return_document=ReturnDocument.AFTER
+        )
+    METADATOS.invalidar("calificaciones")
     return jsonify(to_json(cal))
 
+CALIFICACIONES_LOTE_MAX = 2000
+
+@app.route("/api/calificaciones/lote", methods=["POST"])
+def api_calificaciones_lote():
+    """
+    Carga de una grilla completa (alumno × asignatura × trimestre) en 1 bulk_write.
+
+    Body: {"docente_id", "anio", "curso", "trimestre", "escala",
+           "celdas": [{"alumno_id", "asignatura", "valor", ...}, ...]}
+    Los campos de afuera valen para todas las celdas salvo que la celda traiga el suyo.
+
+    Devuelve {"ok", "insertadas", "actualizadas", "errores",
+              "resultados": [{"i", "estado": "insertada"|"actualizada"|"error", "id"?, "error"?}]}
+    """
+    data = request.get_json(silent=True) or {}
+    celdas = data.get("celdas")
+    if not isinstance(celdas, list) or not celdas:
+        return jsonify({"ok": False, "error": "celdas requeridas"}), 400
+    if len(celdas) > CALIFICACIONES_LOTE_MAX:
+        return jsonify({"ok": False, "error": f"máximo {CALIFICACIONES_LOTE_MAX} celdas por lote"}), 400
+
+    comunes = {k: v for k, v in data.items() if k != "celdas"}
+    resultados = [None] * len(celdas)
+    validas = []  # (i, key, campos)
+    vistas = {}
+
+    for i, celda in enumerate(celdas):
+        key, campos, error = _validar_calificacion({**comunes, **(celda if isinstance(celda, dict) else {})})
+        if error:
+            resultados[i] = {"i": i, "estado": "error", "error": error}
+            continue
+        clave = tuple(key.values())
+        if clave in vistas:
+            resultados[i] = {"i": i, "estado": "error", "error": f"Repetida (celda {vistas[clave]})"}
+            continue
+        vistas[clave] = i
+        validas.append((i, key, campos))
+
+    _completar_curso_calificaciones([(key, campos) for _, key, campos in validas])
+    ops = [UpdateOne(key, _update_calificacion(campos), upsert=True) for _, key, campos in validas]
+    op_celda = [i for i, _, _ in validas]  # op_celda[j] = índice de la celda de ops[j]
+
+    def aplicar(indices_ops):
+        """bulk_write desordenado; devuelve ({j: _id upserted}, {j: (code, errmsg)})."""
+        try:
+            res = COL_CALIFICACIONES.bulk_write([ops[j] for j in indices_ops], ordered=False)
+            upserted = res.upserted_ids
+            errores = {}
+        except BulkWriteError as e:
+            upserted = {u["index"]: u["_id"] for u in e.details.get("upserted", [])}
+            errores = {w["index"]: (w.get("code"), w.get("errmsg", "")) for w in e.details.get("writeErrors", [])}
+        return (
+            {indices_ops[k]: v for k, v in upserted.items()},
+            {indices_ops[k]: v for k, v in errores.items()},
+        )
+
+    upserted, errores = aplicar(list(range(len(ops)))) if ops else ({}, {})
+    # E11000: otra carga insertó la misma clave en el medio; al reintentar ya existe y se actualiza
+    reintentar = [j for j, (code, _) in errores.items() if code == 11000]
+    if reintentar:
+        up2, err2 = aplicar(reintentar)
+        upserted.update(up2)
+        for j in reintentar:
+            errores.pop(j, None)
+        errores.update(err2)
+
+    for j, i in enumerate(op_celda):
+        if j in errores:
+            resultados[i] = {"i": i, "estado": "error", "error": errores[j][1]}
+        elif j in upserted:
+            resultados[i] = {"i": i, "estado": "insertada", "id": str(upserted[j])}
+        else:
+            resultados[i] = {"i": i, "estado": "actualizada"}
+
+    if upserted:
+        METADATOS.invalidar("calificaciones")
+
+    cuenta = defaultdict(int)
+    for r in resultados:
+        cuenta[r["estado"]] += 1
+    return jsonify({
+        "ok": cuenta["error"] == 0,
+        "insertadas": cuenta["insertada"],
+        "actualizadas": cuenta["actualizada"],
+        "errores": cuenta["error"],
+        "resultados": resultados,
+    })
+
 
 @app.route("/api/calificaciones/<id>", methods=["DELETE"])
 def api_calificaciones_delete(id):
@@ -2890,6 +3097,15 @@ def eoe_ausentismo():
     except Exception:
         anio_sel_int = anio_actual
 
+    mes_sel = request.args.get("mes", type=int) or mes_actual
+    if not 1 <= mes_sel <= 12:
+        mes_sel = mes_actual
+
+    # ventana de tendencia: últimos N meses (dentro del año) terminando en mes_sel
+    ventana = request.args.get("ventana", type=int) or 1
+    ventana = max(1, min(ventana, mes_sel))
+    meses_ventana = list(range(mes_sel - ventana + 1, mes_sel + 1))
+
     # selector de años
     anios = list(range(anio_actual, anio_actual - 6, -1))
 
@@ -2907,26 +3123,37 @@ def eoe_ausentismo():
 }
 
     # cursos para el combo: SOLO del año seleccionado
-    cursos_raw = COL_ALUMNOS.distinct("curso", query_base)
+    cursos_raw = cursos_alumnos(query_base)
     cursos_norm = sorted({normalizar_curso(c) for c in cursos_raw if normalizar_curso(c)})
 
     # query final
     query = dict(query_base)
 
     if curso_sel:
-        # tolerante: si en DB hay "4°B" y "4°B°", matcheamos ambos
-        query["curso"] = {"$in": [curso_sel, curso_sel + "°"]}
+        # curso_key ya es tolerante a "4°B" / "4°B°" / "4 B"
+        query["curso_key"] = curso_key(curso_sel)
 
-    alumnos_raw = list(COL_ALUMNOS.find(query).sort([("apellido", 1), ("nombre", 1)]))
+    alumnos_raw = list(COL_ALUMNOS.find(
+        query, {"apellido": 1, "nombre": 1, "curso": 1}
+    ).sort([("apellido", 1), ("nombre", 1)]))
+
+    # todas las alertas de la ventana en un solo lote
+    alertas = alertas_ausentismo_lote([a["_id"] for a in alumnos_raw], anio_sel_int, meses_ventana)
+    vacio = {"alerta": None, "ausentes": 0, "accion": ""}
 
     alumnos_con_datos = []
     for alu in alumnos_raw:
-        alerta, total_faltas, accion = obtener_alerta_ausentismo(str(alu["_id"]), mes_actual, anio_sel_int)
+        por_mes = alertas.get(str(alu["_id"]), {})
+        actual = por_mes.get(mes_sel, vacio)
 
         alu["curso"] = normalizar_curso(alu.get("curso", ""))
-        alu["total_faltas"] = total_faltas
-        alu["alerta_texto"] = alerta or "Sin alerta"
-        alu["accion_realizada"] = accion or ""
+        alu["total_faltas"] = actual["ausentes"]
+        alu["alerta_texto"] = actual["alerta"] or "Sin alerta"
+        alu["accion_realizada"] = actual["accion"] or ""
+        alu["tendencia"] = [
+            {"mes": m, "ausentes": por_mes.get(m, vacio)["ausentes"], "alerta": por_mes.get(m, vacio)["alerta"]}
+            for m in meses_ventana
+        ]
         alumnos_con_datos.append(alu)
 
     return render_template(
@@ -2937,8 +3164,10 @@ def eoe_ausentismo():
         anios=anios,
         anio_sel=anio_sel_int,
         hoy=hoy.strftime("%d/%m/%Y"),
-        hoy_mes=mes_actual,
-        hoy_anio=anio_sel_int
+        hoy_mes=mes_sel,
+        hoy_anio=anio_sel_int,
+        ventana=ventana,
+        meses_ventana=meses_ventana,
     )
 
 
@@ -2956,23 +3185,25 @@ def guardar_accion_ausentismo():
             "month": mes
         },
         {
-            "$set": {"accion_realizada": accion}
+            "$set": {"accion_realizada": accion},
+            "$setOnInsert": campos_mes(DIAS_VACIOS),
         },
         upsert=True
     )
 
     # volver al listado conservando filtros
     curso = request.form.get("curso_sel", "")
-    return redirect(url_for("eoe_ausentismo", anio=anio, curso=curso))
+    ventana = request.form.get("ventana", type=int) or 1
+    return redirect(url_for("eoe_ausentismo", anio=anio, curso=curso, mes=mes, ventana=ventana))
 
 @app.route('/eoe/judiciales')
 def eoe_judiciales():
     curso_sel = request.args.get('curso', '')
-    cursos = sorted(COL_ALUMNOS.distinct("curso"))
+    cursos = sorted(cursos_alumnos())
 
     query = {"historico": {"$ne": True}}
     if curso_sel:
-        query["curso"] = curso_sel
+        query["curso_key"] = curso_key(curso_sel)
 
     alumnos = list(COL_ALUMNOS.find(query).sort([("apellido", 1), ("nombre", 1)]))
 
@@ -3019,10 +3250,15 @@ def actualizar_judicial():
     campo = data.get("campo") # ej: 'causa_judicial'
     valor = data.get("valor")
     
-    COL_ALUMNOS.update_one(
+    antes = COL_ALUMNOS.find_one_and_update(
         {"_id": ObjectId(id_alumno)},
-        {"$set": {campo: valor}}
+        {"$set": {campo: valor}},
+        projection=PROYECCION_MATRICULA,
     )
+    if antes and campo in CAMPOS_MATRICULA:
+        _alumno_cambio(antes, {**antes, campo: valor})
+    else:
+        DEMOGRAFIA.invalidar()
     return jsonify({"status": "ok"})
 # ==============================
 # ESTUDIANTES · MERCADERÍA / LISTAS / PROM-REC
@@ -3037,10 +3273,10 @@ def entrega_mercaderia_view():
 
     alumnos_q = {"activo": {"$ne": False}}
     if curso_filtrado:
-        alumnos_q["curso"] = curso_filtrado
+        alumnos_q["curso_key"] = curso_key(curso_filtrado)
 
-    alumnos = list(
-        COL_ALUMNOS.find(alumnos_q).sort([("curso", 1), ("apellido", 1), ("nombre", 1)])
+    alumnos = documentos("entrega_mercaderia.html",
+        COL_ALUMNOS.find(alumnos_q, proyeccion("entrega_mercaderia.html")).sort([("curso", 1), ("apellido", 1), ("nombre", 1)])
     )
 
     periodos = periodos_mar2026_feb2027()
@@ -3060,10 +3296,7 @@ def entrega_mercaderia_view():
 
     # Para el dropdown: siempre mostrar todos los cursos existentes (aunque estés filtrando)
     # Si preferís que muestre solo los cursos del filtro, avisame.
-    todos = list(
-        COL_ALUMNOS.find({"activo": {"$ne": False}}, {"curso": 1}).sort([("curso", 1)])
-    )
-    cursos_unicos = sorted({(x.get("curso") or "").strip() for x in todos if (x.get("curso") or "").strip()}, key=ordenar_curso_key)
+    cursos_unicos = sorted({(c or "").strip() for c in cursos_alumnos({"activo": {"$ne": False}}) if (c or "").strip()}, key=ordenar_curso_key)
 
     cursos_ordenados = sorted(grupos.keys(), key=ordenar_curso_key)
 
@@ -3125,10 +3358,10 @@ def listas_estudiantes_view():
 
     q = {"activo": {"$ne": False}, **filtro_anio}
     if curso_filtrado:
-        q["curso"] = curso_filtrado
+        q["curso_key"] = curso_key(curso_filtrado)
 
-    alumnos = list(
-        COL_ALUMNOS.find(q).sort([("curso", 1), ("apellido", 1), ("nombre", 1)])
+    alumnos = documentos("listas.html",
+        COL_ALUMNOS.find(q, proyeccion("listas.html")).sort([("curso", 1), ("apellido", 1), ("nombre", 1)])
     )
 
     grupos = {}
@@ -3136,14 +3369,11 @@ def listas_estudiantes_view():
         curso = (a.get("curso") or "").strip()
         grupos.setdefault(curso, []).append(a)
 
-    todos = list(
-        COL_ALUMNOS.find({"activo": {"$ne": False}, **filtro_anio}, {"curso": 1}).sort([("curso", 1)])
-    )
-    cursos_unicos = sorted({(x.get("curso") or "").strip() for x in todos if (x.get("curso") or "").strip()}, key=ordenar_curso_key)
+    cursos_unicos = sorted({(c or "").strip() for c in cursos_alumnos({"activo": {"$ne": False}, **filtro_anio}) if (c or "").strip()}, key=ordenar_curso_key)
 
     cursos_ordenados = sorted(grupos.keys(), key=ordenar_curso_key)
 
-    anios_disponibles = sorted({int(y) for y in COL_ALUMNOS.distinct("anio_lectivo") if str(y).isdigit()}) or [2025, 2026, 2027]
+    anios_disponibles = anios_lectivos_alumnos()
 
     return render_template(
         "listas.html",
@@ -3165,10 +3395,11 @@ def prom_rec_view():
 
     q = {"activo": {"$ne": False}}
     if curso_filtrado:
-        q["curso"] = curso_filtrado
+        q["curso_key"] = curso_key(curso_filtrado)
 
-    alumnos = list(
-        COL_ALUMNOS.find(q).sort([("curso", 1), ("apellido", 1), ("nombre", 1)])
+    campo = promocion.campo_estado(ANIO_MATRICULA)
+    alumnos = documentos("prom_rec.html",
+        COL_ALUMNOS.find(q, {**proyeccion("prom_rec.html"), campo: 1}).sort([("curso", 1), ("apellido", 1), ("nombre", 1)])
     )
 
     grupos = {}
@@ -3176,10 +3407,7 @@ def prom_rec_view():
         curso = (a.get("curso") or "").strip()
         grupos.setdefault(curso, []).append(a)
 
-    todos = list(
-        COL_ALUMNOS.find({"activo": {"$ne": False}}, {"curso": 1}).sort([("curso", 1)])
-    )
-    cursos_unicos = sorted({(x.get("curso") or "").strip() for x in todos if (x.get("curso") or "").strip()}, key=ordenar_curso_key)
+    cursos_unicos = sorted({(c or "").strip() for c in cursos_alumnos({"activo": {"$ne": False}}) if (c or "").strip()}, key=ordenar_curso_key)
 
     cursos_ordenados = sorted(grupos.keys(), key=ordenar_curso_key)
 
@@ -3188,7 +3416,9 @@ def prom_rec_view():
         grupos=grupos,
         cursos_ordenados=cursos_ordenados,
         cursos_unicos=cursos_unicos,
-        curso_filtrado=curso_filtrado
+        curso_filtrado=curso_filtrado,
+        anio=ANIO_MATRICULA,
+        campo_estado=campo,
     )
 
 
@@ -3214,7 +3444,7 @@ def prom_rec_guardar():
 
     res = COL_ALUMNOS.update_one(
         {"_id": oid},
-        {"$set": {"prom_rec_2026_2027": valor, "updated_at": datetime.utcnow()}}
+        {"$set": {promocion.campo_estado(ANIO_MATRICULA): valor, "updated_at": datetime.utcnow()}}
     )
 
     if res.matched_count == 0:
@@ -3227,12 +3457,11 @@ def prom_rec_guardar():
 @app.route("/asistencia", methods=["GET"])
 def seleccionar_asistencia():
     """Redirige al mes y curso por defecto."""
-    COL_ALUMNOS = app.mongo.alumnos 
     
     today_date = date.today()
     
     # Obtener el primer curso disponible para redirigir
-    cursos_disponibles = COL_ALUMNOS.distinct("curso", filtro_activos())
+    cursos_disponibles = cursos_alumnos(filtro_activos())
     primer_curso = sorted(cursos_disponibles)[0] if cursos_disponibles else "1°A"
     
     return redirect(url_for(
@@ -3242,6 +3471,237 @@ def seleccionar_asistencia():
         month=today_date.month
     ))
 
+def _guardar_asistencia_mensual(form, curso, year, month):
+    """
+    Guarda la grilla de asistencia del mes en UNA sola escritura masiva.
+
+    Lee los documentos del mes (ver asistencia_mes.py) de los alumnos del
+    formulario y, por cada alumno con celdas cambiadas, reescribe su string
+    'dias' y los contadores en un UpdateOne (upsert si no tenía documento;
+    una celda vaciada vuelve a '-'). Devuelve:
+      {"ok", "guardados", "sin_cambios", "errores": [{"alumno_id", "fecha", "valor", "error"}]}
+    """
+    hoy = date.today()
+    inicio = date(year, month, 1)
+    fin = inicio + relativedelta(months=1) - timedelta(days=1)
+
+    errores = []
+    celdas = {}   # (alumno_oid, fecha_iso) -> estado
+
+    for key, value in form.items():
+        if not key.startswith("asistencia_"):
+            continue
+
+        # asistencia_<alumno_id>_<YYYY-MM-DD>  (solo 3 partes)
+        parts = key.split("_", 2)
+        alumno_id_str = parts[1] if len(parts) > 1 else ""
+        fecha_iso = parts[2] if len(parts) > 2 else ""
+        estado = (value or "").upper().strip()
+        err = {"alumno_id": alumno_id_str, "fecha": fecha_iso, "valor": estado}
+
+        try:
+            alumno_oid = ObjectId(alumno_id_str)
+        except Exception:
+            errores.append({**err, "error": "alumno_invalido"})
+            continue
+
+        try:
+            dia_dt = date.fromisoformat(fecha_iso)
+        except ValueError:
+            errores.append({**err, "error": "fecha_invalida"})
+            continue
+
+        if not (inicio <= dia_dt <= fin):
+            errores.append({**err, "error": "fuera_del_mes"})
+            continue
+
+        # ✅ BLOQUEO BACKEND: no permitir guardar días futuros
+        if dia_dt > hoy:
+            errores.append({**err, "error": "dia_futuro"})
+            continue
+
+        if estado not in ("P", "A", "X", ""):
+            errores.append({**err, "error": "estado_invalido"})
+            continue
+
+        celdas[(alumno_oid, fecha_iso)] = estado
+
+    if not celdas:
+        return {"ok": not errores, "guardados": 0, "sin_cambios": 0, "errores": errores}
+
+    # Documentos del mes de esos alumnos (1 consulta)
+    alumno_oids = list({aid for aid, _ in celdas})
+    guardado = {
+        d["alumno_id"]: d
+        for d in COL_ASISTENCIAS.find(
+            {"alumno_id": {"$in": alumno_oids}, "year": year, "month": month},
+            {"alumno_id": 1, "dias": 1},
+        )
+    }
+
+    cambios = {}     # alumno_oid -> {dia: estado}
+    sin_cambios = 0
+    for (alumno_oid, fecha_iso), estado in celdas.items():
+        dia = int(fecha_iso[8:10])
+        doc = guardado.get(alumno_oid)
+        actual = normalizar_dias(doc.get("dias") if doc else None)[dia - 1]
+        if (estado or "-") == actual:
+            sin_cambios += 1
+            continue
+        cambios.setdefault(alumno_oid, {})[dia] = estado
+
+    ops = []
+    ops_alumnos = []
+    for alumno_oid, por_dia in cambios.items():
+        doc = guardado.get(alumno_oid)
+        nuevos = {**campos_mes(con_cambios(doc.get("dias") if doc else None, por_dia)),
+                  "curso": curso, "updated_at": datetime.utcnow()}
+        if doc:
+            # Sólo si nadie cambió el mes desde que lo leímos (control optimista)
+            ops.append(UpdateOne({"_id": doc["_id"], "dias": doc.get("dias")}, {"$set": nuevos}))
+        else:
+            ops.append(UpdateOne({"alumno_id": alumno_oid, "year": year, "month": month},
+                                 {"$set": nuevos}, upsert=True))
+        ops_alumnos.append(alumno_oid)
+
+    def _errores_de(alumno_oid, error):
+        return [
+            {"alumno_id": str(alumno_oid), "fecha": date(year, month, d).isoformat(), "valor": e, "error": error}
+            for d, e in cambios[alumno_oid].items()
+        ]
+
+    guardados = sum(len(c) for c in cambios.values())
+    if ops:
+        # Cada documento (celdas + contadores) se escribe entero en una sola operación atómica
+        try:
+            res = COL_ASISTENCIAS.bulk_write(ops, ordered=False)
+            escritos = res.matched_count + res.upserted_count
+        except BulkWriteError as bwe:
+            fallidos = set()
+            for we in bwe.details.get("writeErrors", []):
+                fallidos.add(ops_alumnos[we["index"]])
+                errores.extend(_errores_de(ops_alumnos[we["index"]], we.get("errmsg", "error_escritura")))
+            guardados -= sum(len(cambios[a]) for a in fallidos)
+            escritos = None
+
+        if escritos is not None and escritos < len(ops):
+            # Algún mes cambió entre la lectura y la escritura: se informa en vez de pisarlo
+            actuales = {
+                d["alumno_id"]: d.get("dias")
+                for d in COL_ASISTENCIAS.find(
+                    {"alumno_id": {"$in": ops_alumnos}, "year": year, "month": month},
+                    {"alumno_id": 1, "dias": 1},
+                )
+            }
+            for alumno_oid in ops_alumnos:
+                esperado = con_cambios(guardado[alumno_oid].get("dias") if alumno_oid in guardado else None,
+                                       cambios[alumno_oid])
+                if actuales.get(alumno_oid) != esperado:
+                    errores.extend(_errores_de(alumno_oid, "modificado_por_otro_usuario"))
+                    guardados -= len(cambios[alumno_oid])
+
+    return {"ok": not errores, "guardados": guardados, "sin_cambios": sin_cambios, "errores": errores}
+
+def _resumenes_asistencia(alumno_ids, year, month):
+    """
+    Lee los documentos mensuales del año de los alumnos en UNA consulta indexada
+    (≤ 12 por alumno) y devuelve:
+      - asistencia_map:    {alumno_id: {fecha_iso: estado}} del mes (para la grilla)
+      - resumen_semanal:   {alumno_id: {semana: {"P","A","D"}}} del mes
+      - resumen_trimestre: {alumno_id: {"P","A","D"}} del trimestre del mes
+      - resumen_anual:     {alumno_id: {"P","A","D"}} del año
+    Trimestre y año salen de los contadores guardados en cada documento.
+    """
+    # Trimestre actual (1: meses 1-3, 2: 4-6, 3: 7-9, 4: 10-12)
+    tri_start_month = ((month - 1) // 3) * 3 + 1
+
+    asistencia_map = {}
+    resumen_semanal = {}
+    resumen_trimestre = {}
+    resumen_anual = {}
+
+    docs = COL_ASISTENCIAS.find(
+        {"alumno_id": {"$in": alumno_ids}, "year": year},
+        {"_id": 0, "alumno_id": 1, "month": 1, "dias": 1, "presentes": 1, "ausentes": 1},
+    )
+    for doc in docs:
+        aid = str(doc["alumno_id"])
+        mes = doc.get("month")
+        if "presentes" not in doc:
+            doc.update(resumen_de_dias(doc.get("dias")))  # documento viejo sin migrar
+
+        totales = [resumen_anual.setdefault(aid, {"P": 0, "A": 0, "D": 0})]
+        if tri_start_month <= mes <= tri_start_month + 2:
+            totales.append(resumen_trimestre.setdefault(aid, {"P": 0, "A": 0, "D": 0}))
+        for t in totales:
+            t["P"] += doc["presentes"]
+            t["A"] += doc["ausentes"]
+            t["D"] = t["P"] + t["A"]
+
+        if mes != month:
+            continue
+
+        asistencia_map[aid] = decodificar(doc.get("dias"), year, month)
+        semanas = resumen_semanal.setdefault(aid, {})
+        for i, c in enumerate(normalizar_dias(doc.get("dias"))):
+            if c in ("P", "A"):
+                info = semanas.setdefault(i // 7 + 1, {"P": 0, "A": 0, "D": 0})
+                info[c] += 1
+                info["D"] = info["P"] + info["A"]
+
+    return asistencia_map, resumen_semanal, resumen_trimestre, resumen_anual
+
+@app.cli.command("migrar-asistencia-mensual")
+@click.option("--dry-run", is_flag=True, help="Sólo cuenta, no escribe.")
+def cli_migrar_asistencia_mensual(dry_run):
+    """
+    Pasa la asistencia al formato de 1 documento por alumno y mes (ver asistencia_mes.py):
+    funde los registros diarios {alumno_id, fecha, estado} y los 'dias' dict viejos en
+    el string de 31 códigos, recalcula contadores y borra los registros diarios migrados.
+    """
+    meses = {}   # (alumno_id, year, month) -> {"dias": str, "curso": str}
+
+    def _mes(clave):
+        return meses.setdefault(clave, {"dias": DIAS_VACIOS, "curso": None})
+
+    # 1) documentos mensuales existentes (dict viejo o string)
+    for doc in COL_ASISTENCIAS.find({"year": {"$exists": True}}, {"alumno_id": 1, "year": 1, "month": 1, "dias": 1}):
+        m = _mes((doc["alumno_id"], int(doc["year"]), int(doc["month"])))
+        m["dias"] = normalizar_dias(doc.get("dias"))
+
+    # 2) registros diarios: pisan al dict viejo (son los que escribía la grilla)
+    diarios = 0
+    cursor = COL_ASISTENCIAS.find(
+        {"fecha": {"$exists": True}}, {"alumno_id": 1, "fecha": 1, "estado": 1, "curso": 1}
+    ).sort([("alumno_id", 1), ("fecha", 1)])
+    for reg in cursor:
+        f = _parse_date(reg.get("fecha"))
+        if not f:
+            continue
+        m = _mes((reg["alumno_id"], f.year, f.month))
+        m["dias"] = con_cambios(m["dias"], {f.day: str(reg.get("estado") or "").upper()})
+        m["curso"] = reg.get("curso") or m["curso"]
+        diarios += 1
+
+    click.echo(f"Meses a escribir: {len(meses)} (registros diarios: {diarios})")
+    if dry_run:
+        return
+
+    ops = []
+    for (alumno_id, y, mth), m in meses.items():
+        nuevos = {**campos_mes(m["dias"]), "updated_at": datetime.utcnow()}
+        if m["curso"]:
+            nuevos["curso"] = m["curso"]
+        ops.append(UpdateOne({"alumno_id": alumno_id, "year": y, "month": mth}, {"$set": nuevos}, upsert=True))
+        if len(ops) >= 1000:
+            COL_ASISTENCIAS.bulk_write(ops, ordered=False)
+            ops = []
+    if ops:
+        COL_ASISTENCIAS.bulk_write(ops, ordered=False)
+
+    borrados = COL_ASISTENCIAS.delete_many({"fecha": {"$exists": True}, "year": {"$exists": False}}).deleted_count
+    click.echo(f"Migración lista: {len(meses)} meses, {borrados} registros diarios borrados.")
+
 @app.route('/asistencia/<curso>/<int:year>/<int:month>', methods=['GET', 'POST'])
 def asistencia_mensual(curso, year, month):
     """
@@ -3249,7 +3709,7 @@ def asistencia_mensual(curso, year, month):
     """
 
     # Cursos disponibles para el selector
-    cursos = sorted([c for c in COL_ALUMNOS.distinct("curso", filtro_activos()) if c])
+    cursos = sorted([c for c in cursos_alumnos(filtro_activos()) if c])
 
     # Obtener días hábiles
     try:
@@ -3284,48 +3744,17 @@ def asistencia_mensual(curso, year, month):
     # ----------------------------------------------------------------------
     if request.method == 'POST':
 
-        hoy = date.today()
-
-        for key, value in request.form.items():
-            if not key.startswith('asistencia_'):
-                continue
-
-            try:
-                # asistencia_<alumno_id>_<YYYY-MM-DD>
-                parts = key.split('_', 2)  # <-- IMPORTANTE: solo 3 partes
-                alumno_id_str = parts[1]
-                asistencia_date_iso = parts[2]
-
-                # Parseo seguro de fecha
-                try:
-                    dia_dt = date.fromisoformat(asistencia_date_iso)
-                except ValueError:
-                    print(f"[WARN ASISTENCIA] Fecha inválida en key: {key}")
-                    continue
-
-                # ✅ BLOQUEO BACKEND: no permitir guardar días futuros
-                if dia_dt > hoy:
-                    # Si querés, podés loguearlo para ver cuándo pasa
-                    print(f"[INFO ASISTENCIA] Se ignoró día futuro {asistencia_date_iso} (hoy={hoy.isoformat()})")
-                    continue
-
-                estado = (value or "").upper().strip()
-
-                query = {
-                    'alumno_id': ObjectId(alumno_id_str),
-                    'fecha': asistencia_date_iso,
-                }
+        resultado = _guardar_asistencia_mensual(request.form, curso, year, month)
 
-                if estado in ['P', 'A', 'X']:
-                    update = {'$set': {'estado': estado, "curso": curso}}
-                    COL_ASISTENCIA.update_one(query, update, upsert=True)
+        # Respuesta estructurada para clientes JSON (fetch/axios)
+        if request.accept_mimetypes.best == "application/json":
+            return jsonify(resultado), (200 if resultado["ok"] else 207)
 
-                elif estado == '':
-                    COL_ASISTENCIA.delete_one(query)
-
-            except Exception as e:
-                print(f"[ERROR ASISTENCIA] clave '{key}' valor '{value}': {e}")
-                continue
+        if resultado["errores"]:
+            detalle = ", ".join(f"{e['alumno_id']} {e['fecha']}: {e['error']}" for e in resultado["errores"][:10])
+            flash(f"⚠️ No se guardaron {len(resultado['errores'])} celdas ({detalle}).", "warning")
+        else:
+            flash(f"✅ Asistencia guardada ({resultado['guardados']} cambios).", "success")
 
         # Post-Redirect-Get
         return redirect(url_for('asistencia_mensual', curso=curso, year=year, month=month))
@@ -3335,38 +3764,15 @@ def asistencia_mensual(curso, year, month):
     # ----------------------------------------------------------------------
 
     # Alumnos ordenados por apellido
-    alumnos = list(COL_ALUMNOS.find({**filtro_activos(), "curso": curso}).sort("apellido", 1))
-
-    # Rango de fechas del mes
-    start_date = date(year, month, 1)
-    last_day_of_month = date(year, month, 1) + relativedelta(months=1) - timedelta(days=1)
-
-    start_date_iso = start_date.isoformat()
-    end_date_iso = last_day_of_month.isoformat()
+    alumnos = list(COL_ALUMNOS.find({**filtro_activos(), "curso_key": curso_key(curso)}).sort("apellido", 1))
 
-    # Obtener asistencias del mes (lista, no cursor)
     alumno_ids = [a["_id"] for a in alumnos]  # alumnos ya es la lista del curso actual
 
-    asistencias_mes = list(COL_ASISTENCIA.find({
-    'alumno_id': {'$in': alumno_ids},
-    'fecha': {'$gte': start_date_iso, '$lte': end_date_iso}
-}))
-
-    # Mapeo: alumno → {fecha → estado}
-    asistencia_map = {}
-    for reg in asistencias_mes:
-        try:
-            fecha_iso = reg['fecha']
-            alumno_id = str(reg['alumno_id'])
-
-            if alumno_id not in asistencia_map:
-                asistencia_map[alumno_id] = {}
-
-            asistencia_map[alumno_id][fecha_iso] = reg.get('estado', '')
-
-        except Exception as e:
-            print(f"ERROR MAPEO ASISTENCIA: {e}")
-            continue
+    # Celdas del mes + resúmenes semanal / trimestral / anual en 1 sola consulta
+    # de los documentos mensuales del año
+    asistencia_map, resumen_semanal, resumen_trimestre, resumen_anual = _resumenes_asistencia(
+        alumno_ids, year, month
+    )
 
     # Unir alumnos con sus asistencias
     alumnos_con_asistencia = []
@@ -3375,35 +3781,7 @@ def asistencia_mensual(curso, year, month):
         alumno['asistencia_mensual'] = asistencia_map.get(alumno_id, {})
         alumnos_con_asistencia.append(alumno)
 
-    # ------------------------------------------------------------------
-    #                     RESUMEN SEMANAL (MES ACTUAL)
-    # ------------------------------------------------------------------
-    resumen_semanal = {}   # {alumno_id: {semana: {"P":x,"A":y,"D":z}}}
-    max_semana = 0
-
-    for reg in asistencias_mes:
-        try:
-            estado = reg.get('estado', '') 
-            if estado not in ('P', 'A'):
-                continue
-
-            fecha_iso = reg['fecha']
-            fecha = date.fromisoformat(fecha_iso)
-            semana = (fecha.day - 1) // 7 + 1  # Semana 1..5
-
-            aid = str(reg['alumno_id'])
-            semanas_map = resumen_semanal.setdefault(aid, {})
-            info = semanas_map.setdefault(semana, {'P': 0, 'A': 0, 'D': 0})
-
-            info[estado] += 1
-            info['D'] += 1
-
-            if semana > max_semana:
-                max_semana = semana
-
-        except Exception as e:
-            print(f"ERROR RESUMEN SEMANAL: {e}")  
-            continue
+    max_semana = max((max(sem) for sem in resumen_semanal.values() if sem), default=0)
 
     # Si no hubo asistencias cargadas, igual determinamos cuántas semanas tiene el mes
     if max_semana == 0 and dias_habil_registrados:
@@ -3411,53 +3789,7 @@ def asistencia_mensual(curso, year, month):
     if max_semana == 0:
         max_semana = 4  # valor por defecto
 
-    # ------------------------------------------------------------------
-    #              RESÚMENES TRIMESTRAL Y ANUAL POR ALUMNO
-    # ------------------------------------------------------------------
-
-    # Trimestre actual (1: meses 1-3, 2: 4-6, 3: 7-9, 4: 10-12)
     trimestre_idx = (month - 1) // 3          # 0,1,2,3
-    tri_start_month = trimestre_idx * 3 + 1   # 1,4,7,10
-    tri_end_month = tri_start_month + 2       # 3,6,9,12
-
-    tri_start_date = date(year, tri_start_month, 1)
-    tri_end_date = date(year, tri_end_month, 1) + relativedelta(months=1) - timedelta(days=1)
-
-    year_start_date = date(year, 1, 1)
-    year_end_date = date(year, 12, 31)
-
-    # Asistencias del trimestre
-    tri_asist = COL_ASISTENCIA.find({
-    'alumno_id': {'$in': alumno_ids},
-    'fecha': {'$gte': tri_start_date.isoformat(), '$lte': tri_end_date.isoformat()}
-})
-
-    year_asist = COL_ASISTENCIA.find({ 
-    'alumno_id': {'$in': alumno_ids},
-    'fecha': {'$gte': year_start_date.isoformat(), '$lte': year_end_date.isoformat()}
-})
-
-
-    resumen_trimestre = {}  # {alumno_id: {"P":x, "A":y, "D":z}}
-    for reg in tri_asist:
-        aid = str(reg['alumno_id'])
-        estado = reg.get('estado', '')
-        if estado not in ('P', 'A'):
-            continue
-        info = resumen_trimestre.setdefault(aid, {'P': 0, 'A': 0, 'D': 0})
-        info[estado] += 1
-        info['D'] += 1
-
-    resumen_anual = {}      # {alumno_id: {"P":x, "A":y, "D":z}}
-    for reg in year_asist:
-        aid = str(reg['alumno_id'])
-        estado = reg.get('estado', '')
-        if estado not in ('P', 'A'): 
-            continue
-        info = resumen_anual.setdefault(aid, {'P': 0, 'A': 0, 'D': 0})
-        info[estado] += 1
-        info['D'] += 1
-
     numero_trimestre = trimestre_idx + 1
 
     # ----------------------------------------------------------------------
@@ -3522,7 +3854,7 @@ def calificaciones_gestion():
 def calificaciones_gestionar():
     # 1. Obtenemos listas básicas
     docentes = list(COL_DOCENTES.find().sort([("apellido", 1), ("nombre", 1)]))
-    cursos = sorted(COL_ALUMNOS.distinct("curso"))
+    cursos = sorted(cursos_alumnos())
     
     # 2. Definimos las asignaturas (asegurando que coincidan con tu lista)
     asignaturas = [
@@ -3567,6 +3899,16 @@ def parte_diario():
         mes = hoy.month
         anio = hoy.year
 
+    # Año completo en un solo reporte imprimible
+    if (request.args.get("meses") or "").strip().lower() == "all":
+        return render_template(
+            "parte_diario_anual.html",
+            anio=anio,
+            partes=calcular_matricula_anual(anio),
+            fecha_emision=today().strftime("%d/%m/%Y"),
+            volver_url=url_for("parte_diario", mes=mes, anio=anio),
+        )
+
     datos = calcular_matricula_mensual(mes, anio) 
 
     # Preparar el mes anterior y posterior para la navegación (flechitas)
@@ -3577,9 +3919,15 @@ def parte_diario():
     # Asignar URLs de navegación
     datos["mes_anterior_url"] = url_for("parte_diario", mes=mes_anterior.month, anio=mes_anterior.year)
     datos["mes_posterior_url"] = url_for("parte_diario", mes=mes_posterior.month, anio=mes_posterior.year)
+    datos["anual_url"] = url_for("parte_diario", anio=anio, meses="all")
 
     return render_template("parte_diario.html", **datos)
 
+def _ref_edades():
+    """30/06 del año EDADES_REF_ANIO (o del año actual): referencia de las edades en los resúmenes."""
+    ref_year = int(os.getenv("EDADES_REF_ANIO", datetime.now().year))
+    return date(ref_year, 6, 30)
+
 @app.route("/resumen/edades")
 def resumen_edades():
     """Cuadros-resumen por curso: edades, sexo, nacionalidades y recursantes.
@@ -3588,8 +3936,7 @@ def resumen_edades():
     usando como referencia el 30/06 del año configurado en EDADES_REF_ANIO
     (o el año actual por defecto).
     """
-    ref_year = int(os.getenv("EDADES_REF_ANIO", datetime.now().year))
-    ref_fecha = date(ref_year, 6, 30)
+    ref_fecha = _ref_edades()
 
     resumen = defaultdict(
         lambda: {
@@ -3600,14 +3947,16 @@ def resumen_edades():
         }
     )
 
-    for a in COL_ALUMNOS.find(filtro_activos()):
+    # Grupos (curso, sexo, nacionalidad, edad, recursante) -> n de la agregación cacheada
+    for g in DEMOGRAFIA.grupos(ref_fecha):
 
-        curso = (a.get("curso") or "").strip()
+        curso = g["curso"]
         if not curso:
             continue
+        n = g["n"]
 
         # Normalizar sexo
-        sexo_raw = (a.get("sexo") or "").strip().upper()
+        sexo_raw = g["sexo"]
         if sexo_raw.startswith("M"):
             sexo = "M"
         elif sexo_raw.startswith("F"):
@@ -3618,20 +3967,18 @@ def resumen_edades():
         r = resumen[curso]
 
         # Matrícula por sexo
-        r["sexo"][sexo] += 1
-        r["sexo"]["total"] += 1
+        r["sexo"][sexo] += n
+        r["sexo"]["total"] += n
 
-        # Edad al 30/06
-        fn = a.get("fecha_nacimiento")
-        edad = calcular_edad(fn, referencia=ref_fecha) if fn else None
+        # Edad al 30/06 (calculada en la agregación)
+        edad = g["edad"]
         if edad is not None:
             e_bucket = r["edades"][edad]
-            e_bucket[sexo] += 1
-            e_bucket["total"] += 1
+            e_bucket[sexo] += n
+            e_bucket["total"] += n
 
-        # Nacionalidad
-                # Nacionalidad (normalizada)
-        raw_nac = (a.get("nacionalidad") or "").strip()
+        # Nacionalidad (normalizada)
+        raw_nac = g["nacionalidad"]
         if not raw_nac:
             nac = "SIN DATO"
         else:
@@ -3642,14 +3989,13 @@ def resumen_edades():
                 nac = raw_nac  # se respeta el texto tal cual
 
         n_bucket = r["nacionalidades"][nac]
-        n_bucket[sexo] += 1
-        n_bucket["total"] += 1
-
+        n_bucket[sexo] += n
+        n_bucket["total"] += n
 
         # Recursantes
-        if a.get("recursante"):
-            r["recursantes"][sexo] += 1
-            r["recursantes"]["total"] += 1
+        if g["recursante"]:
+            r["recursantes"][sexo] += n
+            r["recursantes"]["total"] += n
 
     cursos = sorted(resumen.keys(), key=_orden_curso)
 
@@ -3665,20 +4011,18 @@ def resumen_nacionalidades():
     """
     Por curso, cuenta alumnos por nacionalidad (y sexo).
     """
-    alumnos = list(COL_ALUMNOS.find(filtro_activos()))
-
     # data[curso][nacionalidad][sexo] = count
     data = defaultdict(lambda: defaultdict(lambda: defaultdict(int)))
     cursos_set = set()
     nacs_set = set()
 
-    for a in alumnos:
-        curso = (a.get("curso") or "").strip()
+    # Mismos grupos cacheados que /resumen/edades (la edad acá no se usa)
+    for g in DEMOGRAFIA.grupos(_ref_edades()):
+        curso = g["curso"]
         if not curso:
             continue
         cursos_set.add(curso)
-        raw = (a.get("nacionalidad") or "").strip()
-        up = raw.upper().replace(".", "").strip()
+        up = g["nacionalidad"].upper().replace(".", "").strip()
 
         if not up:
             nac = "SIN DATO"
@@ -3689,11 +4033,11 @@ def resumen_nacionalidades():
 
         nacs_set.add(nac)
 
-        sexo = (a.get("sexo") or "").strip().upper()
+        sexo = g["sexo"]
         if sexo not in ("M", "F"):
             sexo = "X"
 
-        data[curso][nac][sexo] += 1
+        data[curso][nac][sexo] += g["n"]
 
     cursos = sorted(cursos_set)
     nacs = sorted(nacs_set)
@@ -3705,18 +4049,49 @@ def resumen_nacionalidades():
         nacs=nacs,
     )
 
-@app.route("/resumen/inasistencias")
-def resumen_inasistencias():
+def _resumen_ausencias_personal(tipo, anio):
+    """
+    Estadística anual (mensual, por persona y diaria) de 'docentes' o 'auxiliares'
+    con el motor de estadisticas_ausencias.py. Devuelve (personas, resultado).
+    - docentes: máscara según cargo + carga horaria (mascara_docente)
+    - auxiliares: concurren L-V
+    """
+    if tipo == "auxiliares":
+        personas = list(COL_AUX.find({}))
+        mascaras = [(str(p["_id"]), TODA_LA_SEMANA) for p in personas]
+        col, campo_id = COL_INASISTENCIAS_AUX, "auxiliar_id"
+    else:
+        personas = list(COL_DOCENTES.find({}))
+        mascaras = [(str(p["_id"]), mascara_docente(p)) for p in personas]
+        col, campo_id = COL_INASISTENCIAS, "docente_id"
+
+    ausencias = (
+        (str(x.get(campo_id) or ""), _parse_date(x.get("fecha")))
+        for x in col.find(
+            {"fecha": {"$gte": date(anio, 1, 1).isoformat(), "$lte": date(anio, 12, 31).isoformat()}},
+            {"_id": 0, campo_id: 1, "fecha": 1},
+        )
+    )
+    dias_habiles = [d for mes in range(1, 13) for d in CALENDARIO.dias_habiles(anio, mes)]
+
+    resultado = resumen_anual_ausencias(anio, mascaras, dias_habiles, ausencias)
+    for m in resultado["meses"]:
+        m["mes_nombre"] = MESES_MAYUS.get(m["mes"], str(m["mes"]))
+    return personas, resultado
+
+def _anio_param():
     anio_param = (request.args.get("anio") or "").strip()
     try:
-        anio = int(anio_param) if anio_param else date.today().year
+        return int(anio_param) if anio_param else date.today().year
     except ValueError:
-        anio = date.today().year
+        return date.today().year
 
-    # feriados + suspensiones para estadística
-    no_laborables = _no_laborables_set(anio)
+@app.route("/resumen/inasistencias")
+def resumen_inasistencias():
+    anio = _anio_param()
 
-    docentes = list(COL_DOCENTES.find({}))
+    # feriados + suspensiones para estadística: vienen de CALENDARIO (cacheado por año)
+    docentes, res = _resumen_ausencias_personal("docentes", anio)
     if not docentes:
         return render_template(
             "resumen_inasistencias.html",
@@ -3724,105 +4099,46 @@ def resumen_inasistencias():
             nota_dias_base="Días base: suma institucional de días programados de todos los docentes."
         )
 
-    desde_iso = date(anio, 1, 1).isoformat()
-    hasta_iso = date(anio, 12, 31).isoformat()
-    inas = list(COL_INASISTENCIAS.find({"fecha": {"$gte": desde_iso, "$lte": hasta_iso}}))
-
-    faltas_doc_mes = defaultdict(int)      # (docente_id_str, mes) -> cant
-    faltas_por_fecha = defaultdict(int)    # "YYYY-MM-DD" -> cant
-
-    for ins in inas:
-        f = _parse_date(ins.get("fecha"))
-        if not f:
-            continue
-        did = str(ins.get("docente_id") or "")
-        faltas_doc_mes[(did, f.month)] += 1
-        faltas_por_fecha[f.isoformat()] += 1
-
-    # -------- Mensual institucional --------
-    meses = []
-    for mes in range(1, 13):
-        dias_base_institucional = 0
-        faltas_total_mes = 0
-
-        for d in docentes:
-            did = str(d.get("_id"))
-            dias_base_institucional += dias_base_mes_para_docente(d, anio, mes, no_laborables=no_laborables)
-            faltas_total_mes += faltas_doc_mes.get((did, mes), 0)
-
-        pct = 0.0
-        if dias_base_institucional > 0:
-            pct = (faltas_total_mes / dias_base_institucional) * 100
-            pct = min(round(pct, 1), 100.0)
-
-        meses.append({
-            "mes": mes,
-            "mes_nombre": MESES_MAYUS.get(mes, str(mes)),
-            "faltas": faltas_total_mes,
-            "dias_base": dias_base_institucional,   # OJO: institucional
-            "porcentaje": pct,
-        })
-
     # -------- Ranking anual por docente (porcentaje real del docente) --------
     resumen_por_docente = []
-    for d in docentes:
-        did = str(d.get("_id"))
-
-        faltas_anual = 0
-        dias_prog_anual = 0
-
-        for mes in range(1, 13):
-            faltas_anual += faltas_doc_mes.get((did, mes), 0)
-            dias_prog_anual += dias_base_mes_para_docente(d, anio, mes, no_laborables=no_laborables)
-
-        pct = 0.0
-        if dias_prog_anual > 0:
-            pct = (faltas_anual / dias_prog_anual) * 100
-            pct = min(round(pct, 1), 100.0)
-
+    for d, r in zip(docentes, res["por_persona"]):
         resumen_por_docente.append({
             "apellido": d.get("apellido", ""),
             "nombre": d.get("nombre", ""),
             "cargo": d.get("cargo", ""),
-            "faltas": faltas_anual,
-            "dias_base": dias_prog_anual,   # del docente
-            "porcentaje": pct,
+            "faltas": r["faltas"],
+            "dias_base": r["dias_base"],   # del docente
+            "porcentaje": r["porcentaje"],
         })
 
     resumen_por_docente.sort(key=lambda x: x["porcentaje"], reverse=True)
 
-    # -------- Diario institucional (opcional para gráfico diario) --------
-    dias = []
-    for mes in range(1, 13):
-        for f in get_dias_habiles(anio, mes, no_laborables=no_laborables):
-            esperados = 0
-            for doc in docentes:
-                if docente_esperado_en_fecha(doc, f, no_laborables=no_laborables):
-                    esperados += 1
-
-            faltas_dia = faltas_por_fecha.get(f.isoformat(), 0)
-
-            pct_dia = 0.0
-            if esperados > 0:
-                pct_dia = (faltas_dia / esperados) * 100
-                pct_dia = min(round(pct_dia, 1), 100.0)
-
-            dias.append({
-                "fecha": f.isoformat(),
-                "faltas": faltas_dia,
-                "esperados": esperados,
-                "porcentaje": pct_dia,
-            })
-
     return render_template(
         "resumen_inasistencias.html",
         anio=anio,
-        meses=meses,
-        dias=dias,
+        meses=res["meses"],
+        dias=res["dias"],
         resumen_por_docente=resumen_por_docente,
         nota_dias_base="Días base (tabla mensual): suma institucional de días programados de todos los docentes (según cargo + carga horaria)."
     )
 
+@app.get("/api/resumen/inasistencias")
+def api_resumen_inasistencias():
+    """Mismo cálculo que /resumen/inasistencias en JSON. ?anio=2025&tipo=docentes|auxiliares"""
+    anio = _anio_param()
+    tipo = (request.args.get("tipo") or "docentes").strip().lower()
+    if tipo not in ("docentes", "auxiliares"):
+        return jsonify(ok=False, error="tipo debe ser 'docentes' o 'auxiliares'"), 400
+
+    personas, res = _resumen_ausencias_personal(tipo, anio)
+    for p, r in zip(personas, res["por_persona"]):
+        r["apellido"] = p.get("apellido", "")
+        r["nombre"] = p.get("nombre", "")
+        r["cargo"] = p.get("cargo", "")
+    res["por_persona"].sort(key=lambda x: x["porcentaje"], reverse=True)
+
+    return jsonify(ok=True, anio=anio, tipo=tipo, **res)
+
 # ----------------- RESUMEN CURSO -----------------
 @app.route("/api/resumen_curso")
 def api_resumen_curso():
@@ -3830,38 +4146,40 @@ def api_resumen_curso():
     if not curso:
         return jsonify({"error": "curso requerido"}), 400
 
-    q = {"curso": {"$regex": f"^{curso}$", "$options": "i"}}
-    alumnos = list(COL_ALUMNOS.find({**filtro_activos(), **q}))
-
+    key = curso_key(curso)
 
-    total = len(alumnos)
+    total = 0
     edades = {}
     nac = {}
     recursantes = 0
     sobreedad = 0
 
-    for a in alumnos:
-        edad = None
-        if a.get("fecha_nacimiento"):
-            edad = calcular_edad(a["fecha_nacimiento"])
-            if edad is not None:
-                edades[edad] = edades.get(edad, 0) + 1
+    # Grupos de la agregación cacheada (edad al 30/06 del año actual, como calcular_edad)
+    for g in DEMOGRAFIA.grupos(date(datetime.now().year, 6, 30)):
+        if g["curso_key"] != key:
+            continue
+        n = g["n"]
+        total += n
+
+        edad = g["edad"]
+        if edad is not None:
+            edades[edad] = edades.get(edad, 0) + n
 
-        n = (a.get("nacionalidad") or "").strip().upper() or "SIN DATO"
-        nac[n] = nac.get(n, 0) + 1
+        nacionalidad = g["nacionalidad"].upper() or "SIN DATO"
+        nac[nacionalidad] = nac.get(nacionalidad, 0) + n
 
-        if a.get("recursante"):
-            recursantes += 1
+        if g["recursante"]:
+            recursantes += n
 
         # sobreedad según grado (1°->6 años ... 6°->11)
-        curso_txt = (a.get("curso") or "")
+        curso_txt = g["curso"]
         grado = None
-        for g in ("1", "2", "3", "4", "5", "6"):
-            if curso_txt.startswith(g):
-                grado = int(g)
+        for gr in ("1", "2", "3", "4", "5", "6"):
+            if curso_txt.startswith(gr):
+                grado = int(gr)
                 break
         if grado and edad and edad > (5 + grado):
-            sobreedad += 1
+            sobreedad += n
 
     return jsonify({
         "curso": curso,
@@ -3874,59 +4192,55 @@ def api_resumen_curso():
 
 @app.route("/resumen/calificaciones") 
 def resumen_calificaciones():
-    # 1) IDs activos (string)
-    activos_ids = [str(a["_id"]) for a in COL_ALUMNOS.find(filtro_activos(), {"_id": 1})]
+    try:
+        anio = int(request.args.get("anio") or date.today().year)
+    except ValueError:
+        anio = date.today().year
+    trimestre = request.args.get("trimestre", type=int)
+    if trimestre not in (1, 2, 3):
+        trimestre = None
 
-    # 2) Traer SOLO calificaciones de alumnos activos
-    registros = list(COL_CALIFICACIONES.find({"alumno_id": {"$in": activos_ids}}))
+    # 1 agregación: total / desaprobados por (curso_key, asignatura, trimestre) del año.
+    # 'desaprobado' se guarda al cargar la nota; 'alumno_baja' marca las notas de
+    # alumnos que ya no están activos (ver _alumno_cambio). Las variantes de un
+    # mismo curso ("1°A", "1A") caen en la misma clave; se muestra un texto por clave.
+    match = {
+        "anio": anio,
+        "trimestre": trimestre or {"$in": [1, 2, 3]},
+        "curso_key": {"$nin": ["", None]},
+        "asignatura": {"$nin": ["", None]},
+        "alumno_baja": {"$ne": True},
+    }
+    pipeline = [
+        {"$match": match},
+        {"$group": {
+            "_id": {"curso_key": "$curso_key", "asignatura": "$asignatura", "trimestre": "$trimestre"},
+            "curso": {"$max": "$curso"},
+            "total": {"$sum": 1},
+            "desaprobados": {"$sum": {"$cond": ["$desaprobado", 1, 0]}},
+        }},
+    ]
 
     por_curso = {}
     por_asig = {}
-
-    for c in registros:
-        curso = (c.get("curso") or "").strip()
-        asignatura = (c.get("asignatura") or "").strip()
-        try:
-            trimestre = int(c.get("trimestre") or 0)
-        except Exception:
-            trimestre = 0
-
-        escala = (c.get("escala") or "").strip().lower()
-        valor = (str(c.get("valor") or "")).strip()
-
-        if not (curso and asignatura and trimestre):
-            continue
-
-        key = (curso, asignatura, trimestre)
-        d_curso = por_curso.setdefault(key, {"total": 0, "desaprobados": 0})
-        d_asig = por_asig.setdefault(asignatura, {"total": 0, "desaprobados": 0})
-
-        d_curso["total"] += 1
-        d_asig["total"] += 1
-
-        desap = False 
-        if escala == "conceptual":
-            desap = (valor in ("R", "D"))
-        elif escala == "numerica":
-            try:
-                n = float(valor.replace(",", "."))
-                desap = (n < 6.0)
-            except Exception:
-                desap = False
-
-        if desap:
-            d_curso["desaprobados"] += 1
-            d_asig["desaprobados"] += 1
+    for g in COL_CALIFICACIONES.aggregate(pipeline):
+        k = g["_id"]
+        por_curso[(k["curso_key"], k["asignatura"], k["trimestre"])] = {
+            "curso": g["curso"], "total": g["total"], "desaprobados": g["desaprobados"],
+        }
+        d_asig = por_asig.setdefault(k["asignatura"], {"total": 0, "desaprobados": 0})
+        d_asig["total"] += g["total"]
+        d_asig["desaprobados"] += g["desaprobados"]
 
     # Transformar a listas ordenadas + porcentaje
     resumen_curso = []
-    for (curso, asignatura, trimestre), vals in sorted(por_curso.items()):
+    for (_, asignatura, trimestre), vals in sorted(por_curso.items()):
         total = vals["total"]
         desap = vals["desaprobados"]
         pct = round(desap * 100 / total, 1) if total else 0.0
         resumen_curso.append(
             {
-                "curso": curso,
+                "curso": vals["curso"],
                 "asignatura": asignatura,
                 "trimestre": trimestre,
                 "total": total,
@@ -3949,10 +4263,15 @@ def resumen_calificaciones():
             }
         )
 
+    anios = sorted({int(a) for a in METADATOS.distinct("calificaciones", "anio") if str(a).isdigit()} | {anio}, reverse=True)
+
     return render_template(
         "resumen_calificaciones.html",
         resumen_curso=resumen_curso,
         resumen_asig=resumen_asig,
+        anio=anio,
+        anios=anios,
+        trimestre=trimestre,
     )
 
 @app.post("/movimientos/<id>/borrar")
@@ -3964,61 +4283,123 @@ def borrar_movimiento(id):
         abort(404)
 
     COL_MOVIMIENTOS.delete_one({"_id": oid})
+    METADATOS.invalidar("movimientos_alumnos")
     # volvemos al resumen del mismo año
     if anio:
         return redirect(url_for("resumen_movimientos", anio=anio))
     return redirect(url_for("resumen_movimientos"))
 
-@app.get("/resumen/movimientos/exportar.xlsx")
-def exportar_movimientos_excel():
-    anio_param = (request.args.get("anio") or "").strip()
+# ----------------- EXPORTACIONES (CSV / XLSX en streaming, ver exportar.py) -----------------
+# Cada dataset arma (nombre_base, hoja, columnas, docs) desde los args; docs es un
+# cursor (o un generador sobre el cursor) que se recorre una sola vez al escribir.
+
+def _exp_movimientos(args):
+    anio_param = (args.get("anio") or "").strip()
     try:
         anio = int(anio_param) if anio_param else date.today().year
     except ValueError:
         anio = date.today().year
 
     d1, d2 = _anio_range(anio)
-    movs = list(COL_MOVIMIENTOS.find({
-        "fecha": {"$gte": d1, "$lt": d2}
-    }).sort([("fecha", -1)]))
+    cols = exportar.COLUMNAS_MOVIMIENTOS
+    docs = COL_MOVIMIENTOS.find(
+        {"fecha": {"$gte": d1, "$lt": d2}},
+        {**exportar.campos(cols), "fecha": 1, "motivo": 1, "motivo_salida": 1},
+    ).sort([("fecha", -1)])
+    return f"movimientos_{anio}", f"Movimientos {anio}", cols, docs
+
+def _exp_alumnos(args):
+    curso = (args.get("curso") or "").strip()
+    q = dict(filtro_activos())
+    if curso:
+        q["curso_key"] = curso_key(curso)
 
-    wb = Workbook()
-    ws = wb.active
-    ws.title = f"Movimientos {anio}"
+    cols = exportar.COLUMNAS_ALUMNOS
+    docs = COL_ALUMNOS.find(q, exportar.campos(cols)).sort([("curso", 1), ("apellido", 1), ("nombre", 1)])
+    nombre = f"alumnos_{curso_key(curso)}" if curso else "alumnos"
+    return nombre, curso or "Alumnos", cols, docs
 
-    headers = ["Fecha", "Tipo", "Apellido", "Nombre", "DNI", "Curso", "Curso Origen", "Curso Destino", "Motivo", "Escuela Origen", "Escuela Destino"]
-    ws.append(headers)
+def _exp_inasistencias(args):
+    q = _historial_query_from_args(args)
 
-    def fmt_fecha(x):
-        if isinstance(x, datetime):
-            return x.strftime("%d/%m/%Y %H:%M")
-        return str(x or "")
+    def completar(tanda):
+        nombres = _historial_nombres(tanda, "docente_id", COL_DOCENTES)
+        for ins in tanda:
+            d = nombres.get(str(ins.get("docente_id") or ""), {})
+            ins["docente_nombre"] = f"{d.get('apellido','')}, {d.get('nombre','')}".strip(", ") if d else ""
 
-    for m in movs:
-        ws.append([
-            fmt_fecha(m.get("fecha")),
-            m.get("tipo",""),
-            m.get("apellido",""),
-            m.get("nombre",""),
-            m.get("dni",""),
-            m.get("curso",""),
-            m.get("curso_origen",""),
-            m.get("curso_destino",""),
-            m.get("motivo") or m.get("motivo_salida") or "",
-            m.get("escuela_origen",""),
-            m.get("escuela_destino",""),
-        ])
-
-    bio = io.BytesIO()
-    wb.save(bio) 
-    bio.seek(0)
-
-    return send_file(
-        bio,
-        as_attachment=True,
-        download_name=f"movimientos_{anio}.xlsx",
-        mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-    )
+    cursor = COL_INASISTENCIAS.find(q).sort([("fecha", 1), ("_id", 1)])
+    return "inasistencias_docentes", "Inasistencias", exportar.COLUMNAS_INASISTENCIAS, exportar.enriquecer(cursor, completar)
+
+def _exp_calificaciones(args):
+    anio = args.get("anio", type=int) or date.today().year
+    q = {"anio": anio}
+    curso = (args.get("curso") or "").strip()
+    if curso:
+        # clave guardada en la nota (como api_calificaciones_list): "1°A" y "1A" son el mismo curso
+        q["curso_key"] = curso_key(curso)
+    if (args.get("asignatura") or "").strip():
+        q["asignatura"] = args.get("asignatura").strip()
+    if args.get("trimestre", type=int):
+        q["trimestre"] = args.get("trimestre", type=int)
+
+    def completar(tanda):
+        oids = list({_maybe_oid(c.get("alumno_id")) for c in tanda if c.get("alumno_id")})
+        alumnos = {str(a["_id"]): a for a in COL_ALUMNOS.find({"_id": {"$in": oids}}, {"apellido": 1, "nombre": 1})}
+        for c in tanda:
+            a = alumnos.get(str(c.get("alumno_id") or ""), {})
+            c["apellido"] = a.get("apellido", "")
+            c["nombre"] = a.get("nombre", "")
+
+    cursor = COL_CALIFICACIONES.find(q).sort([("curso", 1), ("asignatura", 1), ("trimestre", 1)])
+    return f"calificaciones_{anio}", f"Calificaciones {anio}", exportar.COLUMNAS_CALIFICACIONES, exportar.enriquecer(cursor, completar)
+
+def _exp_mercaderia(args):
+    curso = (args.get("curso") or "").strip()
+    q = {"activo": {"$ne": False}}
+    if curso:
+        q["curso_key"] = curso_key(curso)
+    periodos = periodos_mar2026_feb2027()
+
+    def completar(tanda):
+        por_alumno = {}
+        for e in COL_MERCADERIA.find(
+            {"alumno_id": {"$in": [a["_id"] for a in tanda]}, "periodo": {"$in": periodos}},
+            {"alumno_id": 1, "periodo": 1, "recibido": 1},
+        ):
+            por_alumno.setdefault(str(e.get("alumno_id")), {})[e["periodo"]] = bool(e.get("recibido"))
+        for a in tanda:
+            a["entregas"] = por_alumno.get(str(a["_id"]), {})
+
+    cols = exportar.columnas_mercaderia([(p, label_periodo(p)) for p in periodos])
+    cursor = COL_ALUMNOS.find(q, exportar.campos(cols)).sort([("curso", 1), ("apellido", 1), ("nombre", 1)])
+    return "entrega_mercaderia", "Mercadería", cols, exportar.enriquecer(cursor, completar)
+
+EXPORTACIONES = {
+    "movimientos": _exp_movimientos,
+    "alumnos": _exp_alumnos,
+    "inasistencias": _exp_inasistencias,
+    "calificaciones": _exp_calificaciones,
+    "mercaderia": _exp_mercaderia,
+}
+
+@app.get("/exportar/<dataset>")
+def exportar_dataset(dataset):
+    """/exportar/<dataset>?formato=csv|xlsx (+ filtros de cada dataset)."""
+    armar = EXPORTACIONES.get(dataset)
+    if armar is None:
+        abort(404)
+    if not mongo_ping_ok():
+        return jsonify({"ok": False, "error": "db_down"}), 503
+
+    formato = (request.args.get("formato") or "xlsx").strip().lower()
+    nombre_base, hoja, columnas, docs = armar(request.args)
+    return exportar.respuesta(formato, nombre_base, hoja, columnas, docs)
+
+@app.get("/resumen/movimientos/exportar.xlsx")
+def exportar_movimientos_excel():
+    nombre_base, hoja, columnas, docs = _exp_movimientos(request.args)
+    return exportar.respuesta("xlsx", nombre_base, hoja, columnas, docs)
 
 @app.route("/planillas/promocion")
 def planilla_promocion():
@@ -4034,7 +4415,7 @@ def planilla_promocion():
     
     # 2. BUSQUEDA: Filtramos por el campo curso completo y año lectivo
     query = {
-        "curso": curso_completo, 
+        "curso_key": curso_key(curso_completo),
         "anio_lectivo": anio_lectivo 
     }
     
@@ -4090,15 +4471,17 @@ def planilla_promocion():
 @app.route("/legajos")
 def legajos_cursos():
     cursos = sorted(
-        [c for c in COL_ALUMNOS.distinct("curso", filtro_activos()) if c], 
+        [c for c in cursos_alumnos(filtro_activos()) if c], 
         key=lambda x: str(x)
     )
     return render_template("legajos_cursos.html", cursos=cursos)
 
 @app.route("/legajos/<curso>")
 def legajos_curso(curso):
-    q = {"curso": {"$regex": f"^{curso}$", "$options": "i"}}
-    alumnos = list(COL_ALUMNOS.find({**filtro_activos(), **q}).sort([("apellido", 1), ("nombre", 1)]))
+    q = {"curso_key": curso_key(curso)}
+    alumnos = documentos("legajos_curso.html",
+        COL_ALUMNOS.find({**filtro_activos(), **q}, proyeccion("legajos_curso.html")).sort([("apellido", 1), ("nombre", 1)])
+    )
 
 
     # legajo viene como subdocumento: legajo.dni_menor = True/False, etc.
@@ -4145,11 +4528,11 @@ def autorizados_cursos():
     ]}
 
     cursos = sorted(
-        [c for c in COL_ALUMNOS.distinct("curso", {**filtro_activos(), **filtro_anio}) if c],
+        [c for c in cursos_alumnos({**filtro_activos(), **filtro_anio}) if c],
         key=lambda x: str(x)
     )
     # Para el selector: años presentes en la BD (fallback: últimos 3)
-    anios_disponibles = sorted({int(y) for y in COL_ALUMNOS.distinct("anio_lectivo") if str(y).isdigit()}) or [2025, 2026, 2027]
+    anios_disponibles = anios_lectivos_alumnos()
 
     return render_template("autorizados_cursos.html", cursos=cursos, anio=anio, anios_disponibles=anios_disponibles)
 
@@ -4164,9 +4547,10 @@ def autorizados_curso(curso):
         {"anio_lectivo": ""},
     ]}
 
-    q_curso = {"curso": {"$regex": f"^{curso}$", "$options": "i"}}
-    alumnos = list(
-        COL_ALUMNOS.find({**filtro_activos(), **filtro_anio, **q_curso}).sort([("apellido", 1), ("nombre", 1)])
+    q_curso = {"curso_key": curso_key(curso)}
+    alumnos = documentos("autorizados_curso.html",
+        COL_ALUMNOS.find({**filtro_activos(), **filtro_anio, **q_curso}, proyeccion("autorizados_curso.html"))
+        .sort([("apellido", 1), ("nombre", 1)])
     )
 
     return render_template("autorizados_curso.html", curso=curso, alumnos=alumnos, anio=anio)
@@ -4344,7 +4728,7 @@ def mapa_recorridos():
 
     # Lista de cursos disponibles
     cursos = sorted(
-        [c for c in COL_ALUMNOS.distinct("curso", filtro_activos()) if c],
+        [c for c in cursos_alumnos(filtro_activos()) if c],
         key=lambda x: str(x)
     )
     turnos = ["Mañana", "Tarde"]
@@ -4364,12 +4748,9 @@ def mapa_recorridos():
         ]
 
     # Filtro por curso exacto (si se eligió uno)
-    if curso_sel:
-        filtro["curso"] = {"$regex": f"^{curso_sel}$", "$options": "i"}
     # Si NO hay curso elegido, permitimos filtrar por turno (A/B)
-    # Filtro por curso / turno
     if curso_sel:
-       filtro["curso"] = {"$regex": f"^{curso_sel}$", "$options": "i"}
+       filtro["curso_key"] = curso_key(curso_sel)
     elif turno_sel:
       if turno_sel.lower() == "mañana":
         filtro["curso"] = {"$regex": r"A\s*$", "$options": "i"}
@@ -4511,17 +4892,19 @@ def api_estados_admin():
             {"fecha_limite": {"$gte": desde, "$lte": hasta}},
             {"fecha_notificacion": {"$gte": desde, "$lte": hasta}}
         ]
+    estados = list(COL_ESTADOS_ADMIN.find(q).sort([("fecha_limite",1),("fecha_notificacion",1)]))
+
+    # Nombres de docentes: 1 sola consulta $in para toda la lista
+    ids = list({_maybe_oid(e["docente_id"]) for e in estados if e.get("docente_id")})
+    nombres = {}
+    if ids:
+        for d in COL_DOCENTES.find({"_id": {"$in": ids}}, {"apellido": 1, "nombre": 1}):
+            nombres[str(d["_id"])] = f"{d.get('apellido','')}, {d.get('nombre','')}".strip(", ")
+
     out = []
-    for e in COL_ESTADOS_ADMIN.find(q).sort([("fecha_limite",1),("fecha_notificacion",1)]):
+    for e in estados:
         ej = to_json(e)
-        nom_doc = "—"
-        if ej.get("docente_id"):
-            try:
-                d = COL_DOCENTES.find_one({"_id": _maybe_oid(ej["docente_id"])})
-                if d: nom_doc = f"{d.get('apellido','')}, {d.get('nombre','')}".strip(", ")
-            except:
-                pass
-        ej["docente_nombre"] = nom_doc
+        ej["docente_nombre"] = nombres.get(str(ej.get("docente_id") or ""), "—")
         ej["dias_restantes"] = dias_restantes(ej.get("fecha_limite"))
         out.append(ej)
     return jsonify(out)
@@ -4546,20 +4929,41 @@ def api_estados_resumen():
     q = {}
     if docente_id and docente_id != "TODOS": q["docente_id"] = docente_id
     if tipo and tipo != "TODOS": q["tipo"] = tipo
-    total = COL_ESTADOS_ADMIN.count_documents(q)
-    pipeline_tipo = [{"$match": q}, {"$group": {"_id": "$tipo", "count": {"$sum": 1}}}]
-    agg_tipo = {a["_id"]: a["count"] for a in COL_ESTADOS_ADMIN.aggregate(pipeline_tipo) if a["_id"]}
-    pendientes = COL_ESTADOS_ADMIN.count_documents({**q, "cumplido": False})
-    cumplidos = COL_ESTADOS_ADMIN.count_documents({**q, "cumplido": True})
+    # Todo en 1 agregación: totales, por tipo, por estado y ventanas de vencimiento.
+    # fecha_limite se guarda 'YYYY-MM-DD': las ventanas son rangos de strings.
+    hoy = today()
+    con_fecha = {"$regex": r"^\d{4}-\d{2}-\d{2}"}
+    pipeline = [
+        {"$match": q},
+        {"$facet": {
+            "total": [{"$count": "n"}],
+            "por_tipo": [{"$group": {"_id": "$tipo", "count": {"$sum": 1}}}],
+            "por_estado": [{"$group": {"_id": "$cumplido", "count": {"$sum": 1}}}],
+            # vencidos o que vencen en <= 5 días
+            "criticos_5dias": [
+                {"$match": {"cumplido": False, "fecha_limite": {
+                    "$lt": (hoy + timedelta(days=6)).isoformat(), **con_fecha}}},
+                {"$sort": {"fecha_limite": 1}},
+            ],
+            # vencen entre hoy y 10 días
+            "en_10dias": [
+                {"$match": {"cumplido": False, "fecha_limite": {
+                    "$gte": hoy.isoformat(), "$lt": (hoy + timedelta(days=11)).isoformat(), **con_fecha}}},
+                {"$sort": {"fecha_limite": 1}},
+            ],
+        }},
+    ]
+    r = next(COL_ESTADOS_ADMIN.aggregate(pipeline))
+
+    total = r["total"][0]["n"] if r["total"] else 0
+    agg_tipo = {a["_id"]: a["count"] for a in r["por_tipo"] if a["_id"]}
+    por_estado = {a["_id"]: a["count"] for a in r["por_estado"]}
+    pendientes = por_estado.get(False, 0)
+    cumplidos = por_estado.get(True, 0)
     proximos = []
-    for e in COL_ESTADOS_ADMIN.find({**q, "cumplido": False}):
-        dr = dias_restantes(e.get("fecha_limite"))
-        if dr is not None and dr <= 5:
-            ej = to_json(e); ej["dias_restantes"] = dr; proximos.append(ej)
-    en_10 = []
-    for e in COL_ESTADOS_ADMIN.find({**q, "cumplido": False}):
-        dr = dias_restantes(e.get("fecha_limite"))
-        if dr is not None and 0 <= dr <= 10: en_10.append(to_json(e))
+    for e in r["criticos_5dias"]:
+        ej = to_json(e); ej["dias_restantes"] = dias_restantes(e.get("fecha_limite")); proximos.append(ej)
+    en_10 = [to_json(e) for e in r["en_10dias"]]
     return jsonify({
         "total": total, "por_tipo": agg_tipo,
         "pendientes": pendientes, "cumplidos": cumplidos,
@@ -4658,55 +5062,20 @@ def api_aux_inasistencias():
     suplente_info = {k: v for k, v in suplente_info.items() if v} 
 
     # Reglas “particulares” (igual que docentes): 1 día por mes, máx 6/año
+    # (1 por mes y 6 al año se controlan al reservar en los contadores, más abajo)
     bucket = _causa_bucket(_norm(causa))
-    cont_anual, meses_particulares =_contar_por_bucket_aux_anio (auxiliar_id, referencia_fecha=desde)
 
     if bucket == "particulares":
         if desde != hasta:
             return jsonify(ok=False, error="Causas particulares: debe ser UN (1) solo día (1 por mes)."), 400
 
-        key_mes = f"{desde.year}-{desde.month:02d}"
-        if meses_particulares.get(key_mes, 0) >= 1:
-            return jsonify(ok=False, error="Ya hay una inasistencia por 'causas particulares' en este mes."), 400
-
-        if cont_anual.get("particulares", 0) >= 6:
-            return jsonify(ok=False, error="Se alcanzó el tope anual de 'causas particulares' (6)."), 400
-
-    # Evitar duplicado por día (idempotente)
-    dias_a_insertar = []
-    dcur = desde
-    while dcur <= hasta:
-        fecha_iso = dcur.isoformat()
-
-        existente = COL_INASISTENCIAS_AUX.find_one({"auxiliar_id": auxiliar_id, "fecha": fecha_iso})
-        if existente:
-            same = (
-                (existente.get("causa") or "").strip() == causa and
-                (existente.get("observaciones") or "").strip() == observ and
-                (existente.get("suplente_info") or {}) == suplente_info
-            )
-            if same:
-                dcur += timedelta(days=1)
-                continue
-
-            msg = f"Ya hay una inasistencia cargada para este auxiliar el {dcur.strftime('%d/%m/%Y')}."
-            return jsonify(ok=False, error=msg), 400
-
-        dias_a_insertar.append(fecha_iso)
-        dcur += timedelta(days=1)
-
-    docs = [{
-        "auxiliar_id": auxiliar_id,
-        "fecha": f,
-        "causa": causa,
-        "observaciones": observ,
-        "suplente_info": suplente_info,
-    } for f in dias_a_insertar]
-
-    if docs:
-        COL_INASISTENCIAS_AUX.insert_many(docs)
-
-    return jsonify(ok=True, inserted=len(docs), warning=None)
+    # Evitar duplicado por día (idempotente) + topes + insertar
+    datos = {"causa": causa, "observaciones": observ, "suplente_info": suplente_info, **campos_causa(causa)}
+    resp, status, _ = _insertar_inasistencias_rango(
+        COL_INASISTENCIAS_AUX, "auxiliar_id", auxiliar_id, desde, hasta, datos,
+        CONTADORES_AUX, bucket, "auxiliar",
+    )
+    return jsonify(**resp, warning=None), status
 
 
 # --------- HISTORIAL AUX (vista + APIs) ---------
@@ -4727,45 +5096,7 @@ def api_aux_historial_lista():
         return jsonify({"ok": False, "error": "db_down"}), 503
 
     q = _aux_historial_query_from_args(request.args)
-    ins_list = list(COL_INASISTENCIAS_AUX.find(q).sort("fecha", 1))
-
-    aux_oids = []
-    for ins in ins_list:
-        aid = ins.get("auxiliar_id")
-        if aid:
-            try:
-                aux_oids.append(_maybe_oid(aid))
-            except Exception:
-                pass
-    aux_oids = [a for a in aux_oids if a is not None]
-
-    aux_map = {}
-    if aux_oids:
-        for a in COL_AUX.find({"_id": {"$in": aux_oids}}, {"apellido": 1, "nombre": 1, "cargo": 1}):
-            aux_map[str(a["_id"])] = {
-                "nombre": a.get("nombre", ""),
-                "apellido": a.get("apellido", ""),
-                "cargo": a.get("cargo", ""),
-            }
-
-    rows = []
-    for ins in ins_list:
-        aid_raw = ins.get("auxiliar_id")
-        aid_str = str(aid_raw) if aid_raw is not None else ""
-        a = aux_map.get(aid_str, {})
-        aux_nombre = f"{a.get('apellido','')}, {a.get('nombre','')}".strip(", ") if a else ""
-
-        rows.append({
-            "_id": str(ins.get("_id")),
-            "fecha": ins.get("fecha", ""),
-            "causa": ins.get("causa", ""),
-            "observaciones": ins.get("observaciones", ""),
-            "suplente_info": ins.get("suplente_info") or {},
-            "auxiliar_id": aid_str,
-            "auxiliar_nombre": aux_nombre,
-        })
-
-    return jsonify({"ok": True, "items": rows})
+    return _historial_lista(COL_INASISTENCIAS_AUX, q, "auxiliar_id", COL_AUX, _fila_historial_aux)
 
 
 @app.get("/api/aux_historial_resumen")
@@ -4775,31 +5106,8 @@ def api_aux_historial_resumen():
 
     q = _aux_historial_query_from_args(request.args)
 
-    por = {
-        "enfermedad_personal": 0,
-        "enfermedad_familiar": 0,
-        "enfermedad_cronica": 0,
-        "particulares": 0,
-        "citacion_otro_establecimiento": 0,
-        "injustificadas": 0,
-        "pre_examen": 0,
-        "duelo": 0,
-        "examen": 0,
-        "paro": 0,
-        "art": 0,
-        "licencia_extraordinaria": 0,
-        "otras": 0,
-    }
-
-    total = 0
-    for ins in COL_INASISTENCIAS_AUX.find(q, {"causa": 1}):
-        total += 1
-        b = _causa_bucket(_norm(ins.get("causa", "")))
-        if b not in por:
-            b = "otras"
-        por[b] += 1
-
-    return jsonify({"ok": True, "total": total, "por_causa": por})
+    res = _resumen_historial_agg(COL_INASISTENCIAS_AUX, q, "auxiliar_id", COL_AUX, _group_by_param())
+    return jsonify({"ok": True, **res})
 
 
 # --------- EDITAR / ELIMINAR AUX ---------
@@ -4843,15 +5151,19 @@ def aux_inasistencia_editar(id):
         }
         sup = {k: v for k, v in sup.items() if v}
 
-        COL_INASISTENCIAS_AUX.update_one(
-            {"_id": oid},
-            {"$set": {
-                "fecha": fecha,
-                "causa": causa,
-                "observaciones": observaciones,
-                "suplente_info": sup,
-            }}
-        )
+        cambios = {
+            "fecha": fecha,
+            "causa": causa,
+            "observaciones": observaciones,
+            "suplente_info": sup,
+            **campos_causa(causa),
+        }
+        try:
+            antes = COL_INASISTENCIAS_AUX.find_one_and_update({"_id": oid}, {"$set": cambios})
+        except DuplicateKeyError:
+            flash("Ya hay una inasistencia cargada para este auxiliar en esa fecha.", "danger")
+            return redirect(url_for("aux_inasistencia_editar", id=id))
+        CONTADORES_AUX.mover(antes, {**(antes or {}), **cambios})
         flash("Inasistencia actualizada.", "success")
         return redirect(url_for("aux_historial_inasistencias"))
 
@@ -4870,9 +5182,10 @@ def api_aux_inasistencias_delete(id):
     except Exception:
         return jsonify({"ok": False, "error": "id inválido"}), 400
 
-    r = COL_INASISTENCIAS_AUX.delete_one({"_id": oid})
-    if r.deleted_count != 1:
+    borrada = COL_INASISTENCIAS_AUX.find_one_and_delete({"_id": oid})
+    if not borrada:
         return jsonify({"ok": False, "error": "No se encontró la inasistencia"}), 404
+    CONTADORES_AUX.descontar(borrada)
 
     return jsonify({"ok": True})
 
@@ -4925,7 +5238,7 @@ def auxiliar_inasistencias_anuales(id):
             continue
         causa = (ins.get("causa") or "").strip()
 
-        b = _causa_bucket(_norm(causa))
+        b = _bucket_de(ins)
         if b in totales:
             totales[b] += 1
         else:
@@ -4978,9 +5291,8 @@ def auxiliar_inasistencias_anuales(id):
 @app.route("/anexos")
 def anexos_index():
     # Cursos desde alumnos
-    cursos = COL_ALUMNOS.distinct("curso") 
     cursos = sorted(
-    [c for c in COL_ALUMNOS.distinct("curso", filtro_activos()) if c],
+    [c for c in cursos_alumnos(filtro_activos()) if c],
     key=lambda x: str(x)
     )
 
@@ -5005,9 +5317,8 @@ def anexos_render():
 
     # Alumnos del curso (solo activos)
     if curso:
-        cur_regex = f"^{curso}$"
         cur = COL_ALUMNOS.find(
-            {**filtro_activos(), "curso": {"$regex": cur_regex, "$options": "i"}}
+            {**filtro_activos(), "curso_key": curso_key(curso)}
         ).sort([("apellido", 1), ("nombre", 1)])
 
         for a in cur:
@@ -0,0 +1,101 @@
+# asistencia_mes.py
+# =========================================================
+#  Asistencia de alumnos: 1 documento por (alumno_id, year, month)
+#
+#  {alumno_id, year, month, curso,
+#   dias: "PPA-X-------------------------",   # 31 caracteres, posición = día - 1
+#   presentes, ausentes, justificadas, racha_max, racha_actual,
+#   accion_realizada}
+#
+#  Códigos: P presente, A ausente, X justificada, '-' sin dato.
+#  Los contadores se recalculan desde 'dias' en cada escritura, así que
+#  el documento siempre es consistente consigo mismo.
+# =========================================================
+
+from datetime import date
+
+ANCHO = 31
+SIN_DATO = "-"
+ESTADOS = ("P", "A", "X")
+
+DIAS_VACIOS = SIN_DATO * ANCHO
+
+
+def _dia_de_clave(clave):
+    """Día (1..31) a partir de claves del formato viejo: '5', 5, '2025-03-05'."""
+    s = str(clave).strip()
+    if s.isdigit():
+        d = int(s)
+    else:
+        try:
+            d = date.fromisoformat(s[:10]).day
+        except ValueError:
+            return None
+    return d if 1 <= d <= ANCHO else None
+
+
+def normalizar_dias(dias):
+    """
+    Devuelve siempre el string de 31 códigos.
+    Acepta el string nuevo, el dict viejo {dia|fecha: estado} o None.
+    """
+    if isinstance(dias, str):
+        dias = dias[:ANCHO].ljust(ANCHO, SIN_DATO)
+        return "".join(c if c in ESTADOS else SIN_DATO for c in dias)
+
+    out = list(DIAS_VACIOS)
+    if isinstance(dias, dict):
+        for clave, estado in dias.items():
+            d = _dia_de_clave(clave)
+            e = str(estado or "").upper().strip()
+            if d and e in ESTADOS:
+                out[d - 1] = e
+    return "".join(out)
+
+
+def decodificar(dias, year, month):
+    """{fecha_iso: estado} sólo de los días con dato."""
+    dias = normalizar_dias(dias)
+    return {
+        date(year, month, i + 1).isoformat(): c
+        for i, c in enumerate(dias)
+        if c != SIN_DATO
+    }
+
+
+def con_cambios(dias, cambios):
+    """
+    Aplica {dia: estado} sobre 'dias' ('' borra la celda) y devuelve el string nuevo.
+    """
+    out = list(normalizar_dias(dias))
+    for d, estado in cambios.items():
+        out[d - 1] = estado if estado in ESTADOS else SIN_DATO
+    return "".join(out)
+
+
+def resumen_de_dias(dias):
+    """
+    Contadores del mes: presentes, ausentes, justificadas (X),
+    racha_max y racha_actual de ausencias (los días sin dato no cortan la racha).
+    """
+    r = {"presentes": 0, "ausentes": 0, "justificadas": 0, "racha_max": 0, "racha_actual": 0}
+    racha = 0
+    for c in normalizar_dias(dias):
+        if c == "A":
+            r["ausentes"] += 1
+            racha += 1
+            r["racha_max"] = max(r["racha_max"], racha)
+        elif c == "P":
+            r["presentes"] += 1
+            racha = 0
+        elif c == "X":
+            r["justificadas"] += 1
+            racha = 0
+    r["racha_actual"] = racha
+    return r
+
+
+def campos_mes(dias):
+    """$set completo de un mes: el string normalizado más sus contadores."""
+    dias = normalizar_dias(dias)
+    return {"dias": dias, **resumen_de_dias(dias)}
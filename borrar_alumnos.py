@@ -2,6 +2,8 @@ from pymongo import MongoClient
 from dotenv import load_dotenv
 import os
 
+from matricula import SnapshotsMatricula
+
 load_dotenv()
 
 uri = os.getenv("MONGO_URI", "mongodb://localhost:27017/gestion_docentes")
@@ -14,3 +16,7 @@ if db is None:
 
 res = db.alumnos.delete_many({})
 print(f"Alumnos borrados: {res.deleted_count}")
+
+# sin alumnos, los snapshots del parte diario quedaron viejos: se rearman al pedir cada mes
+SnapshotsMatricula(db.matricula_mensual, db.alumnos).invalidar()
+print("Snapshots de matrícula del parte diario borrados.")
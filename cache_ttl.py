@@ -0,0 +1,42 @@
+# cache_ttl.py
+# =========================================================
+#  Cache en memoria con vencimiento para lecturas de Mongo que se repiten
+#  entre requests (calendario.py, demografia.py, metadatos.py)
+# =========================================================
+#
+#  Cada módulo invalida sus claves en las escrituras que hace la app; el TTL
+#  cubre lo que escriben otros procesos (otro worker, import_alumnos.py, ...).
+
+import os
+import threading
+import time
+
+CACHE_TTL = int(os.getenv("CACHE_TTL", "300"))
+
+
+class CacheTTL:
+    def __init__(self, ttl=CACHE_TTL):
+        self.ttl = ttl
+        self._items = {}  # clave -> (vence, valor)
+        self._lock = threading.Lock()
+
+    def obtener(self, clave, calcular):
+        """Valor cacheado de 'clave'; si no está o venció, calcular() y guardarlo."""
+        ahora = time.monotonic()
+        item = self._items.get(clave)
+        if item and item[0] > ahora:
+            return item[1]
+
+        valor = calcular()
+        with self._lock:
+            self._items[clave] = (ahora + self.ttl, valor)
+        return valor
+
+    def invalidar(self, condicion=None):
+        """Descarta las claves que cumplen condicion(clave) (o todas)."""
+        with self._lock:
+            if condicion is None:
+                self._items.clear()
+            else:
+                for clave in [k for k in self._items if condicion(k)]:
+                    del self._items[clave]
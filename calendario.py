@@ -0,0 +1,81 @@
+# calendario.py
+# =========================================================
+#  Calendario escolar en memoria: días hábiles por año
+#  (L-V menos feriados/suspensiones de calendario_escolar)
+# =========================================================
+#
+#  Por año se arma UNA vez:
+#    - no_laborables: fechas ISO cargadas en calendario_escolar
+#    - lv[mes]:       días L-V del mes (sin descontar no laborables)
+#    - habiles[mes]:  días L-V del mes menos los no laborables
+#
+#  Las máscaras de weekdays (bit 0 = lunes ... bit 4 = viernes) las usa el
+#  cálculo de ausentismo docente (estadisticas_ausencias.py).
+#
+#  Cacheado por año (cache_ttl.py); se invalida al editar/borrar en calendario_escolar.
+
+from datetime import date, timedelta
+
+from cache_ttl import CACHE_TTL, CacheTTL
+
+TODA_LA_SEMANA = 0b11111  # L-V
+
+
+def mascara_de_weekdays(weekdays):
+    """{0, 2, 4} -> 0b10101 (sólo L-V)."""
+    m = 0
+    for wd in weekdays:
+        if 0 <= wd < 5:
+            m |= 1 << wd
+    return m
+
+
+class CalendarioEscolar:
+    def __init__(self, coleccion, ttl=CACHE_TTL):
+        self.coleccion = coleccion
+        self._anios = CacheTTL(ttl)  # anio -> datos
+
+    # ----------------- cache -----------------
+
+    def _armar(self, anio):
+        desde = date(anio, 1, 1)
+        no_laborables = frozenset(
+            (x.get("fecha") or "").strip()
+            for x in self.coleccion.find(
+                {"fecha": {"$gte": desde.isoformat(), "$lte": date(anio, 12, 31).isoformat()}},
+                {"fecha": 1},
+            )
+            if (x.get("fecha") or "").strip()
+        )
+
+        lv = {m: [] for m in range(1, 13)}
+        d = desde
+        while d.year == anio:
+            if d.weekday() < 5:
+                lv[d.month].append(d)
+            d += timedelta(days=1)
+
+        return {
+            "no_laborables": no_laborables,
+            "lv": {m: tuple(dias) for m, dias in lv.items()},
+            "habiles": {m: tuple(x for x in dias if x.isoformat() not in no_laborables) for m, dias in lv.items()},
+        }
+
+    def _anio(self, anio):
+        anio = int(anio)
+        return self._anios.obtener(anio, lambda: self._armar(anio))
+
+    def invalidar(self, anio=None):
+        """Descarta el año (o todo) para que la próxima lectura vuelva a Mongo."""
+        self._anios.invalidar(None if anio is None else (lambda k: k == int(anio)))
+
+    # ----------------- consultas -----------------
+
+    def no_laborables(self, anio):
+        """frozenset de fechas ISO no laborables (feriados + suspensiones) del año."""
+        return self._anio(anio)["no_laborables"]
+
+    def dias_habiles(self, anio, mes, excluir_no_laborables=True):
+        """Tupla de date L-V del mes; por defecto sin feriados/suspensiones."""
+        datos = self._anio(anio)
+        return datos["habiles" if excluir_no_laborables else "lv"][int(mes)]
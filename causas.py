@@ -0,0 +1,110 @@
+# causas.py
+# =========================================================
+#  Clasificación de causas de inasistencia (docentes y auxiliares)
+#  Única fuente: topes, SET4, historial, calendarios y resúmenes.
+# =========================================================
+#
+#  clasificar_causa("Enfermedad personal (art. 114)") -> ("enfermedad_personal", "enfermedad")
+#
+#  - bucket: categoría detallada (las claves que usan los templates y el historial)
+#  - grupo:  agrupación oficial del SET4 (enfermedad / privadas / otras / injustificadas)
+#
+#  El texto se normaliza (minúsculas, sin tildes) y se recorre UNA vez con una sola
+#  regex de alternativas; las reglas de prioridad se aplican sobre las palabras
+#  encontradas. El resultado se cachea por texto crudo (las causas se repiten mucho).
+
+import re
+import unicodedata
+from functools import lru_cache
+
+BUCKETS = (
+    "enfermedad_personal",
+    "enfermedad_familiar",
+    "enfermedad_cronica",
+    "particulares",
+    "citacion_otro_establecimiento",
+    "injustificadas",
+    "pre_examen",
+    "duelo",
+    "examen",
+    "paro",
+    "art",
+    "licencia_extraordinaria",
+    "otras",
+)
+
+GRUPOS_SET4 = ("enfermedad", "privadas", "otras", "injustificadas")
+
+_GRUPO_POR_BUCKET = {
+    "enfermedad_personal": "enfermedad",
+    "enfermedad_familiar": "enfermedad",
+    "enfermedad_cronica": "enfermedad",
+    "particulares": "privadas",
+    "injustificadas": "injustificadas",
+}
+
+# Alternativas más largas primero ('enfermedad personal' antes que 'enfermedad').
+# ART como palabra suelta: 'particular' contiene 'art'.
+_PALABRAS = re.compile(
+    r"(?P<art>\bart\b)"
+    r"|(?P<licencia_extraordinaria>licencia extraordinaria)"
+    r"|(?P<enfermedad_personal>enfermedad personal)"
+    r"|(?P<enfermedad_familiar>enfermedad familiar)"
+    r"|(?P<enfermedad>enfermedad)"
+    r"|(?P<cronica>cronica)"
+    r"|(?P<particular>particular)"
+    r"|(?P<paro>paro)"
+    r"|(?P<duelo>duelo)"
+    r"|(?P<pre>pre)"
+    r"|(?P<examen>examen)"
+    r"|(?P<llamado>citacion|convocatoria|comision|omision|servicio)"
+    r"|(?P<otro_est>otros? est|establec)"
+    r"|(?P<injust>injust)"
+)
+
+# (bucket, palabras requeridas) en orden de prioridad
+_REGLAS = (
+    ("art", {"art"}),
+    ("paro", {"paro"}),
+    ("duelo", {"duelo"}),
+    ("pre_examen", {"pre", "examen"}),
+    ("examen", {"examen"}),
+    ("enfermedad_personal", {"enfermedad_personal"}),
+    ("enfermedad_familiar", {"enfermedad_familiar"}),
+    ("enfermedad_cronica", {"cronica"}),
+    ("particulares", {"particular"}),
+    ("citacion_otro_establecimiento", {"llamado", "otro_est"}),
+    ("injustificadas", {"injust"}),
+    ("licencia_extraordinaria", {"licencia_extraordinaria"}),
+)
+
+
+def normalizar(txt):
+    """minúsculas, sin tildes y espacios simples."""
+    txt = str(txt or "").strip().lower()
+    txt = unicodedata.normalize("NFD", txt)
+    txt = "".join(c for c in txt if unicodedata.category(c) != "Mn")
+    return re.sub(r"\s+", " ", txt).strip()
+
+
+@lru_cache(maxsize=1024)
+def clasificar_causa(causa):
+    """(bucket, grupo_set4) de una causa en texto libre."""
+    encontradas = {m.lastgroup for m in _PALABRAS.finditer(normalizar(causa))}
+
+    bucket = "otras"
+    for nombre, requeridas in _REGLAS:
+        if requeridas <= encontradas:
+            bucket = nombre
+            break
+
+    grupo = _GRUPO_POR_BUCKET.get(bucket, "otras")
+    if grupo == "otras" and bucket == "otras" and "enfermedad" in encontradas:
+        grupo = "enfermedad"  # 'enfermedad' sin más detalle cuenta como enfermedad en el SET4
+    return bucket, grupo
+
+
+def campos_causa(causa):
+    """Campos que se guardan junto a la causa para agrupar sin volver a parsear."""
+    bucket, grupo = clasificar_causa(causa or "")
+    return {"causa_bucket": bucket, "causa_grupo": grupo}
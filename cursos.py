@@ -0,0 +1,38 @@
+# cursos.py
+# =========================================================
+#  Clave canónica de curso (grado, sección, turno)
+#  Compartida por app.py e import_alumnos.py
+# =========================================================
+
+import re
+
+# Sección -> turno (A = mañana, B = tarde), igual que _orden_alumno en app.py
+TURNO_POR_SECCION = {"A": "M", "B": "T"}
+
+
+def curso_partes(curso):
+    """
+    Devuelve (grado, seccion, turno) a partir de textos tipo
+    '1°A', '1A', '1 A', '1ºA', '4°B°'.
+    Si no se puede interpretar devuelve (None, None, None).
+    """
+    s = str(curso or "").strip().upper()
+    s = re.sub(r"[^0-9A-Z]", "", s)  # saca °, º, espacios, puntos...
+    m = re.match(r"^(\d+)([A-Z])$", s)
+    if not m:
+        return None, None, None
+    grado = int(m.group(1))
+    seccion = m.group(2)
+    return grado, seccion, TURNO_POR_SECCION.get(seccion, "")
+
+
+def curso_key(curso):
+    """
+    Clave canónica indexable del curso: '1A-M', '3B-T'.
+    Textos que no siguen el patrón grado+sección se guardan en mayúsculas
+    y sin símbolos, así la misma entrada siempre da la misma clave.
+    """
+    grado, seccion, turno = curso_partes(curso)
+    if grado is None:
+        return re.sub(r"[^0-9A-Z]", "", str(curso or "").strip().upper())
+    return f"{grado}{seccion}-{turno}" if turno else f"{grado}{seccion}"
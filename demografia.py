@@ -0,0 +1,106 @@
+# demografia.py
+# =========================================================
+#  Conteos demográficos de alumnos activos (sexo, edad, nacionalidad,
+#  recursantes) con UNA agregación de Mongo, cacheada en memoria
+# =========================================================
+#
+#  La agregación proyecta sólo los campos necesarios, calcula la edad a la
+#  fecha de referencia en el servidor y agrupa por
+#    (curso, curso_key, sexo, nacionalidad, edad, recursante) -> n
+#  Cada vista (resumen de edades, de nacionalidades, resumen de curso) arma su
+#  cuadro desde esos grupos; la normalización propia de cada una (sexo,
+#  nacionalidad) se hace en Python sobre pocas filas.
+#
+#  El resultado se cachea por fecha de referencia (cache_ttl.py) y se invalida
+#  en las escrituras de alumnos (_alumno_cambio en app.py).
+
+from cache_ttl import CACHE_TTL, CacheTTL
+
+
+def _texto(campo):
+    """Expresión: el campo recortado si es string, '' si no."""
+    return {"$cond": [
+        {"$eq": [{"$type": f"${campo}"}, "string"]},
+        {"$trim": {"input": f"${campo}"}},
+        "",
+    ]}
+
+
+def _edad_a(ref_fecha):
+    """Expresión: años cumplidos a ref_fecha desde $fecha_nacimiento (date o 'YYYY-MM-DD'); null si no hay."""
+    return {"$let": {
+        "vars": {"fn": {"$cond": [
+            {"$eq": [{"$type": "$fecha_nacimiento"}, "date"]},
+            "$fecha_nacimiento",
+            {"$dateFromString": {"dateString": "$fecha_nacimiento", "onError": None, "onNull": None}},
+        ]}},
+        "in": {"$cond": [
+            {"$eq": ["$$fn", None]},
+            None,
+            {"$subtract": [
+                {"$subtract": [ref_fecha.year, {"$year": "$$fn"}]},
+                # todavía no cumplió a la fecha de referencia
+                {"$cond": [
+                    {"$or": [
+                        {"$gt": [{"$month": "$$fn"}, ref_fecha.month]},
+                        {"$and": [
+                            {"$eq": [{"$month": "$$fn"}, ref_fecha.month]},
+                            {"$gt": [{"$dayOfMonth": "$$fn"}, ref_fecha.day]},
+                        ]},
+                    ]},
+                    1,
+                    0,
+                ]},
+            ]},
+        ]},
+    }}
+
+
+def pipeline(filtro, ref_fecha):
+    return [
+        {"$match": filtro},
+        {"$project": {
+            "_id": 0,
+            "curso": _texto("curso"),
+            "curso_key": {"$ifNull": ["$curso_key", None]},
+            "sexo": {"$toUpper": _texto("sexo")},
+            "nacionalidad": _texto("nacionalidad"),
+            "recursante": {"$not": [{"$in": [{"$ifNull": ["$recursante", None]}, [False, None, 0, ""]]}]},
+            "edad": _edad_a(ref_fecha),
+        }},
+        {"$group": {
+            "_id": {
+                "curso": "$curso",
+                "curso_key": "$curso_key",
+                "sexo": "$sexo",
+                "nacionalidad": "$nacionalidad",
+                "edad": "$edad",
+                "recursante": "$recursante",
+            },
+            "n": {"$sum": 1},
+        }},
+    ]
+
+
+class ResumenAlumnos:
+    def __init__(self, coleccion, filtro, ttl=CACHE_TTL):
+        """
+        coleccion: alumnos
+        filtro:    función que devuelve el $match de alumnos activos
+        """
+        self.coleccion = coleccion
+        self.filtro = filtro
+        self._grupos = CacheTTL(ttl)  # ref_fecha -> grupos
+
+    def grupos(self, ref_fecha):
+        """
+        Lista de {"curso", "curso_key", "sexo", "nacionalidad", "edad", "recursante", "n"}
+        (edad a ref_fecha; None si no hay fecha de nacimiento válida).
+        """
+        return self._grupos.obtener(ref_fecha, lambda: [
+            {**g["_id"], "n": g["n"]}
+            for g in self.coleccion.aggregate(pipeline(self.filtro(), ref_fecha))
+        ])
+
+    def invalidar(self):
+        self._grupos.invalidar()
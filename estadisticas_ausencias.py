@@ -0,0 +1,98 @@
+# estadisticas_ausencias.py
+# =========================================================
+#  Estadística anual de inasistencias del personal con NumPy
+#  (docentes y auxiliares: el motor no sabe de qué colección vienen)
+# =========================================================
+#
+#  Matrices personas × días del año (columna = día 1..365/366):
+#    esperado[p, d] = la persona p debía concurrir el día d
+#                     (día hábil y weekday dentro de su máscara, ver calendario.py)
+#    faltas[p, d]   = inasistencias cargadas de p ese día
+#
+#  Mensual, por persona y diario salen de sumas sobre esas matrices.
+#  Las faltas se cuentan aunque caigan en un día no esperado (igual que antes:
+#  lo cargado cuenta), pero el gráfico diario sólo lista días hábiles.
+
+from datetime import date, timedelta
+
+import numpy as np
+
+
+def _porcentaje(faltas, base):
+    """faltas/base en %, redondeado a 1 decimal y con tope 100 (0 si base es 0)."""
+    faltas = np.asarray(faltas, dtype=float)
+    base = np.asarray(base, dtype=float)
+    pct = np.divide(faltas * 100, base, out=np.zeros_like(faltas), where=base > 0)
+    return np.minimum(np.round(pct, 1), 100.0)
+
+
+def resumen_anual(anio, personas, dias_habiles, ausencias):
+    """
+    anio:         int
+    personas:     lista de (id_str, mascara) con mascara de weekdays L-V (bit 0 = lunes)
+    dias_habiles: iterable de date hábiles del año (sin feriados/suspensiones)
+    ausencias:    iterable de (id_str, date)
+
+    Devuelve {"meses": [...], "por_persona": [...], "dias": [...]} con
+    faltas, días base/esperados y porcentaje.
+    """
+    inicio = date(anio, 1, 1)
+    n_dias = (date(anio + 1, 1, 1) - inicio).days
+    fechas = [inicio + timedelta(days=i) for i in range(n_dias)]
+
+    weekday = np.array([f.weekday() for f in fechas], dtype=np.int8)
+    mes_de_dia = np.array([f.month for f in fechas], dtype=np.int8)
+    inicio_mes = np.searchsorted(mes_de_dia, np.arange(1, 13))
+
+    habil = np.zeros(n_dias, dtype=bool)
+    idx_habiles = [(f - inicio).days for f in dias_habiles if f.year == anio]
+    habil[idx_habiles] = True
+
+    # esperado: bit del weekday dentro de la máscara de cada persona, sólo en días hábiles
+    ids = [pid for pid, _ in personas]
+    mascaras = np.array([m for _, m in personas], dtype=np.int16).reshape(-1, 1)
+    bits = np.where(weekday < 5, 1 << weekday.astype(np.int16), 0).reshape(1, -1)
+    esperado = ((mascaras & bits) != 0) & habil
+
+    # faltas: una suma por (persona, día)
+    fila = {pid: i for i, pid in enumerate(ids)}
+    filas, columnas = [], []
+    for pid, f in ausencias:
+        i = fila.get(pid)
+        if i is None or f is None or f.year != anio:
+            continue
+        filas.append(i)
+        columnas.append((f - inicio).days)
+    faltas = np.zeros((len(ids), n_dias), dtype=np.int32)
+    np.add.at(faltas, (np.array(filas, dtype=np.intp), np.array(columnas, dtype=np.intp)), 1)
+
+    # -------- mensual institucional --------
+    esperado_dia = esperado.sum(axis=0)
+    faltas_dia = faltas.sum(axis=0)
+    base_mes = np.add.reduceat(esperado_dia, inicio_mes)
+    faltas_mes = np.add.reduceat(faltas_dia, inicio_mes)
+    pct_mes = _porcentaje(faltas_mes, base_mes)
+    meses = [
+        {"mes": m + 1, "faltas": int(faltas_mes[m]), "dias_base": int(base_mes[m]), "porcentaje": float(pct_mes[m])}
+        for m in range(12)
+    ]
+
+    # -------- anual por persona --------
+    base_persona = esperado.sum(axis=1)
+    faltas_persona = faltas.sum(axis=1)
+    pct_persona = _porcentaje(faltas_persona, base_persona)
+    por_persona = [
+        {"id": pid, "faltas": int(faltas_persona[i]), "dias_base": int(base_persona[i]),
+         "porcentaje": float(pct_persona[i])}
+        for i, pid in enumerate(ids)
+    ]
+
+    # -------- diario (sólo días hábiles) --------
+    pct_dia = _porcentaje(faltas_dia, esperado_dia)
+    dias = [
+        {"fecha": fechas[d].isoformat(), "faltas": int(faltas_dia[d]), "esperados": int(esperado_dia[d]),
+         "porcentaje": float(pct_dia[d])}
+        for d in np.flatnonzero(habil)
+    ]
+
+    return {"meses": meses, "por_persona": por_persona, "dias": dias}
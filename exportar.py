@@ -0,0 +1,206 @@
+# exportar.py
+# =========================================================
+#  Exportaciones CSV (en streaming) y XLSX (descarga con buffer) desde un cursor de Mongo
+# =========================================================
+#
+#  Cada dataset declara sus columnas como una tupla de Columna(titulo, valor):
+#    valor = nombre de campo ("apellido") o función doc -> valor
+#
+#  - CSV: se escribe por tandas y se manda a medida que sale del cursor
+#    (separador ';' y BOM para que Excel lo abra bien en es-AR).
+#  - XLSX: NO es streaming. openpyxl en modo write_only arma el libro completo
+#    en un archivo temporal (las filas van a disco, no quedan en memoria) y
+#    recién entonces se manda en bloques: la respuesta espera a la última fila.
+#
+#  Los datos que vienen de otra colección (nombres de alumnos/docentes) se
+#  resuelven por tandas con enriquecer(), 1 consulta $in por tanda.
+
+import csv
+import io
+import tempfile
+from collections import namedtuple
+from datetime import date, datetime
+
+from flask import Response, stream_with_context
+
+try:
+    from openpyxl import Workbook
+except Exception:
+    Workbook = None
+
+TANDA = 500
+BLOQUE = 64 * 1024
+
+MIME_XLSX = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+Columna = namedtuple("Columna", "titulo valor")
+
+
+def _celda(columna, doc):
+    v = columna.valor(doc) if callable(columna.valor) else doc.get(columna.valor)
+    if v is None:
+        return ""
+    if isinstance(v, bool):
+        return "Sí" if v else ""
+    if isinstance(v, (str, int, float, datetime, date)):
+        return v
+    return str(v)
+
+
+def campos(columnas):
+    """Proyección con los campos de las columnas simples (las calculadas agregan los suyos)."""
+    return {c.valor: 1 for c in columnas if isinstance(c.valor, str)}
+
+
+def por_tandas(docs, n=TANDA):
+    tanda = []
+    for d in docs:
+        tanda.append(d)
+        if len(tanda) >= n:
+            yield tanda
+            tanda = []
+    if tanda:
+        yield tanda
+
+
+def enriquecer(docs, completar, n=TANDA):
+    """Recorre 'docs' por tandas; completar(tanda) agrega campos a los documentos de la tanda."""
+    for tanda in por_tandas(docs, n):
+        completar(tanda)
+        yield from tanda
+
+
+def _disposicion(nombre):
+    return {"Content-Disposition": f'attachment; filename="{nombre}"'}
+
+
+def respuesta_csv(nombre, columnas, docs):
+    def generar():
+        buf = io.StringIO()
+        w = csv.writer(buf, delimiter=";")
+        buf.write("\ufeff")
+        w.writerow([c.titulo for c in columnas])
+        for tanda in por_tandas(docs):
+            for d in tanda:
+                w.writerow([_celda(c, d) for c in columnas])
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+        if buf.tell():
+            yield buf.getvalue()
+
+    return Response(
+        stream_with_context(generar()),
+        mimetype="text/csv; charset=utf-8",
+        headers=_disposicion(nombre),
+    )
+
+
+def respuesta_xlsx(nombre, hoja, columnas, docs):
+    """
+    Descarga con buffer: escribe todo el libro en un temporal y después lo manda
+    en bloques de BLOQUE bytes (memoria acotada, pero el primer byte sale al final).
+    """
+    if Workbook is None:
+        return Response("openpyxl no está instalado", status=501, mimetype="text/plain")
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title=hoja[:31])
+    ws.append([c.titulo for c in columnas])
+    for d in docs:
+        ws.append([_celda(c, d) for c in columnas])
+
+    archivo = tempfile.TemporaryFile()
+    wb.save(archivo)
+    archivo.seek(0)
+
+    def generar():
+        with archivo:
+            while True:
+                bloque = archivo.read(BLOQUE)
+                if not bloque:
+                    break
+                yield bloque
+
+    return Response(generar(), mimetype=MIME_XLSX, headers=_disposicion(nombre))
+
+
+def respuesta(formato, nombre_base, hoja, columnas, docs):
+    """'csv' o 'xlsx' (por defecto) con nombre de archivo nombre_base.formato."""
+    if formato == "csv":
+        return respuesta_csv(f"{nombre_base}.csv", columnas, docs)
+    return respuesta_xlsx(f"{nombre_base}.xlsx", hoja, columnas, docs)
+
+
+# ----------------- columnas por dataset -----------------
+
+def _fecha_hora(campo):
+    def valor(doc):
+        x = doc.get(campo)
+        if isinstance(x, datetime):
+            return x.strftime("%d/%m/%Y %H:%M")
+        return str(x or "")
+    return valor
+
+
+COLUMNAS_MOVIMIENTOS = (
+    Columna("Fecha", _fecha_hora("fecha")),
+    Columna("Tipo", "tipo"),
+    Columna("Apellido", "apellido"),
+    Columna("Nombre", "nombre"),
+    Columna("DNI", "dni"),
+    Columna("Curso", "curso"),
+    Columna("Curso Origen", "curso_origen"),
+    Columna("Curso Destino", "curso_destino"),
+    Columna("Motivo", lambda m: m.get("motivo") or m.get("motivo_salida") or ""),
+    Columna("Escuela Origen", "escuela_origen"),
+    Columna("Escuela Destino", "escuela_destino"),
+)
+
+COLUMNAS_ALUMNOS = (
+    Columna("Curso", "curso"),
+    Columna("Apellido", "apellido"),
+    Columna("Nombre", "nombre"),
+    Columna("DNI", "dni"),
+    Columna("Sexo", "sexo"),
+    Columna("Fecha Nac.", "fecha_nacimiento"),
+    Columna("Nacionalidad", "nacionalidad"),
+    Columna("Responsable", "responsable"),
+    Columna("Teléfono", "telefono"),
+    Columna("Domicilio", "domicilio"),
+    Columna("Localidad", "localidad"),
+)
+
+COLUMNAS_INASISTENCIAS = (
+    Columna("Fecha", "fecha"),
+    Columna("Docente", "docente_nombre"),
+    Columna("Causa", "causa"),
+    Columna("Observaciones", "observaciones"),
+    Columna("Suplente", lambda i: (i.get("suplente_info") or {}).get("nombre", "")),
+)
+
+COLUMNAS_CALIFICACIONES = (
+    Columna("Año", "anio"),
+    Columna("Curso", "curso"),
+    Columna("Apellido", "apellido"),
+    Columna("Nombre", "nombre"),
+    Columna("Asignatura", "asignatura"),
+    Columna("Trimestre", "trimestre"),
+    Columna("Escala", "escala"),
+    Columna("Valor", "valor"),
+    Columna("Observaciones", "observaciones"),
+)
+
+
+def columnas_mercaderia(periodos):
+    """Una fila por alumno y una columna por período (campo 'entregas': {periodo: bool})."""
+    base = (
+        Columna("Curso", "curso"),
+        Columna("Apellido", "apellido"),
+        Columna("Nombre", "nombre"),
+        Columna("DNI", "dni"),
+    )
+    return base + tuple(
+        Columna(titulo, lambda a, p=p: bool((a.get("entregas") or {}).get(p)))
+        for p, titulo in periodos
+    )
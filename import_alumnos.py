@@ -4,6 +4,9 @@ import pandas as pd
 from pymongo import MongoClient
 from dotenv import load_dotenv
 
+from cursos import curso_key
+from matricula import SnapshotsMatricula
+
 load_dotenv()
 
 # --------- CONEXIÓN MONGO ---------
@@ -190,10 +193,16 @@ for sheet_name in xls.sheet_names:
             continue
 
         data["curso"] = normalizar_curso(curso)
+        data["curso_key"] = curso_key(data["curso"])
 
         col_alumnos.insert_one(data)
         total_insertados += 1
 
+# los snapshots del parte diario no vieron estas altas: se rearman al pedir cada mes
+if total_insertados:
+    SnapshotsMatricula(db.matricula_mensual, col_alumnos).invalidar()
+    print("Snapshots de matrícula del parte diario borrados (se rearman solos).")
+
 print("\n===================================")
 print(f"Alumnos insertados: {total_insertados}")
 print(f"Filas saltadas   : {total_skipped}")
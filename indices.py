@@ -0,0 +1,216 @@
+# indices.py
+# =========================================================
+#  Registro declarativo de índices de MongoDB
+#  (se aplica al iniciar la app o con `flask indices`)
+# =========================================================
+
+from pymongo.errors import OperationFailure
+
+
+def _idx(coleccion, claves, nombre, **opciones):
+    """Arma una entrada del registro: colección, claves (lista de tuplas), nombre y opciones."""
+    return {
+        "coleccion": coleccion,
+        "claves": [(k, d) for k, d in claves],
+        "nombre": nombre,
+        "opciones": opciones,
+    }
+
+
+# Cada índice acompaña una forma de consulta concreta de app.py / salidas_blueprint.py.
+# Si se cambia una consulta, revisar acá que el índice siga sirviendo.
+INDICES = [
+    # ---------- asistencias ----------
+    # 1 documento por (alumno_id, year, month) con 'dias' de 31 códigos (ver asistencia_mes.py).
+    # asistencia_mensual, alertas EOE y guardar_accion_ausentismo: alumno_id ($in) + year (+ month)
+    _idx("asistencias", [("alumno_id", 1), ("year", 1), ("month", 1)], "alumno_anio_mes_unico",
+         unique=True, partialFilterExpression={"year": {"$exists": True}}),
+    # registros diarios del formato anterior: sólo los lee `flask migrar-asistencia-mensual`
+    _idx("asistencias", [("alumno_id", 1), ("fecha", 1)], "alumno_fecha",
+         unique=True, partialFilterExpression={"fecha": {"$exists": True}}),
+
+    # ---------- inasistencias docentes ----------
+    # topes anuales, SET4, calendario anual: docente_id + rango de fecha.
+    # Único: 1 inasistencia por docente y día (insert_many ordered=False idempotente)
+    _idx("inasistencias", [("docente_id", 1), ("fecha", 1)], "docente_fecha_unico", unique=True),
+    # historial (paginación keyset fecha,_id) y resumen institucional: rango de fecha sin docente
+    _idx("inasistencias", [("fecha", 1), ("_id", 1)], "fecha_id"),
+
+    # resúmenes por causa: bucket guardado (causas.py) + rango de fecha
+    _idx("inasistencias", [("causa_bucket", 1), ("fecha", 1)], "bucket_fecha"),
+
+    # ---------- inasistencias auxiliares ----------
+    _idx("inasistencias_auxiliares", [("auxiliar_id", 1), ("fecha", 1)], "auxiliar_fecha_unico", unique=True),
+    _idx("inasistencias_auxiliares", [("fecha", 1), ("_id", 1)], "fecha_id"),
+    _idx("inasistencias_auxiliares", [("causa_bucket", 1), ("fecha", 1)], "bucket_fecha"),
+
+    # ---------- contadores de topes (topes.py) ----------
+    # 1 doc por (tipo, persona_id, anio): la unicidad evita sembrar dos veces
+    _idx("contadores_inasistencias", [("tipo", 1), ("persona_id", 1), ("anio", 1)], "tipo_persona_anio",
+         unique=True),
+
+    # ---------- movimientos ----------
+    # resumen_movimientos / exportar: rango de fecha ordenado desc
+    _idx("movimientos_alumnos", [("fecha", -1)], "fecha_desc"),
+    # _insert_movimiento_si_no_duplicado: alumno_id + tipo + fecha reciente
+    _idx("movimientos_alumnos", [("alumno_id", 1), ("tipo", 1), ("fecha", -1)], "alumno_tipo_fecha"),
+
+    # ---------- calificaciones ----------
+    # upsert de api_calificaciones_upsert / api_calificaciones_lote: 1 nota por clave
+    # (si el cluster tiene el índice viejo no único: `flask unificar-calificaciones`)
+    _idx("calificaciones",
+         [("alumno_id", 1), ("docente_id", 1), ("asignatura", 1), ("trimestre", 1), ("anio", 1)],
+         "clave_calificacion", unique=True),
+    # notas de un alumno por año/trimestre
+    _idx("calificaciones", [("alumno_id", 1), ("anio", 1), ("trimestre", 1)], "alumno_anio_trimestre"),
+    # api_calificaciones_list con curso: anio + curso_key (guardado en la nota) + asignatura/trimestre
+    # (si faltan claves en notas viejas: `flask migrar-curso-calificaciones`)
+    _idx("calificaciones", [("anio", 1), ("curso_key", 1), ("asignatura", 1), ("trimestre", 1)],
+         "anio_curso_asignatura_trimestre"),
+    # api_calificaciones_list sin curso / resumen_calificaciones: anio (+ asignatura/trimestre)
+    _idx("calificaciones", [("anio", 1), ("asignatura", 1), ("trimestre", 1)], "anio_asignatura_trimestre"),
+
+    # ---------- planes de promoción (promocion.py) ----------
+    # vista previa de la matrícula inicial: 1 plan sin aplicar por (anio, hash)
+    _idx("planes_promocion", [("anio", 1), ("hash", 1), ("aplicado", 1)], "anio_hash_aplicado", unique=True),
+
+    # ---------- mercadería ----------
+    # entrega_mercaderia_toggle: upsert por (alumno_id, periodo)
+    _idx("entrega_mercaderia", [("alumno_id", 1), ("periodo", 1)], "alumno_periodo", unique=True),
+    # entrega_mercaderia_view: periodo $in
+    _idx("entrega_mercaderia", [("periodo", 1)], "periodo"),
+
+    # ---------- alumnos ----------
+    # listados por año lectivo + curso
+    _idx("alumnos", [("anio_lectivo", 1), ("curso", 1)], "anio_curso"),
+    _idx("alumnos", [("curso", 1), ("apellido", 1), ("nombre", 1)], "curso_apellido_nombre"),
+    # filtros por curso (clave canónica, ver cursos.py) ordenados por apellido/nombre
+    _idx("alumnos", [("curso_key", 1), ("apellido", 1), ("nombre", 1)], "curso_key_apellido_nombre"),
+
+    # ---------- estados administrativos ----------
+    _idx("estados_admin", [("docente_id", 1), ("tipo", 1)], "docente_tipo"),
+    # listado ordenado por vencimiento y ventanas de 5/10 días del resumen
+    _idx("estados_admin", [("fecha_limite", 1), ("fecha_notificacion", 1)], "fecha_limite"),
+
+    # ---------- matrícula del parte diario (matricula.py) ----------
+    _idx("matricula_mensual", [("anio", 1), ("mes", 1)], "anio_mes_unico", unique=True),
+
+    # ---------- calendario escolar ----------
+    # upsert por fecha y rango anual
+    _idx("calendario_escolar", [("fecha", 1)], "fecha", unique=True),
+
+    # ---------- salidas (blueprint) ----------
+    _idx("salidas", [("fecha_salida", 1)], "fecha_salida"),
+]
+
+# Opciones que comparamos contra el cluster (el resto, como "v" o "ns", se ignora)
+_OPCIONES_RELEVANTES = ("unique", "sparse", "partialFilterExpression", "expireAfterSeconds")
+
+
+def _firma(claves, opciones):
+    """Representación comparable de un índice: claves en orden + opciones relevantes."""
+    ops = tuple(sorted(
+        (k, repr(opciones.get(k))) for k in _OPCIONES_RELEVANTES if opciones.get(k) not in (None, False)
+    ))
+    return (tuple((k, int(d) if isinstance(d, (int, float)) else d) for k, d in claves), ops)
+
+
+def revisar_indices(db, registro=None):
+    """
+    Compara el registro con los índices vivos del cluster.
+
+    Devuelve {coleccion: {"faltantes": [...], "distintos": [...], "ok": [...], "sobrantes": [...]}}
+      - faltantes: declarados y no existen (ni con otro nombre)
+      - distintos: existe un índice con el mismo nombre pero otras claves/opciones
+      - ok:        existen tal cual (por nombre o por firma equivalente)
+      - sobrantes: existen en el cluster y no están declarados (excepto _id_)
+    """
+    registro = registro or INDICES
+    por_coleccion = {}
+    for ix in registro:
+        por_coleccion.setdefault(ix["coleccion"], []).append(ix)
+
+    reporte = {}
+    for coleccion, declarados in por_coleccion.items():
+        try:
+            vivos = db[coleccion].index_information()
+        except OperationFailure:
+            vivos = {}  # la colección todavía no existe
+
+        firmas_vivas = {
+            _firma(info.get("key", []), info): nombre
+            for nombre, info in vivos.items()
+        }
+
+        r = {"faltantes": [], "distintos": [], "ok": [], "sobrantes": []}
+        usados = {"_id_"}
+
+        for ix in declarados:
+            firma = _firma(ix["claves"], ix["opciones"])
+            info = vivos.get(ix["nombre"])
+            if info is not None:
+                usados.add(ix["nombre"])
+                if _firma(info.get("key", []), info) == firma:
+                    r["ok"].append(ix["nombre"])
+                else:
+                    r["distintos"].append(ix["nombre"])
+            elif firma in firmas_vivas:
+                usados.add(firmas_vivas[firma])
+                r["ok"].append(ix["nombre"])
+            else:
+                r["faltantes"].append(ix["nombre"])
+
+        r["sobrantes"] = sorted(n for n in vivos if n not in usados)
+        reporte[coleccion] = r
+
+    return reporte
+
+
+def sincronizar_indices(db, dry_run=False, registro=None):
+    """
+    Crea los índices faltantes del registro.
+
+    No borra ni reemplaza nada: los 'distintos' y 'sobrantes' sólo se informan,
+    porque tocarlos en Atlas requiere revisar a mano (p. ej. duplicados en un unique).
+    Con dry_run=True sólo devuelve el reporte, sin crear.
+    """
+    registro = registro or INDICES
+    reporte = revisar_indices(db, registro)
+
+    for coleccion, r in reporte.items():
+        r["creados"] = []
+        r["errores"] = []
+        if dry_run:
+            continue
+
+        for ix in registro:
+            if ix["coleccion"] != coleccion or ix["nombre"] not in r["faltantes"]:
+                continue
+            try:
+                db[coleccion].create_index(ix["claves"], name=ix["nombre"], **ix["opciones"])
+                r["creados"].append(ix["nombre"])
+            except OperationFailure as e:
+                # típico: unique con duplicados existentes
+                r["errores"].append({"indice": ix["nombre"], "error": str(e)})
+
+    return reporte
+
+
+def formatear_reporte(reporte, dry_run=False):
+    """Texto legible del reporte (para la consola)."""
+    lineas = []
+    for coleccion in sorted(reporte):
+        r = reporte[coleccion]
+        lineas.append(f"[{coleccion}]")
+        for n in r.get("ok", []):
+            lineas.append(f"  ok        {n}")
+        for n in r.get("faltantes", []):
+            estado = "faltante" if dry_run or n not in r.get("creados", []) else "creado"
+            lineas.append(f"  {estado:<9} {n}")
+        for n in r.get("distintos", []):
+            lineas.append(f"  DISTINTO  {n} (mismo nombre, otra definición)")
+        for n in r.get("sobrantes", []):
+            lineas.append(f"  sobrante  {n} (no declarado)")
+        for e in r.get("errores", []):
+            lineas.append(f"  ERROR     {e['indice']}: {e['error']}")
+    return "\n".join(lineas)
@@ -0,0 +1,225 @@
+# matricula.py
+# =========================================================
+#  Matrícula mensual del parte diario: snapshots por (anio, mes)
+# =========================================================
+#
+#  1 documento por mes en matricula_mensual:
+#    {anio: 2025, mes: 3,
+#     parte: {"1º A": {"VARONES": 10, "MUJERES": 12, "TOTAL": 22}, ..., "6º B": {...}}}
+#
+#  - Un mes se arma la primera vez que se pide (un recorrido de alumnos con proyección).
+#  - Cada alta/edición/baja de alumno ajusta con $inc los meses ya armados en los
+#    que cambió su aporte (curso/sección, sexo, o si sigue activo al cierre del mes).
+#  - El mes en curso es un documento más: se mantiene por $inc, sin recorrer alumnos.
+#  - El año completo (parte de fin de año) arma los meses que falten juntos:
+#    cada alumno aporta un intervalo de meses [ingreso, salida) a un arreglo de
+#    diferencias por celda, y una suma acumulada da los 12 meses (alumnos + meses).
+#
+#  Activo en el mes = ingresó antes o dentro del mes y no tiene fecha_salida
+#  antes o dentro del mes (A = mañana, B = tarde).
+
+import calendar
+from datetime import datetime
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+CURSOS = ("1º", "2º", "3º", "4º", "5º", "6º")
+SECCIONES = ("A", "B")
+
+# Campos del alumno que mueven el parte
+CAMPOS = ("fecha_ingreso", "fecha_salida", "curso", "sexo")
+PROYECCION = {c: 1 for c in CAMPOS}
+
+_INICIO_CLASES = datetime(1900, 1, 1)
+
+
+def _fecha(valor):
+    """datetime desde datetime o string ISO ('YYYY-MM-DD' / 'YYYY-MM-DDTHH:MM:SS')."""
+    if isinstance(valor, datetime):
+        return valor
+    if isinstance(valor, str) and valor.strip():
+        try:
+            return datetime.fromisoformat(valor.strip())
+        except ValueError:
+            pass
+    return None
+
+
+def fin_de_mes(anio, mes):
+    return datetime(anio, mes, calendar.monthrange(anio, mes)[1], 23, 59, 59)
+
+
+def parte_vacio():
+    return {
+        f"{c} {s}": {"VARONES": 0, "MUJERES": 0, "TOTAL": 0}
+        for c in CURSOS for s in SECCIONES
+    }
+
+
+def clave_alumno(alumno):
+    """("1º A", "VARONES"|"MUJERES") por curso/sexo, o None si no entra en el parte."""
+    curso_raw = (alumno.get("curso") or "").upper().replace("º", "°").replace(" ", "")
+    grado = next((g for g in "123456" if curso_raw.startswith(g)), None)
+    if grado is None:
+        return None
+
+    if "A" in curso_raw:
+        seccion = "A"
+    elif "B" in curso_raw:
+        seccion = "B"
+    else:
+        return None
+
+    sexo = (alumno.get("sexo") or "").strip().upper()
+    if sexo not in ("M", "F"):
+        return None
+
+    return f"{grado}º {seccion}", "VARONES" if sexo == "M" else "MUJERES"
+
+
+def aporte(alumno, anio, mes):
+    """Celda del parte en la que cuenta el alumno al cierre del mes, o None."""
+    if not alumno:
+        return None
+    ultimo_dia = fin_de_mes(anio, mes)
+
+    fecha_ingreso = _fecha(alumno.get("fecha_ingreso")) or _INICIO_CLASES
+    fecha_salida = _fecha(alumno.get("fecha_salida"))
+    if fecha_ingreso > ultimo_dia:
+        return None
+    if fecha_salida is not None and fecha_salida <= ultimo_dia:
+        return None
+
+    return clave_alumno(alumno)
+
+
+def contar(alumnos, anio, mes):
+    """Parte completo del mes desde un iterable de alumnos."""
+    parte = parte_vacio()
+    for a in alumnos:
+        celda = aporte(a, anio, mes)
+        if celda is None:
+            continue
+        curso, sexo = celda
+        parte[curso][sexo] += 1
+        parte[curso]["TOTAL"] += 1
+    return parte
+
+
+def _mes_en_anio(fecha, anio):
+    """Índice 1..12 del mes de 'fecha' dentro de 'anio' (0 si es anterior, 13 si es posterior)."""
+    if fecha.year < anio:
+        return 0
+    if fecha.year > anio:
+        return 13
+    return fecha.month
+
+
+def partes_del_anio(alumnos, anio):
+    """
+    {mes: parte} de los 12 meses con un solo recorrido de alumnos.
+
+    Activo al cierre del mes m <=> mes(ingreso) <= m < mes(salida), así que cada
+    alumno suma +1 en su primer mes activo y -1 en el mes de salida.
+    """
+    diferencias = {}  # (curso, sexo) -> [0] * 14 (posiciones 1..12; 13 = fuera del año)
+    for a in alumnos:
+        celda = clave_alumno(a)
+        if celda is None:
+            continue
+
+        fecha_ingreso = _fecha(a.get("fecha_ingreso")) or _INICIO_CLASES
+        fecha_salida = _fecha(a.get("fecha_salida"))
+        desde = max(_mes_en_anio(fecha_ingreso, anio), 1)
+        hasta = _mes_en_anio(fecha_salida, anio) if fecha_salida is not None else 13
+        if desde >= hasta:
+            continue
+
+        d = diferencias.setdefault(celda, [0] * 14)
+        d[desde] += 1
+        d[hasta] -= 1
+
+    partes = {mes: parte_vacio() for mes in range(1, 13)}
+    for (curso, sexo), d in diferencias.items():
+        activos = 0
+        for mes in range(1, 13):
+            activos += d[mes]
+            if activos:
+                partes[mes][curso][sexo] += activos
+                partes[mes][curso]["TOTAL"] += activos
+    return partes
+
+
+class SnapshotsMatricula:
+    def __init__(self, coleccion, col_alumnos):
+        self.coleccion = coleccion
+        self.col_alumnos = col_alumnos
+
+    def parte(self, anio, mes):
+        """{"1º A": {...}, ...} del mes; si no está armado lo arma y lo guarda."""
+        clave = {"anio": int(anio), "mes": int(mes)}
+        doc = self.coleccion.find_one(clave)
+        if doc:
+            return doc["parte"]
+
+        parte = contar(self.col_alumnos.find({}, PROYECCION), int(anio), int(mes))
+        try:
+            # $setOnInsert: si otro proceso lo armó en el medio, gana el primero
+            self.coleccion.update_one(clave, {"$setOnInsert": {"parte": parte}}, upsert=True)
+        except DuplicateKeyError:
+            pass
+        return parte
+
+    def partes_anio(self, anio):
+        """{mes: parte} de los 12 meses; los que no estén armados salen de UN recorrido de alumnos."""
+        anio = int(anio)
+        guardados = {d["mes"]: d["parte"] for d in self.coleccion.find({"anio": anio})}
+        if len(guardados) == 12:
+            return guardados
+
+        calculados = partes_del_anio(self.col_alumnos.find({}, PROYECCION), anio)
+        faltan = [mes for mes in range(1, 13) if mes not in guardados]
+        try:
+            self.coleccion.bulk_write([
+                UpdateOne({"anio": anio, "mes": mes}, {"$setOnInsert": {"parte": calculados[mes]}}, upsert=True)
+                for mes in faltan
+            ], ordered=False)
+        except BulkWriteError:
+            pass  # otro proceso armó alguno en el medio: queda el suyo
+        return {**calculados, **guardados}
+
+    def aplicar_cambio(self, antes, despues):
+        """
+        Alta (antes=None), edición o baja (despues=None) de un alumno:
+        $inc en cada mes armado donde su celda cambió.
+        """
+        ops = []
+        for m in self.coleccion.find({}, {"anio": 1, "mes": 1}):
+            viejo = aporte(antes, m["anio"], m["mes"])
+            nuevo = aporte(despues, m["anio"], m["mes"])
+            if viejo == nuevo:
+                continue
+
+            inc = {}
+            for celda, delta in ((viejo, -1), (nuevo, +1)):
+                if celda is None:
+                    continue
+                curso, sexo = celda
+                for campo in (f"parte.{curso}.{sexo}", f"parte.{curso}.TOTAL"):
+                    inc[campo] = inc.get(campo, 0) + delta
+            inc = {k: v for k, v in inc.items() if v}
+            if inc:
+                ops.append(UpdateOne({"_id": m["_id"]}, {"$inc": inc}))
+
+        if ops:
+            self.coleccion.bulk_write(ops, ordered=False)
+
+    def invalidar(self, anio=None, mes=None):
+        """Borra snapshots (todos, un año o un mes) para que se rearmen al pedirlos."""
+        q = {}
+        if anio is not None:
+            q["anio"] = int(anio)
+        if mes is not None:
+            q["mes"] = int(mes)
+        self.coleccion.delete_many(q)
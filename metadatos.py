@@ -0,0 +1,51 @@
+# metadatos.py
+# =========================================================
+#  Listas para selectores (cursos, años disponibles) cacheadas en memoria
+# =========================================================
+#
+#  Casi todas las páginas arman el combo de cursos con un distinct sobre
+#  alumnos, y algunas el selector de años recorriendo la colección entera.
+#  Acá se cachea cada consulta por (colección, campo, filtro):
+#    - distinct(coleccion, campo, filtro)  -> valores distintos (sin ordenar)
+#    - anios(coleccion, campo)             -> años de un campo fecha (datetime), ordenados
+#
+#  Cache de cache_ttl.py, invalidado por colección en las escrituras de la app
+#  (alumnos, movimientos, calificaciones).
+
+import json
+
+from cache_ttl import CACHE_TTL, CacheTTL
+
+
+def _clave_filtro(filtro):
+    # los filtros son dicts chicos (con ObjectId/fechas a lo sumo): JSON ordenado alcanza
+    return json.dumps(filtro or {}, sort_keys=True, default=str)
+
+
+class Metadatos:
+    def __init__(self, db, ttl=CACHE_TTL):
+        self.db = db
+        self._cache = CacheTTL(ttl)  # (coleccion, tipo, campo, filtro) -> valores
+
+    def _cacheado(self, clave, calcular):
+        return list(self._cache.obtener(clave, calcular))
+
+    def distinct(self, coleccion, campo, filtro=None):
+        """Valores distintos de 'campo' (copia: se puede ordenar/filtrar sin tocar el cache)."""
+        clave = (coleccion, "distinct", campo, _clave_filtro(filtro))
+        return self._cacheado(clave, lambda: self.db[coleccion].distinct(campo, filtro or {}))
+
+    def anios(self, coleccion, campo="fecha"):
+        """Años presentes en un campo datetime, de mayor a menor."""
+        def calcular():
+            pipeline = [
+                {"$match": {campo: {"$type": "date"}}},
+                {"$group": {"_id": {"$year": f"${campo}"}}},
+            ]
+            return sorted((d["_id"] for d in self.db[coleccion].aggregate(pipeline)), reverse=True)
+
+        return self._cacheado((coleccion, "anios", campo, ""), calcular)
+
+    def invalidar(self, coleccion=None):
+        """Descarta lo cacheado de la colección (o todo)."""
+        self._cache.invalidar(None if coleccion is None else (lambda k: k[0] == coleccion))
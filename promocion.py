@@ -0,0 +1,190 @@
+# promocion.py
+# =========================================================
+#  Matrícula inicial: pase de año lectivo (PROM sube de grado, REC queda)
+# =========================================================
+#
+#  La vista previa calcula el plan UNA vez y lo guarda en planes_promocion:
+#    {anio, hash, items: [{id, apellido, nombre, dni, estado, curso_actual,
+#                          curso_nuevo, cambia}], stats, creado, aplicado}
+#  El hash sale del plan completo (items + stats): la misma vista previa
+#  repetida reusa el mismo documento mientras no se aplique.
+#
+#  Aplicar recibe el id del plan y escribe exactamente ese plan (ver
+#  operaciones()): 1 bulk_write en alumnos + 1 en movimientos. Cada alumno del
+#  plan (también los REC, con un update que no cambia nada) lleva en el filtro el
+#  curso de origen, el estado PROM/REC y que no tenga el pase aplicado; si alguno
+#  cambió desde la vista previa no coincide, y app.py aborta la transacción: hay
+#  que volver a generar el plan. Los alumnos con el pase ya aplicado no entran
+#  en planes nuevos (stats["ya_aplicados"]).
+#
+#  Campos por año de la matrícula (anio):
+#    prom_rec_{anio}_{anio+1}      estado PROM / REC cargado en /estudiantes/prom_rec
+#    matricula_actualizada_{anio}  marca del pase aplicado
+
+import hashlib
+import json
+from datetime import datetime
+
+from bson import ObjectId
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from cursos import curso_key
+
+GRADO_MAX = 6  # 6° egresa: el pase no lo toca
+
+
+class PlanDesactualizado(Exception):
+    """El plan ya no coincide con los alumnos (o ya se aplicó): se aborta sin escribir."""
+
+
+def campo_estado(anio):
+    return f"prom_rec_{int(anio)}_{int(anio) + 1}"
+
+
+def campo_aplicada(anio):
+    return f"matricula_actualizada_{int(anio)}"
+
+
+def proyeccion(anio):
+    """Campos de alumno que usa el plan."""
+    return {"curso": 1, "apellido": 1, "nombre": 1, "dni": 1, campo_estado(anio): 1, campo_aplicada(anio): 1}
+
+
+def planificar(alumnos, anio, parse_curso, build_curso):
+    """
+    (items, stats) del pase de año desde los alumnos activos.
+    parse_curso / build_curso: los de app.py ('1°A' <-> (1, 'A')).
+    """
+    campo = campo_estado(anio)
+    aplicada = campo_aplicada(anio)
+    items = []
+    stats = {"total": 0, "ya_aplicados": 0, "sin_estado": 0, "no_parseados": 0, "sexto": 0}
+
+    for a in alumnos:
+        stats["total"] += 1
+        if a.get(aplicada):
+            # ya pasó de año en esta matrícula: no se vuelve a promover
+            stats["ya_aplicados"] += 1
+            continue
+
+        curso_actual = (a.get("curso") or "").strip()
+        grado, sec = parse_curso(curso_actual)
+
+        if grado is None:
+            stats["no_parseados"] += 1
+            continue
+        if grado == GRADO_MAX:
+            stats["sexto"] += 1
+            continue
+
+        estado = (a.get(campo) or "").strip().upper()
+        if estado not in ("PROM", "REC"):
+            stats["sin_estado"] += 1
+            continue
+
+        curso_nuevo = curso_actual if estado == "REC" else build_curso(grado + 1, sec)
+        items.append({
+            "id": str(a["_id"]),
+            "apellido": a.get("apellido", ""),
+            "nombre": a.get("nombre", ""),
+            "dni": a.get("dni", ""),
+            "curso_actual": curso_actual,
+            "curso_nuevo": curso_nuevo,
+            "estado": estado,
+            "cambia": curso_nuevo != curso_actual,
+        })
+
+    # por curso actual, apellido, nombre
+    def orden(x):
+        g, s = parse_curso(x["curso_actual"])
+        return (g or 99, s or "Z", x["apellido"], x["nombre"])
+
+    items.sort(key=orden)
+    stats["candidatos"] = len(items)
+    stats["cambios_reales"] = sum(1 for x in items if x["cambia"])
+    return items, stats
+
+
+def hash_plan(anio, items, stats):
+    crudo = json.dumps([int(anio), items, stats], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(crudo.encode("utf-8")).hexdigest()
+
+
+def operaciones(plan, ahora=None):
+    """
+    (ops de alumnos, ops de movimientos) que aplican el plan.
+    Hay 1 op de alumnos por item (los REC no modifican nada, pero cuentan en
+    matched_count): si matched_count no llega a len(ops), el plan está desactualizado.
+    """
+    ahora = ahora or datetime.utcnow()
+    anio = plan["anio"]
+    ops_alumnos, ops_movimientos = [], []
+
+    for x in plan["items"]:
+        oid = ObjectId(x["id"])
+        filtro = {
+            "_id": oid,
+            "curso": x["curso_actual"],
+            "activo": {"$ne": False},
+            # mismo criterio que planificar() (strip + mayúsculas)
+            campo_estado(anio): {"$regex": f"^\\s*{x['estado']}\\s*$", "$options": "i"},
+            campo_aplicada(anio): {"$ne": True},
+        }
+        if not x["cambia"]:
+            ops_alumnos.append(UpdateOne(filtro, {"$set": {"curso": x["curso_actual"]}}))
+            continue
+        ops_alumnos.append(UpdateOne(
+            filtro,
+            {"$set": {
+                "curso": x["curso_nuevo"],
+                "curso_key": curso_key(x["curso_nuevo"]),
+                campo_aplicada(anio): True,
+                "matricula_origen": x["curso_actual"],
+                "updated_at": ahora,
+            }},
+        ))
+        ops_movimientos.append(InsertOne({
+            "alumno_id": oid,
+            "tipo": "PROMOCION",
+            "curso_origen": x["curso_actual"],
+            "curso_destino": x["curso_nuevo"],
+            "apellido": (x.get("apellido") or "").strip(),
+            "nombre": (x.get("nombre") or "").strip(),
+            "dni": (x.get("dni") or "").strip(),
+            "plan_id": plan["_id"],
+            "fecha": ahora,
+        }))
+    return ops_alumnos, ops_movimientos
+
+
+class PlanesPromocion:
+    def __init__(self, coleccion):
+        self.coleccion = coleccion
+
+    def guardar(self, anio, items, stats):
+        """Guarda el plan (o reusa el que tenga el mismo hash sin aplicar) y lo devuelve."""
+        anio = int(anio)
+        h = hash_plan(anio, items, stats)
+        clave = {"anio": anio, "hash": h, "aplicado": None}
+        doc = {"items": items, "stats": stats, "creado": datetime.utcnow()}
+        try:
+            self.coleccion.update_one(clave, {"$setOnInsert": doc}, upsert=True)
+        except DuplicateKeyError:
+            pass  # otro request guardó el mismo plan en el medio
+        return self.coleccion.find_one(clave)
+
+    def obtener(self, plan_id):
+        try:
+            return self.coleccion.find_one({"_id": ObjectId(plan_id)})
+        except Exception:
+            return None
+
+    def marcar_aplicado(self, plan_id, actualizados, session=None):
+        """True si lo marcó (False: ya estaba aplicado)."""
+        res = self.coleccion.update_one(
+            {"_id": plan_id, "aplicado": None},
+            {"$set": {"aplicado": datetime.utcnow(), "actualizados": actualizados}},
+            session=session,
+        )
+        return res.modified_count == 1
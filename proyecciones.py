@@ -0,0 +1,76 @@
+# proyecciones.py
+# =========================================================
+#  Campos de alumno que trae cada vista de listado
+#  (clave = template que los muestra)
+# =========================================================
+#
+#  Los documentos de alumnos cargan autorizados, legajo, datos judiciales y
+#  observaciones largas; las listas muestran unas pocas columnas. Cada vista pide
+#  sólo los campos que usa su template (y los que usa la vista para ordenar /
+#  armar columnas calculadas): en Atlas lo que más pesa es lo que viaja.
+#
+#  Con PROYECCION_DEBUG=1 los documentos se envuelven en DocProyectado, que avisa
+#  por consola (una vez por template y campo) cuando el template pide un campo
+#  que no está en su proyección: señal de que hay que agregarlo acá.
+#  El _id siempre viene.
+
+import os
+
+PROYECCION_DEBUG = os.getenv("PROYECCION_DEBUG", "0") == "1"
+
+PROYECCIONES = {
+    # /alumnos: tabla completa + modal de edición (+ fechas para edad y flags de histórico)
+    "alumnos.html": (
+        "curso", "apellido", "nombre", "dni", "cuil", "sexo", "recursante",
+        "fecha_nacimiento", "fecha_nac", "lugar_nacimiento", "nacionalidad",
+        "responsable", "ocupacion", "domicilio", "localidad", "telefono",
+        "escuela_procedencia", "observaciones",
+        "fecha_salida", "sale_a", "motivo_salida", "destino_salida",
+        "curso_destino", "curso_origen",
+    ),
+    "entrega_mercaderia.html": ("curso", "apellido", "nombre", "dni"),
+    "listas.html": ("curso", "apellido", "nombre", "dni"),
+    # + el campo PROM/REC del año (promocion.campo_estado), que agrega la vista
+    "prom_rec.html": ("curso", "apellido", "nombre", "dni"),
+    "legajos_curso.html": ("apellido", "nombre", "legajo"),
+    "autorizados_curso.html": ("apellido", "nombre", "autorizados"),
+}
+
+_avisados = set()
+
+
+def proyeccion(template):
+    """Proyección de Mongo para la vista del template."""
+    return {campo: 1 for campo in PROYECCIONES[template]}
+
+
+class DocProyectado(dict):
+    """dict que avisa cuando se lee un campo que quedó afuera de la proyección."""
+
+    def __init__(self, datos, template):
+        super().__init__(datos)
+        self._template = template
+        self._permitidos = set(PROYECCIONES[template]) | {"_id"}
+
+    def _revisar(self, campo):
+        if campo in self or campo in self._permitidos:
+            return
+        if (self._template, campo) not in _avisados:
+            _avisados.add((self._template, campo))
+            print(f"[PROYECCION] {self._template} lee '{campo}', que no está en su proyección")
+
+    def __getitem__(self, campo):
+        self._revisar(campo)
+        return super().__getitem__(campo)
+
+    def get(self, campo, default=None):
+        self._revisar(campo)
+        return super().get(campo, default)
+
+
+def documentos(template, docs):
+    """Lista de documentos para el template (envueltos sólo en modo debug)."""
+    docs = list(docs)
+    if not PROYECCION_DEBUG:
+        return docs
+    return [DocProyectado(d, template) for d in docs]
@@ -0,0 +1,159 @@
+# topes.py
+# =========================================================
+#  Contadores anuales de inasistencias por persona (docente/auxiliar)
+#  para controlar los topes sin releer todo el año en cada carga.
+# =========================================================
+#
+#  1 documento por (tipo, persona_id, anio):
+#    {tipo: "docente", persona_id: "<id>", anio: 2025,
+#     buckets: {"particulares": 2, "enfermedad_personal": 7, ...},
+#     particulares_mes: {"03": 1, "05": 1}}
+#
+#  - Se siembra la primera vez que se necesita, contando la colección cruda.
+#  - Altas, ediciones y bajas lo ajustan con $inc.
+#  - Los topes estrictos (particulares) se reservan con un update condicional:
+#    si dos cargas llegan a la vez, sólo una pasa el filtro.
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+
+class ContadoresAnuales:
+    def __init__(self, coleccion, col_inasistencias, campo_persona, tipo, clasificar, parse_fecha):
+        """
+        coleccion:          colección de contadores (compartida entre tipos)
+        col_inasistencias:  colección cruda (inasistencias / inasistencias_auxiliares)
+        campo_persona:      'docente_id' / 'auxiliar_id'
+        clasificar:         causa (texto) -> bucket
+        parse_fecha:        valor guardado -> date (o None)
+        """
+        self.coleccion = coleccion
+        self.col_inasistencias = col_inasistencias
+        self.campo_persona = campo_persona
+        self.tipo = tipo
+        self.clasificar = clasificar
+        self.parse_fecha = parse_fecha
+
+    def _clave(self, persona_id, anio):
+        return {"tipo": self.tipo, "persona_id": str(persona_id), "anio": int(anio)}
+
+    def _ids_guardados(self, persona_id):
+        # en la colección cruda el id puede estar como ObjectId o como string
+        return list({persona_id, str(persona_id)})
+
+    # ----------------- siembra / lectura -----------------
+
+    def contar_crudo(self, persona_id, anio):
+        """Recuenta desde la colección cruda: (buckets, particulares_mes)."""
+        buckets, particulares_mes = {}, {}
+        q = {
+            self.campo_persona: {"$in": self._ids_guardados(persona_id)},
+            "fecha": {"$gte": f"{int(anio)}-01-01", "$lte": f"{int(anio)}-12-31"},
+        }
+        for ins in self.col_inasistencias.find(q, {"fecha": 1, "causa": 1}):
+            f = self.parse_fecha(ins.get("fecha"))
+            if not f:
+                continue
+            b = self.clasificar(ins.get("causa") or "")
+            buckets[b] = buckets.get(b, 0) + 1
+            if b == "particulares":
+                mm = f"{f.month:02d}"
+                particulares_mes[mm] = particulares_mes.get(mm, 0) + 1
+        return buckets, particulares_mes
+
+    def asegurar(self, persona_id, anio):
+        """Devuelve el documento de contadores; si no existe lo siembra desde la colección cruda."""
+        clave = self._clave(persona_id, anio)
+        doc = self.coleccion.find_one(clave)
+        if doc:
+            return doc
+
+        buckets, particulares_mes = self.contar_crudo(persona_id, anio)
+        try:
+            # $setOnInsert: si otro proceso lo sembró en el medio, gana el primero
+            self.coleccion.update_one(
+                clave,
+                {"$setOnInsert": {"buckets": buckets, "particulares_mes": particulares_mes}},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            pass
+        return self.coleccion.find_one(clave)
+
+    def leer(self, persona_id, anio):
+        """(buckets, meses_particulares {'YYYY-MM': n}) del año."""
+        doc = self.asegurar(persona_id, anio)
+        meses = {f"{int(anio)}-{mm}": n for mm, n in (doc.get("particulares_mes") or {}).items()}
+        return dict(doc.get("buckets") or {}), meses
+
+    # ----------------- altas -----------------
+
+    def reservar(self, persona_id, fecha, bucket, n=1, tope=None, uno_por_mes=False):
+        """
+        Suma n al bucket del año de 'fecha' ANTES de insertar.
+        Con tope/uno_por_mes el incremento es condicional (atómico en el documento).
+
+        Devuelve {"ok": bool, "error": None | "tope_anual" | "mes_ocupado", "antes": usados_previos}
+        """
+        self.asegurar(persona_id, fecha.year)
+        mm = f"{fecha.month:02d}"
+
+        filtro = self._clave(persona_id, fecha.year)
+        inc = {f"buckets.{bucket}": n}
+        if bucket == "particulares":
+            inc[f"particulares_mes.{mm}"] = n
+        if tope is not None:
+            filtro[f"buckets.{bucket}"] = {"$not": {"$gt": tope - n}}
+        if uno_por_mes:
+            filtro[f"particulares_mes.{mm}"] = {"$not": {"$gte": 1}}
+
+        antes = self.coleccion.find_one_and_update(
+            filtro, {"$inc": inc}, return_document=ReturnDocument.BEFORE
+        )
+        if antes is not None:
+            return {"ok": True, "error": None, "antes": (antes.get("buckets") or {}).get(bucket, 0)}
+
+        # No pasó el filtro: averiguamos qué regla frenó
+        doc = self.coleccion.find_one(self._clave(persona_id, fecha.year)) or {}
+        usados = (doc.get("buckets") or {}).get(bucket, 0)
+        if uno_por_mes and (doc.get("particulares_mes") or {}).get(mm, 0) >= 1:
+            return {"ok": False, "error": "mes_ocupado", "antes": usados}
+        return {"ok": False, "error": "tope_anual", "antes": usados}
+
+    # ----------------- ajustes -----------------
+
+    def ajustar(self, persona_id, fecha, bucket, delta):
+        """$inc sobre un contador ya sembrado (si no existe, la siembra futura lo contará)."""
+        if not fecha or not delta:
+            return
+        inc = {f"buckets.{bucket}": delta}
+        if bucket == "particulares":
+            inc[f"particulares_mes.{fecha.month:02d}"] = delta
+        self.coleccion.update_one(self._clave(persona_id, fecha.year), {"$inc": inc})
+
+    def _datos(self, ins):
+        ins = ins or {}
+        return (
+            ins.get(self.campo_persona),
+            self.parse_fecha(ins.get("fecha")),
+            self.clasificar(ins.get("causa") or ""),
+        )
+
+    def descontar(self, ins):
+        """Baja de una inasistencia cruda (el documento borrado)."""
+        persona_id, fecha, bucket = self._datos(ins)
+        if persona_id is not None:
+            self.ajustar(persona_id, fecha, bucket, -1)
+
+    def mover(self, antes, despues):
+        """Edición: resta lo viejo y suma lo nuevo si cambió persona, año/mes o bucket."""
+        viejo, nuevo = self._datos(antes), self._datos(despues)
+        if (str(viejo[0]), viejo[1], viejo[2]) == (str(nuevo[0]), nuevo[1], nuevo[2]):
+            return
+        if viejo[0] is not None:
+            self.ajustar(viejo[0], viejo[1], viejo[2], -1)
+        if nuevo[0] is not None:
+            self.ajustar(nuevo[0], nuevo[1], nuevo[2], +1)
+
+    def borrar_persona(self, persona_id):
+        self.coleccion.delete_many({"tipo": self.tipo, "persona_id": str(persona_id)})